@@ -1,326 +1,638 @@
-import mediapipe as mp 
-import cv2 
+import time
+# Moment in which the script started, used to profile the startup
+startup_time = time.perf_counter()
+import json
+import threading
+from contextlib import nullcontext
 import numpy as np 
-import pandas as pd
-import joblib
-from helpers import get_handedness, pre_process_hand_landmarks, get_args
+from helpers import get_handedness, get_hand_landmarks_array, pre_process_landmarks_batch, get_args
+from kinematics import bounding_box, pinch, finger_flexion, flexion_commands
+from timing import create_timer, StartupProfiler, AllocationProfiler
+from labels import load_gesture_registry, ARTICULATION_DICT
+from smoothing import create_smoothers
 
 args = get_args()
 arduino_mode = args.arduino_mode
+# The headless mode is the same as not displaying anything
+display_mode = 'off' if args.headless else args.display
+
+# With --profile-startup the duration of each step until the first frame is 
+# processed is printed
+startup = StartupProfiler(startup_time, enabled=args.profile_startup)
+startup.mark('get_args')
+
+# The heavy modules are only imported after the arguments are parsed, and 
+# each one only when the options given need it
+import cv2 
+from pipeline import LatestQueue, CaptureThread, StageThread
+from sources import open_capture, LandmarkDumpWriter
+from classifier import load_classifier, CachedClassifier
+from roi import AdaptiveFrontEnd
+from scheduler import DetectionScheduler
+from overlay import OverlayRenderer
+from frame_buffers import FrameBuffers
+from hands_controller import create_hands
+startup.mark('import cv2')
+
+# Dictionary containing the pins for each articulation, shared with the 
+# serve-cameras.py. To change the pins, edit it in the labels.py
+articulation_dict = ARTICULATION_DICT
 
 # Arduino mode passed when executing the script is used to run the code with an Arduino connected. 
 # This variable is used to be able to run the script without an Arduino connected, passing a variable 
-# different than 1. 
-if arduino_mode==1:
-    import pyfirmata 
-    from pyfirmata import SERVO
-
-    # Variable used to control the time in which the servo motor will be triggered
-    ref = None
-    # Initializing variable that will contain the gesture recognized
-    gesture = None
-    # Initializing variable that will contain the module in which the servo will be moved
-    module = None
-
-    # Dictionary containing the pins for each articulation
-    articulation_dict = {
-    'Mindinho' : {
-        'pin': 2,
-        'fator': 1.3
-    },
-    'Anelar' : {
-        'pin': 3,
-        'fator': 1
-    },
-    'Medio' : {
-        'pin': 4,
-        'fator': 1.4
-    },
-    'Indicador' : {
-        'pin': 5,
-        'fator': 1.1
-    },
-    'Polegar' : {
-        'pin': 6,
-        'fator': 1
-    },
-    'Pulso' : {
-        'pin': 7,
-        'fator': 1
-    },
-    }
+# different than 1. With 2 the servo output runs with a fake board that only counts the writes.
+servo_writer = None
+if arduino_mode in (1, 2) and not args.actuators:
+    from servo import open_board, ServoWriter
 
-    # Specifying what port the Arduino is connected
-    port = 'COM3' 
-    board = pyfirmata.Arduino(port) 
+    # Connecting to the Arduino in the port given and setting its pins
+    board = open_board(
+        port = args.port if arduino_mode==1 else None, 
+        pins = [info['pin'] for info in articulation_dict.values()]
+    )
 
-    # Setting Arduino's pins
-    for info in articulation_dict.values(): 
-        board.digital[info['pin']].mode = SERVO
+    # Thread that writes the servo angles, so the serial writes don't block the frame loop
+    servo_writer = ServoWriter(board, deadband=args.servo_deadband, max_rate=args.servo_rate)
+    servo_writer.start()
+    startup.mark('arduino setup')
 
-# Object that let us draw landmarks in our image 
-mp_drawing = mp.solutions.drawing_utils
+# With --actuators the servo commands are published to an event bus, which 
+# delivers them to each actuator given (Arduinos, remote controllers, files) 
+# from its own thread, dropping the stale ones
+event_bus = None
+if args.actuators:
+    from event_bus import EventBus, ServoEvent, create_backend
 
-# Object with all hand tracking methods of mediapipe
-mp_hands = mp.solutions.hands
-
-# Loading gesture recognition model 
-gesture_classifier = joblib.load('model/clf.pkl')
+    event_bus = EventBus(
+        [
+            create_backend(spec, [info['pin'] for info in articulation_dict.values()], args.servo_deadband, args.servo_rate) 
+            for spec in args.actuators
+        ],
+        max_age = args.event_max_age/1000
+    )
+    event_bus.start()
+    # The articulation of each pin, sent with the events
+    articulation_by_pin = {info['pin']: articulation for articulation, info in articulation_dict.items()}
+    startup.mark('event bus setup')
 
 # The cv2.VideoCapture needs an number representing which device will be used 
-# if the program does not work for you, try specifying a device other than 0 
-device = args.device
-# Object that reads from the webcam
-cap = cv2.VideoCapture(device)
+# if the program does not work for you, try specifying a device other than 0.
+# With --input the frames are read from a video file, a directory of images or 
+# a landmark dump instead, the last one giving the hand tracking results directly
+cap, landmark_input = open_capture(args)
+startup.mark('open capture')
 
 # Get the width and height so we can draw on the image using opencv
 video_width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
 video_height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
 
-# Hand gesture label map 
-gesture_label = pd.read_csv('data/gesture-label.csv', encoding = 'latin1')
+# With --process_width or --roi the hand tracking gets a downsized frame or 
+# only the region around the hands, and its landmarks are mapped back to the 
+# whole frame
+front_end = None
+if not landmark_input and (args.process_width > 0 or args.roi==1):
+    front_end = AdaptiveFrontEnd(args.process_width, args.roi==1, args.roi_padding, args.roi_refresh)
 
-with mp_hands.Hands(
-    static_image_mode=False,
-    max_num_hands=2,
-    model_complexity=1,
-    min_detection_confidence=0.8,
-    min_tracking_confidence=0.5
-) as hands:
-    while cap.isOpened():
-        # cap.read() return two variables, the 'results' which is a boolean
-        # identifying if the image was read and the frame that is a cv2 image
-        # object of the frame captured
-        ret, frame = cap.read()
+# With --skip_mode the hand tracking doesn't run in every frame, and the 
+# landmarks are moved to the frames skipped by --skip_tracker
+scheduler = None
+if not landmark_input and args.skip_mode!='none':
+    scheduler = DetectionScheduler(
+        mode = args.skip_mode, 
+        interval = args.detect_interval, 
+        budget = args.frame_budget, 
+        max_interval = args.max_detect_interval, 
+        tracker = args.skip_tracker
+    )
+
+# Mediapipe is the slowest import and isn't needed when replaying a landmark 
+# dump without drawing the landmarks
+if not landmark_input or display_mode=='full':
+    import mediapipe as mp 
+
+    # Object that let us draw landmarks in our image 
+    mp_drawing = mp.solutions.drawing_utils
+
+    # Object with all hand tracking methods of mediapipe
+    mp_hands = mp.solutions.hands
+    startup.mark('import mediapipe')
+
+# Draws the hands over the frame and displays it at most --display_fps times 
+# per second. With --display off (or --headless) it isn't created
+renderer = None
+if display_mode!='off':
+    renderer = OverlayRenderer(
+        mode = display_mode, 
+        max_fps = args.display_fps, 
+        mp_drawing = mp_drawing if display_mode=='full' else None, 
+        hand_connections = mp_hands.HAND_CONNECTIONS if display_mode=='full' else None
+    )
+
+# Loading gesture recognition model. The .npz exported by export-model.py runs 
+# with numpy only, while the .pkl needs scikit-learn
+gesture_classifier = load_classifier(args.model)
+# With --cache_distance the gesture isn't predicted again while the left hand 
+# holds the same pose
+classifier_cache = None
+if args.cache_distance > 0:
+    classifier_cache = gesture_classifier = CachedClassifier(gesture_classifier, args.cache_distance, args.cache_max_age)
+startup.mark('load model')
+
+# Hand gesture label map, with the pin and factor of the articulation of each 
+# gesture. It fails here if the csv, the model classes and the articulation_dict 
+# don't match
+gesture_registry = load_gesture_registry('data/gesture-label.csv', articulation_dict, gesture_classifier.classes_)
+
+# Filters of the gesture predicted and of the pinch distance over the last 
+# frames. With the default arguments they give the values unchanged
+gesture_smoother, pinch_filter = create_smoothers(args)
+startup.mark('load labels')
+
+# Timer of each stage of the frame loop. When it's not enabled by the user 
+# it does nothing 
+timer = create_timer(args, ['read', 'convert', 'hands_process', 'preprocess', 'predict', 'draw', 'display', 'servo_write'])
+
+# With --reuse_buffers the frame converted for the hand tracking and the 
+# landmarks of the hands are written into buffers allocated once
+frame_buffers = FrameBuffers() if args.reuse_buffers==1 else None
+
+# With --trace_allocations the memory allocated in each frame is measured 
+# with tracemalloc and printed at the end
+allocation_profiler = AllocationProfiler() if args.trace_allocations==1 else None
 
-        # Before processing our image with mediapipe is necessary to convert it 
-        # from BGR to RGB, because mediapipe works with RGB and opencv with BGR
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+# File that receives the gesture, module and servo command of each frame
+output_file = open(args.output, 'w') if args.output is not None else None
+frame_index = 0
 
-        # Flip on horizontal so the lib detects correct handness
-        image = cv2.flip(image, 1)
+# Writer of the landmarks of each frame, so the session can be replayed later
+landmark_dump = None
+if args.dump_landmarks is not None:
+    landmark_dump = LandmarkDumpWriter(args.dump_landmarks, video_width, video_height)
+
+# Recorder of the landmarks, gesture and servo command of each frame, written 
+# by its own thread, so the session can be replayed and mined for training data
+session_recorder = None
+if args.record_session is not None:
+    from session import SessionRecorder
+    session_recorder = SessionRecorder(args.record_session, video_width, video_height)
+    session_recorder.start()
+
+def detect_hands(frame, record=None):
+    """
+    Params:
+        frame = the BGR frame captured by cap.read()
+        record = the timing record of the frame, from timer.start_frame()
+    Output:
+        results: the output of hands.process(image), where image is the frame 
+        converted to RGB and flipped on horizontal
+    """
+    if front_end is not None:
+        # The hand tracking gets the region of the hands, downsized
+        with timer.stage(record, 'convert'):
+            process_image = front_end.prepare(frame)
+        process_image.flags.writeable = False
+
+        with timer.stage(record, 'hands_process'):
+            results = front_end.remap(hands.process(process_image))
+        front_end.update(results)
+
+        if not startup.reported:
+            startup.mark('first hands.process')
+            startup.report()
+    else:
+        with timer.stage(record, 'convert'):
+            if frame_buffers is not None:
+                # The same conversion and flip, written into the buffers
+                image = frame_buffers.to_rgb_flipped(frame)
+            else:
+                # Before processing our image with mediapipe is necessary to convert it 
+                # from BGR to RGB, because mediapipe works with RGB and opencv with BGR
+                image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+                # Flip on horizontal so the lib detects correct handness
+                image = cv2.flip(image, 1)
 
         # Setting the writable flag to false before process with mediapipe leads 
         # to improvement in the performance 
         image.flags.writeable = False
 
         # Do the actual processing with the mediapipe lib 
-        results = hands.process(image)
+        with timer.stage(record, 'hands_process'):
+            results = hands.process(image)
 
-        # Setting back the flag of writable so we can draw in the image
-        image.flags.writeable = True
+        if not startup.reported:
+            startup.mark('first hands.process')
+            startup.report()
 
-        handedness_detected = [] 
-        
-        # Drawing landmarks to the image
-        ## If any hand was detected
-        if results.multi_hand_landmarks:           
-            # The enumerate is used to multi hand detection, the hand variable
-            # is basically all the landmarks from one hand
-            for hand_index, hand_landmarks in enumerate(results.multi_hand_landmarks):
-                                
-                # Get handedness label
-                handedness_label = get_handedness(
-                    hand_index = hand_index,
-                    results = results
-                )
+    return results
+
+def process_frame(frame, record=None):
+    """
+    Params:
+        frame = the BGR frame captured by cap.read()
+        record = the timing record of the frame, from timer.start_frame()
+    Output:
+        results: the output of hands.process(image) or, in the frames skipped 
+        by the scheduler, an object with the same attributes with the landmarks 
+        of the last detection moved to the frame
+    """
+    if not startup.reported:
+        startup.mark('first frame read')
+
+    if landmark_input:
+        # The frame read from a landmark dump already is the output of the hand 
+        # tracking
+        startup.report()
+        return frame
+
+    if scheduler is not None and not scheduler.should_detect():
+        # The hand tracking is skipped in this frame and the landmarks of the 
+        # last detection are moved to it
+        with timer.stage(record, 'hands_process'):
+            results = scheduler.propagate(frame)
+        if front_end is not None:
+            front_end.update(results)
+    else:
+        detection_start = time.perf_counter()
+        results = detect_hands(frame, record)
+        if scheduler is not None:
+            scheduler.detected(frame, results, (time.perf_counter() - detection_start)*1000)
+
+    if landmark_dump is not None:
+        landmark_dump.append(results)
+
+    return results
+
+def analyze_hands(results, record=None):
+    """
+    Params:
+        results = the output of hands.process(image)
+        record = the timing record of the frame, from timer.start_frame()
+    Output:
+        analysis: dictionary with the following keys
+            - handedness_detected -> list with the handedness of each hand detected
+            - hands -> list with one dictionary per hand containing what is needed 
+            to draw it: the left hand has its bounding box and the gesture predicted, 
+            the right hand has the thumb and index tip coordinates and the relative 
+            distance between them
+            - gesture -> the GestureRecord of the gesture predicted for the left 
+            hand, None if there's no left hand
+            - module -> the module in which the servo will be moved, given by the 
+            right hand, None if there's no right hand
+            - flexion -> in the multi articulation mode, the flexion of each 
+            finger of the right hand, None if there's no right hand
+            - results -> the results analysed
+    """
+    analysis = {
+        'handedness_detected': [],
+        'hands': [],
+        'gesture': None,
+        'module': None,
+        'flexion': None,
+        'results': results
+    }
+
+    # If any hand was detected
+    if results.multi_hand_landmarks:           
+        # The enumerate is used to multi hand detection, the hand variable
+        # is basically all the landmarks from one hand
+        for hand_index, hand_landmarks in enumerate(results.multi_hand_landmarks):
+                            
+            # Get handedness label
+            handedness_label = get_handedness(
+                hand_index = hand_index,
+                results = results
+            )
+            
+            analysis['handedness_detected'].append(handedness_label)
+            hand_info = {
+                'handedness': handedness_label,
+                'landmarks': hand_landmarks
+            }
+
+            # The landmarks of the hand are extracted once to an array, used 
+            # by both the gesture and the actuation
+            if frame_buffers is not None:
+                hand_landmarks_array = frame_buffers.get_hand_landmarks_array(hand_index, results)
+            else:
+                hand_landmarks_array = get_hand_landmarks_array(hand_index, results)
+            
+            # Get the bounding box and the gesture only to the left hand
+            if handedness_label=='Left': 
+                hand_info['bounding_box'] = bounding_box(hand_landmarks_array, video_width, video_height)
+                       
+                # Pre process the hand landmarks coordinates 
+                with timer.stage(record, 'preprocess'):
+                    processed_hand_landmarks = pre_process_landmarks_batch(hand_landmarks_array[np.newaxis], video_width, video_height)[0]
+
+                # Predicting the gesture label. The confidence vote also needs 
+                # the probability of the label predicted
+                with timer.stage(record, 'predict'):
+                    if args.gesture_vote=='confidence':
+                        probabilities = gesture_classifier.predict_proba(processed_hand_landmarks.reshape(1,-1))[0]
+                        class_index = int(np.argmax(probabilities))
+                        label_predicted = int(gesture_classifier.classes_[class_index])
+                        confidence = float(probabilities[class_index])
+                    else:
+                        label_predicted = int(gesture_classifier.predict(processed_hand_landmarks.reshape(1,-1))[0])
+                        confidence = 1
+
+                # Smoothing the label over the last frames
+                label_predicted = gesture_smoother.update(label_predicted, confidence)
+                gesture_predicted = gesture_registry[label_predicted]
                 
-                handedness_detected.append(handedness_label)
+                # Updating the gesture with the gesture_predicted
+                hand_info['gesture'] = gesture_predicted
+                analysis['gesture'] = gesture_predicted
+
+            elif handedness_label=='Right':                
+                # Get the coordinates of the THUMB_TIP and INDEX_FINGER_TIP and the 
+                # relative distance between them
+                pinch_points, relative_distance_thumb_index = pinch(hand_landmarks_array, video_width, video_height)
+                relative_distance_thumb_index = float(relative_distance_thumb_index)
+                # Removing the jitter of the landmarks from the distance. The 
+                # frames read from a file are timed by the frame rate, not the clock
+                relative_distance_thumb_index = pinch_filter.update(
+                    relative_distance_thumb_index, 
+                    None if args.input is not None else time.perf_counter()
+                )
+                hand_info['pinch_points'] = pinch_points
+                hand_info['relative_distance'] = relative_distance_thumb_index
                 
-                # Draw bounding box only to the left hand
-                if handedness_label=='Left': 
-                    x_max = 0
-                    y_max = 0
-                    x_min = video_width
-                    y_min = video_height
-                    for coordinates in hand_landmarks.landmark:
-                        x, y = int(coordinates.x * video_width), int(coordinates.y * video_height)
-                        if x > x_max:
-                            x_max = x
-                        if x < x_min:
-                            x_min = x
-                        if y > y_max:
-                            y_max = y
-                        if y < y_min:
-                            y_min = y
-                    cv2.rectangle(image, (x_min-10, y_min-10), (x_max+10, y_max+10), (50, 50, 50), 2)
-                    cv2.rectangle(image, (x_min-10, y_min-10), (x_max+10, y_min-50), (50, 50, 50), -1)
-                           
-                    # Pre process the hand landmarks coordinates 
-                    processed_hand_landmarks = pre_process_hand_landmarks(hand_index, results, video_width, video_height)
-
-                    # Predicting the gesture label
-                    label_predicted = int(gesture_classifier.predict(processed_hand_landmarks.reshape(1,-1))[0])
-                    text_label_predicted = gesture_label[gesture_label.Label==label_predicted].Gesture.to_list()[0]
-                    
-                    # Updating the gesture with the text_label_predicted
-                    gesture = text_label_predicted
-
-                    # Writing the predicted label to the frame 
-                    image = cv2.putText(
-                        img = image, 
-                        text = text_label_predicted,
-                        org = (x_min+5,y_min-20), #coordinates
-                        fontFace = cv2.FONT_HERSHEY_SIMPLEX,
-                        fontScale = 0.7, 
-                        color = (255, 255, 255), #RGB
-                        thickness = 2, 
-                        lineType = cv2.LINE_AA
-                    )
-
-                    # Utility used to draw the image based on the landmark values
-                    mp_drawing.draw_landmarks(
-                        image = image,
-                        landmark_list = hand_landmarks,
-                        connections = mp_hands.HAND_CONNECTIONS,
-                        landmark_drawing_spec = mp_drawing.DrawingSpec(
-                                                    color = (1, 190, 255),
-                                                    thickness = 2,
-                                                    circle_radius = 4
-                                                ),
-                        connection_drawing_spec = mp_drawing.DrawingSpec(
-                                                    color = (86, 213, 0),
-                                                    thickness = 2,
-                                                    circle_radius = 2
-                                                )
-                    )
-                elif handedness_label=='Right':                
-                    # Drawing a circle in the joints of the THUMB_TIP and INDEX_FINGER_TIP and
-                    # storing its coordinates 
-                    joints = ['THUMB_TIP', 'INDEX_FINGER_TIP']
-                    joints_coordinates = {}
-                    for joint in joints:
-                        coordinates = {}
-                        coordinates['x'] = int(results.multi_hand_landmarks[hand_index].landmark[mp_hands.HandLandmark[joint]].x*video_width)
-                        coordinates['y'] = int(results.multi_hand_landmarks[hand_index].landmark[mp_hands.HandLandmark[joint]].y*video_height)
-                        joints_coordinates[joint] = coordinates
-                        # Drawing circle
-                        image = cv2.circle(
-                            img = image, 
-                            center = (coordinates['x'],coordinates['y']), 
-                            radius = 4, 
-                            color = (148, 0, 211), 
-                            thickness = 2
-                        )
-                        # Drawing white border for the circle
-                        image = cv2.circle(
-                            img = image, 
-                            center = (coordinates['x'],coordinates['y']), 
-                            radius = 6, 
-                            color = (255, 255, 255), 
-                            thickness = 1
-                        )
-                    
-                    # Draw line between the thumb_tip and index_finger_tip
-                    image = cv2.line(
-                        img = image, 
-                        pt1 = (joints_coordinates['THUMB_TIP']['x'], joints_coordinates['THUMB_TIP']['y']), 
-                        pt2 = (joints_coordinates['INDEX_FINGER_TIP']['x'], joints_coordinates['INDEX_FINGER_TIP']['y']), 
-                        color = (255,4,163), 
-                        thickness = 2
-                    )
-                    
-                    # Drawing circle in the center of the line
-                    min_x = min(joints_coordinates['THUMB_TIP']['x'],joints_coordinates['INDEX_FINGER_TIP']['x'])
-                    min_y = min(joints_coordinates['THUMB_TIP']['y'],joints_coordinates['INDEX_FINGER_TIP']['y'])
-                    diff_x = int(abs(joints_coordinates['THUMB_TIP']['x'] - joints_coordinates['INDEX_FINGER_TIP']['x'])/2)
-                    diff_y = int(abs(joints_coordinates['THUMB_TIP']['y'] - joints_coordinates['INDEX_FINGER_TIP']['y'])/2)
-                    image = cv2.circle(
-                        img = image, 
-                        center = (min_x + diff_x, min_y + diff_y), 
-                        radius = 6, 
-                        color = (148, 0, 211), 
-                        thickness = 3
-                    ) 
-                    
-                    # Drawing white border for the circle in the center of the line
-                    image = cv2.circle(
-                            img = image, 
-                            center = (min_x + diff_x, min_y + diff_y), 
-                            radius = 8, 
-                            color = (255, 255, 255), 
-                            thickness = 1
-                        )
-                    
-                    # Draw the rectangle border that will contain the relative distance of the line 
-                    # between the thumb_tip and index_finger_tip 
-                    
-                    beginning_x_coordinate_rect = 85
-                    end_x_coordinate_rect = 485
-                    
-                    image = cv2.rectangle(
-                        img = image,
-                        pt1 = (beginning_x_coordinate_rect, 30),
-                        pt2 = (end_x_coordinate_rect, 70),
-                        color = (255,4,163),
-                        thickness = 2
-                    )
-                    
-                    # The relative distance will be the line between the thumb tip and index_finger_tip
-                    # divided by the line between the wrist and index_finger_dip
-                    wrist_coordinates = (results.multi_hand_landmarks[hand_index].landmark[mp_hands.HandLandmark['WRIST']].x * video_width, results.multi_hand_landmarks[hand_index].landmark[mp_hands.HandLandmark['WRIST']].y * video_height)
-                    distance_wrist_index = np.sqrt(((wrist_coordinates[0]-joints_coordinates['INDEX_FINGER_TIP']['x'])**2) + ((wrist_coordinates[1]-joints_coordinates['INDEX_FINGER_TIP']['y'])**2))
-                    distance_thumb_index = np.sqrt(((joints_coordinates['THUMB_TIP']['x']-joints_coordinates['INDEX_FINGER_TIP']['x'])**2) + ((joints_coordinates['THUMB_TIP']['y']-joints_coordinates['INDEX_FINGER_TIP']['y'])**2))
-                    relative_distance_thumb_index = distance_thumb_index/distance_wrist_index
-                    #Offset
-                    relative_distance_thumb_index = relative_distance_thumb_index - 0.08
-                      
-                    if relative_distance_thumb_index > 1:
-                        relative_distance_thumb_index = 1
-                    elif relative_distance_thumb_index < 0:
-                        relative_distance_thumb_index = 0
-                    
-                    linear_interpolation = int(beginning_x_coordinate_rect + ((end_x_coordinate_rect-beginning_x_coordinate_rect)*((relative_distance_thumb_index))))
-                    
-                    # Draw the rectangle that will fill the base rectangle according to the distance
-                    # between the thumb_tip index_finger_tip
-                    image = cv2.rectangle(
-                        img = image,
-                        pt1 = (beginning_x_coordinate_rect, 30),
-                        pt2 = (linear_interpolation, 70),
-                        color = (255,4,163),
-                        thickness = -1
-                    )
-                    
-                    # Writing relative distance
-                    image = cv2.putText(
-                        img = image, 
-                        text = str(int(relative_distance_thumb_index*100))+' %',
-                        org = (end_x_coordinate_rect+15,55), #coordinates
-                        fontFace = cv2.FONT_HERSHEY_SIMPLEX,
-                        fontScale = 0.8, 
-                        color = (255,4,163), #RGB
-                        thickness = 2, 
-                        lineType = cv2.LINE_AA
-                    )
-                    
-                    # The servo will contract the closest to 1 and expand the closest to 
-                    # 0, so we will get the complementary of 1 to the module
-                    module = 1 - relative_distance_thumb_index
-                    
-        # Converting it back to BGR so we can display using opencv
-        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-        
-        # Display the output frame of the webcam
-        cv2.imshow('Hand Tracking', image)                        
-        
-        if arduino_mode==1:
-            # Condition to not write old angles to the servo in case we don't 
-            # have hands in the screen
-            if 'Right' not in handedness_detected:
-                module = None
-            if 'Left' not in handedness_detected:
-                gesture = None
+                # The servo will contract the closest to 1 and expand the closest to 
+                # 0, so we will get the complementary of 1 to the module
+                analysis['module'] = 1 - relative_distance_thumb_index
+
+                # In the multi articulation mode each finger moves its own servo
+                if args.actuation=='multi':
+                    analysis['flexion'] = finger_flexion(hand_landmarks_array, video_width, video_height)
+
+            analysis['hands'].append(hand_info)
+
+    # The filters and the cache start over when their hand leaves the screen
+    if analysis['gesture'] is None:
+        gesture_smoother.reset()
+        if classifier_cache is not None:
+            classifier_cache.reset()
+    if analysis['module'] is None:
+        pinch_filter.reset()
+
+    return analysis
+
+def get_servo_command(analysis):
+    """
+    Params:
+        analysis = the output of analyze_hands
+    Output:
+        (pin, angle) of the servo of the articulation selected by the left hand 
+        gesture according to the module given by the right hand, or None if one 
+        of the hands isn't in the screen. In the multi articulation mode, a list 
+        with the (pin, angle) of the servo of each finger according to the 
+        flexion of the fingers of the right hand, or None if it isn't in the screen
+    """
+    if args.actuation=='multi':
+        if analysis['flexion'] is None:
+            return None
+        return flexion_commands(analysis['flexion'], articulation_dict)
+
+    # The gesture and module are None when the hand that gives them isn't 
+    # in the screen, so we don't write old angles to the servo
+    gesture = analysis['gesture']
+    module = analysis['module']
+
+    if (gesture != None and module != None):    
+        return gesture.pin, module*90*gesture.fator
+    return None
+
+def actuate(analysis):
+    """
+    Params:
+        analysis = the output of analyze_hands
+    Output:
+        servo_command: the output of get_servo_command
+    
+    Moves the servo of the articulation selected by the left hand gesture
+    according to the module given by the right hand. The servo is only 
+    written when running with arduino_mode 1 or 2, by the servo_writer thread, 
+    which skips the angles too close to the last one written, or when 
+    actuators are given, by publishing the command to the event_bus.
+    """
+    servo_command = get_servo_command(analysis)
+    if servo_command is None:
+        return None
+    
+    # Triggering the servo motor
+    for pin, angle in (servo_command if args.actuation=='multi' else [servo_command]):
+        if servo_writer is not None:
+            servo_writer.command(pin, angle)
+        if event_bus is not None:
+            event_bus.publish(ServoEvent(articulation_by_pin[pin], pin, angle, time.time(), frame_index))
+
+    return servo_command
+
+def write_output(analysis, servo_command):
+    """
+    Params:
+        analysis = the output of analyze_hands
+        servo_command = the output of actuate
+    
+    Writes a json line with the gesture, module and servo command of the 
+    frame to the output file
+    """
+    line = {
+        'frame': frame_index,
+        'handedness': analysis['handedness_detected'],
+        'gesture': None if analysis['gesture'] is None else analysis['gesture'].gesture,
+        'module': analysis['module'],
+        'pin': None if servo_command is None else servo_command[0],
+        'angle': None if servo_command is None else servo_command[1]
+    }
+    if args.actuation=='multi':
+        # One pin and angle per finger
+        line['flexion'] = None if analysis['flexion'] is None else analysis['flexion'].tolist()
+        line['pin'] = None if servo_command is None else [pin for pin, _ in servo_command]
+        line['angle'] = None if servo_command is None else [angle for _, angle in servo_command]
+    output_file.write(json.dumps(line)+'\n')
+
+def render_and_actuate(frame, analysis, record=None):
+    """
+    Params:
+        frame = the BGR frame captured, or None when reading a landmark dump
+        analysis = the output of analyze_hands
+        record = the timing record of the frame, from timer.start_frame()
+    Output:
+        key: the key pressed while the window was waiting, -1 if none
+    """
+    global frame_index
+
+    # The servo is written before drawing, so the display never delays it
+    with timer.stage(record, 'servo_write'):
+        servo_command = actuate(analysis)
+    timer.mark_actuated(record)
+
+    if output_file is not None:
+        write_output(analysis, servo_command)
+    if session_recorder is not None:
+        session_recorder.put(
+            analysis['results'], 
+            None if analysis['gesture'] is None else analysis['gesture'].label, 
+            analysis['module'], 
+            # The session has room for the command of a single servo
+            servo_command if args.actuation=='single' else None
+        )
+    frame_index += 1
+
+    # With --display off nothing is drawn or displayed, and the frames that 
+    # exceed --display_fps are analysed and actuated but not displayed
+    if renderer is None:
+        timer.finish_frame(record)
+        return -1
+
+    if renderer.due():
+        # Drawing landmarks to the image
+        with timer.stage(record, 'draw'):
+            image = renderer.prepare_buffer(frame, (int(video_height), int(video_width), 3))
+            image = renderer.draw(image, analysis)
+
+        with timer.stage(record, 'display'):
+            # Writing the FPS and the latency of each stage
+            image = timer.draw(image)
             
-            # Triggering the servo motor
-            if (gesture != None and module != None):    
-                board.digital[articulation_dict[gesture]['pin']].write(module*90*articulation_dict[gesture]['fator'])
+            # Display the output frame of the webcam
+            renderer.show(image)
+    timer.finish_frame(record)
+
+    return cv2.waitKey(1)
+
+def start_frame_record(frame):
+    # Starts the timing record of a frame right after it's captured by the 
+    # capture thread
+    record = timer.start_frame()
+    timer.mark_captured(record)
+    return frame, record
+
+def inference(item):
+    # Inference stage of the threaded pipeline, from the captured frame to the 
+    # analysis of the hands
+    frame, record = item
+    results = process_frame(frame, record)
+    return None if landmark_input else frame, analyze_hands(results, record), record
+
+def run_threaded():
+    """
+    Runs the frame loop with the threaded pipeline, returning when 'q' is 
+    pressed or the input ends.
+    """
+    # Each stage runs in its own thread and the stages are joined by queues 
+    # that drop the oldest frame when full, so a slow stage never makes the 
+    # servo act on an old frame. The render/actuation stage stays in the main 
+    # thread because the opencv window must be handled by it.
+    stop_event = threading.Event()
+    frame_queue = LatestQueue(args.queue_size)
+    analysis_queue = LatestQueue(args.queue_size)
+    capture_thread = CaptureThread(cap, frame_queue, stop_event, prepare=start_frame_record)
+    inference_thread = StageThread('inference', inference, frame_queue, analysis_queue, stop_event)
+    capture_thread.start()
+    inference_thread.start()
+
+    while True:
+        item = analysis_queue.get(timeout=0.1)
+        if item is None:
+            if analysis_queue.closed:
+                break
+            # Keep the window responsive while waiting for the next frame
+            key = -1 if renderer is None else cv2.waitKey(1)
+        else:
+            if allocation_profiler is not None:
+                allocation_profiler.frame()
+            key = render_and_actuate(*item)
         
         # - If 'q' is pressed the window is closed;
-        key = cv2.waitKey(10)
         if key==ord('q'):
             break
 
+    stop_event.set()
+    capture_thread.join()
+    inference_thread.join()
+    if inference_thread.error is not None:
+        raise inference_thread.error
+
+def run_serial():
+    """
+    Runs the frame loop in the main thread, returning when 'q' is pressed or 
+    the input ends.
+    """
+    while cap.isOpened():
+        # cap.read() return two variables, the 'results' which is a boolean
+        # identifying if the image was read and the frame that is a cv2 image
+        # object of the frame captured
+        if allocation_profiler is not None:
+            allocation_profiler.frame()
+        record = timer.start_frame()
+        with timer.stage(record, 'read'):
+            # The frame is only kept until the next one is read, so in the 
+            # serial pipeline it can be decoded into the same buffer
+            if frame_buffers is not None:
+                ret, frame = frame_buffers.read(cap)
+            else:
+                ret, frame = cap.read()
+        if not ret:
+            break
+        timer.mark_captured(record)
+
+        results = process_frame(frame, record)
+        analysis = analyze_hands(results, record)
+        key = render_and_actuate(None if landmark_input else frame, analysis, record)
+
+        # - If 'q' is pressed the window is closed;
+        if key==ord('q'):
+            break
+
+if landmark_input:
+    # The landmark dump already has the results of the hand tracking
+    hands = nullcontext()
+else:
+    # With --adaptive_complexity the model_complexity changes with the rate 
+    # of the frame loop
+    hands = create_hands(mp_hands, args)
+startup.mark('create hands')
+
+with hands:
+    try:
+        if args.pipeline=='threaded':
+            run_threaded()
+        else:
+            run_serial()
+    except KeyboardInterrupt:
+        # Without the window, e.g. in headless mode, the way to stop reading 
+        # from the webcam is Ctrl+C
+        pass
+
 cap.release()
+timer.close()
+if servo_writer is not None:
+    servo_writer.close()
+    board.exit()
+    print(servo_writer.summary())
+if event_bus is not None:
+    event_bus.close()
+    print(event_bus.summary())
+if classifier_cache is not None:
+    print(classifier_cache.summary())
+if allocation_profiler is not None:
+    print(allocation_profiler.summary())
+if args.adaptive_complexity==1 and not landmark_input:
+    print(hands.summary())
+if front_end is not None and front_end.roi:
+    print(front_end.summary())
+if scheduler is not None:
+    print(scheduler.summary())
+if output_file is not None:
+    output_file.close()
+if landmark_dump is not None:
+    landmark_dump.close()
+if session_recorder is not None:
+    session_recorder.close()
+    print(session_recorder.summary())
 # Destroy all the windows
-cv2.destroyAllWindows()
\ No newline at end of file
+cv2.destroyAllWindows()
@@ -0,0 +1,55 @@
+import os
+import time
+import argparse
+import numpy as np
+from sample_store import SampleStore, load_training_data
+from augmentation import LandmarkAugmenter, features_to_landmarks, RIGHT
+
+# Creates an augmented copy of the training data: the hands of the --data are
+# rotated, scaled, jittered and optionally mirrored until the --output store
+# has --target_size samples, which can be given to the train-model.py. The
+# samples are streamed to the store in batches and the same seed always gives
+# the same samples. E.g. of usage:
+# $ python augment-training-data.py --target_size 200000
+# $ python train-model.py --data data/augmented-training-data
+parser = argparse.ArgumentParser()
+parser.add_argument("--data", type=str, default='data/training-data', help='sample store or csv with the training data')
+parser.add_argument("--output", type=str, default='data/augmented-training-data', help='sample store that receives the samples, erased before')
+parser.add_argument("--target_size", type=int, default=200000, help='number of samples of the output, the original ones included')
+parser.add_argument("--rotation", type=float, default=15, help='maximum rotation, in degrees, to each side')
+parser.add_argument("--scale", type=float, default=0.1, help='maximum change of the size of each axis')
+parser.add_argument("--jitter", type=float, default=0.01, help='noise added to each joint, relative to the size of the hand')
+parser.add_argument("--mirror", type=float, default=0.0, help='probability of mirroring a sample into a right hand')
+parser.add_argument("--keep_original", type=int, default=1, help='1 to copy the original samples to the output')
+parser.add_argument("--batch_size", type=int, default=65536)
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+if os.path.abspath(args.output)==os.path.abspath(args.data):
+    raise ValueError('The output store is erased before the augmentation, so it must not be the --data')
+
+start = time.perf_counter()
+features, labels = load_training_data(args.data)
+features = np.asarray(features)
+labels = np.asarray(labels)
+
+store = SampleStore(args.output, n_features=features.shape[1])
+store.clear()
+if args.keep_original:
+    store.extend(labels, features)
+
+augmenter = LandmarkAugmenter(args.rotation, args.scale, args.jitter, args.mirror, args.seed)
+target_size = args.target_size - (len(labels) if args.keep_original else 0)
+mirrored = 0
+for batch_features, batch_labels, batch_handedness in augmenter.generate(
+    features_to_landmarks(features), labels, max(0, target_size), batch_size=args.batch_size
+):
+    # The store has no handedness, so the mirrored hands keep the label of
+    # their gesture, for models that recognise it with either hand
+    mirrored += int(np.sum(batch_handedness==RIGHT))
+    store.extend(batch_labels, batch_features)
+store.close()
+
+elapsed = time.perf_counter() - start
+print(f'{len(store)} samples written to the store {args.output} in {elapsed:.2f}s ({mirrored} mirrored)')
+print('Samples per label:', {int(label): int(count) for label, count in zip(*np.unique(store.load()[1], return_counts=True))})
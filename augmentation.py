@@ -0,0 +1,114 @@
+import numpy as np
+from helpers import pre_process_landmarks_batch
+
+# Handedness codes of the samples, the same of the landmark dump
+LEFT = 0
+RIGHT = 1
+
+def features_to_landmarks(features):
+    """
+    Params:
+        features = array with shape (N, 42) with the output of
+        pre_process_landmarks_batch, as kept in the training data
+    Output:
+        landmarks: array with shape (N, 21, 2) with the x and y coordinates of
+        each hand relative to its wrist. The min-max normalization uses the
+        same minimum and range for x and y, so the features are the pixel
+        coordinates up to a scale and an offset, and subtracting the wrist
+        gives back the shape of the hand, with the scale of the features
+    """
+    landmarks = np.asarray(features, dtype=np.float64).reshape(len(features), 21, 2)
+    return landmarks - landmarks[:, :1, :]
+
+class LandmarkAugmenter:
+    """
+    Creates new training samples by transforming the landmarks of the hands
+    of the training data: a rotation around the wrist, a scale of each axis,
+    a small jitter of each joint and, optionally, a mirror on horizontal,
+    which turns a left hand into a right hand. The transforms are applied to
+    whole batches of hands at once and the results are pre processed with the
+    same pre_process_landmarks_batch used by the scripts.
+
+    Params:
+        rotation = maximum rotation, in degrees, to each side
+        scale = maximum change of the size of each axis, e.g. 0.1 scales the x
+        and y axes independently between 0.9 and 1.1
+        jitter = standard deviation of the noise added to each joint, relative
+        to the size of the hand
+        mirror = probability of mirroring a sample
+        seed = seed of the random generator, so the same samples are created
+        in every run
+    """
+    def __init__(self, rotation=15, scale=0.1, jitter=0.01, mirror=0.0, seed=0):
+        self.rotation = np.radians(rotation)
+        self.scale = scale
+        self.jitter = jitter
+        self.mirror = mirror
+        self.rng = np.random.default_rng(seed)
+
+    def transform(self, landmarks, handedness):
+        """
+        Params:
+            landmarks = array with shape (N, 21, 2) or (N, 21, 3) with the
+            coordinates of N hands. The z coordinate, if present, is ignored
+            handedness = array with the handedness code (LEFT or RIGHT) of each hand
+        Output:
+            (landmarks, handedness): the (N, 21, 2) transformed coordinates,
+            relative to the wrist, and the handedness of each hand, swapped in
+            the mirrored ones
+        """
+        landmarks = np.asarray(landmarks, dtype=np.float64)[:, :, :2]
+        landmarks = landmarks - landmarks[:, :1, :]
+        count = len(landmarks)
+
+        # Rotation and scale of each hand, as a 2x2 matrix per hand
+        angles = self.rng.uniform(-self.rotation, self.rotation, count)
+        cosines, sines = np.cos(angles), np.sin(angles)
+        scales = self.rng.uniform(1 - self.scale, 1 + self.scale, (count, 2))
+        matrices = np.empty((count, 2, 2))
+        matrices[:, 0, 0] = cosines*scales[:, 0]
+        matrices[:, 0, 1] = -sines*scales[:, 0]
+        matrices[:, 1, 0] = sines*scales[:, 1]
+        matrices[:, 1, 1] = cosines*scales[:, 1]
+        landmarks = np.einsum('nij,nkj->nki', matrices, landmarks)
+
+        # The jitter is relative to the size of each hand
+        if self.jitter:
+            sizes = np.ptp(landmarks.reshape(count, -1), axis=1)
+            landmarks += self.rng.normal(0, self.jitter, landmarks.shape)*sizes[:, np.newaxis, np.newaxis]
+
+        handedness = np.array(handedness, dtype=np.int8)
+        if self.mirror:
+            mirrored = self.rng.random(count) < self.mirror
+            landmarks[mirrored, :, 0] *= -1
+            handedness[mirrored] = 1 - handedness[mirrored]
+        return landmarks, handedness
+
+    def generate(self, landmarks, labels, target_size, handedness=None, batch_size=65536):
+        """
+        Params:
+            landmarks = array with shape (N, 21, 2) or (N, 21, 3) with the
+            coordinates of the hands of the training data, e.g. the output of
+            features_to_landmarks
+            labels = array with the label of each hand
+            target_size = number of samples created
+            handedness = array with the handedness code of each hand. If None
+            all the hands are left hands, as the ones collected
+            batch_size = number of samples created at once
+        Output:
+            generator of (features, labels, handedness) batches, the features
+            pre processed as the input of the model. The hands transformed are
+            drawn at random, so every label keeps its share of the samples
+        """
+        landmarks = np.asarray(landmarks, dtype=np.float64)
+        labels = np.asarray(labels)
+        if handedness is None:
+            handedness = np.full(len(landmarks), LEFT, dtype=np.int8)
+
+        created = 0
+        while created < target_size:
+            count = min(batch_size, target_size - created)
+            indexes = self.rng.integers(0, len(landmarks), count)
+            batch_landmarks, batch_handedness = self.transform(landmarks[indexes], handedness[indexes])
+            yield pre_process_landmarks_batch(batch_landmarks), labels[indexes], batch_handedness
+            created += count
@@ -0,0 +1,246 @@
+"""
+Benchmarks of the landmark -> gesture -> servo hot path of apply-model.py.
+
+E.g. of usage, from the project root folder:
+    $ python benchmarks/run.py --save benchmarks/baseline.json
+    $ python benchmarks/run.py --compare benchmarks/baseline.json
+    $ python benchmarks/run.py --landmarks session.npz --only preprocess
+
+The results are written as json with the ops/sec and the latency percentiles,
+in microseconds, of each benchmark. In compare mode a benchmark is flagged as
+a regression when its median latency is more than --threshold slower than in
+the baseline, and the script exits with status 1.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import warnings
+import argparse
+import numpy as np
+
+# The benchmarks import the modules of the project root folder
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+VIDEO_WIDTH = 640.0
+VIDEO_HEIGHT = 480.0
+
+def measure(function, min_time=0.5, min_samples=30, max_samples=100000):
+    """
+    Params:
+        function = function without parameters that will be measured
+        min_time = minimum time, in seconds, spent measuring the function
+        min_samples = minimum number of calls measured
+        max_samples = maximum number of calls measured
+    Output:
+        dictionary with the ops/sec and the mean, p50, p95 and p99 latency in
+        microseconds of the function
+    """
+    # Warm up, so caches and lazy initializations don't count
+    for _ in range(min(10, min_samples)):
+        function()
+
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < max_samples and (len(samples) < min_samples or time.perf_counter()-start < min_time):
+        call_start = time.perf_counter_ns()
+        function()
+        samples.append(time.perf_counter_ns()-call_start)
+
+    samples = np.array(samples)/1000
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        'iterations': len(samples),
+        'ops_per_sec': 1e6/samples.mean(),
+        'mean_us': samples.mean(),
+        'p50_us': p50,
+        'p95_us': p95,
+        'p99_us': p99
+    }
+
+def load_landmarks(path, count, seed):
+    """
+    Params:
+        path = .npz landmark dump written by apply-model.py --dump_landmarks,
+        or None to generate synthetic landmarks
+        count = number of hands generated when path is None
+        seed = seed of the synthetic landmarks
+    Output:
+        (landmarks, handedness)
+            - landmarks -> array with shape (N, 21, 3) with one hand per row
+            - handedness -> list with the handedness label of each hand
+    """
+    from sources import HANDEDNESS_LABELS
+
+    if path is not None:
+        dump = np.load(path)
+        detected = dump['handedness'] >= 0
+        landmarks = dump['landmarks'][detected]
+        handedness = [HANDEDNESS_LABELS[code] for code in dump['handedness'][detected]]
+        return landmarks, handedness
+
+    # Random hands around a fixed pose, alternating the handedness
+    random_generator = np.random.default_rng(seed)
+    base_pose = random_generator.uniform(0.3, 0.7, size=(1, 21, 3))
+    landmarks = base_pose + random_generator.normal(0, 0.02, size=(count, 21, 3))
+    handedness = [HANDEDNESS_LABELS[index % 2] for index in range(count)]
+    return landmarks.astype(np.float32), handedness
+
+def cycle(items):
+    # Function that returns the next item of the list each time it's called
+    state = {'index': -1}
+    def next_item():
+        state['index'] = (state['index']+1) % len(items)
+        return items[state['index']]
+    return next_item
+
+def build_benchmarks(args):
+    """
+    Params:
+        args = the parsed command line arguments
+    Output:
+        dictionary mapping the name of each benchmark to a function without
+        parameters that runs one operation of it
+    """
+    import joblib
+    from sources import build_results
+    from classifier import NumpyMLPClassifier, CachedClassifier, quantize_classifier
+    import cv2
+    from helpers import get_coordinates, get_hand_landmarks_array, pre_process_hand_landmarks, pre_process_landmarks_batch, get_pinch_distance
+    from frame_buffers import FrameBuffers
+    from labels import load_gesture_registry
+    from kinematics import pinch, finger_flexion
+
+    landmarks, handedness = load_landmarks(args.landmarks, args.hands, args.seed)
+    # One results object per hand, so every benchmark uses hand_index 0
+    results_list = [build_results(hand[np.newaxis], [label]) for hand, label in zip(landmarks, handedness)]
+    next_results = cycle(results_list)
+    # The same hands as arrays, already extracted as in the apply-model.py
+    next_hand = cycle(list(landmarks))
+
+    model_path = os.path.join(ROOT, args.model)
+    gesture_classifier = joblib.load(model_path)
+    numpy_model_path = os.path.join(ROOT, args.numpy_model)
+    numpy_gesture_classifier = NumpyMLPClassifier.load(numpy_model_path)
+    int8_gesture_classifier = quantize_classifier(numpy_gesture_classifier, 'int8')
+    features = pre_process_landmarks_batch(landmarks, VIDEO_WIDTH, VIDEO_HEIGHT)
+    next_features = cycle([row.reshape(1, -1) for row in features])
+
+    gesture_registry = load_gesture_registry(os.path.join(ROOT, 'data/gesture-label.csv'))
+    next_label = cycle([record.label for record in gesture_registry])
+
+    batch = landmarks[:args.batch_size]
+
+    # A hand holding the same gesture, so every call but the stale ones is a hit
+    cached_gesture_classifier = CachedClassifier(numpy_gesture_classifier, max_distance=0.05, max_age=10)
+    held_features = features[0].reshape(1, -1)
+
+    # A webcam frame, converted for the hand tracking with new arrays or 
+    # into the buffers reused every frame
+    frame = np.random.default_rng(args.seed).integers(0, 256, (int(VIDEO_HEIGHT), int(VIDEO_WIDTH), 3), dtype=np.uint8)
+    frame_buffers = FrameBuffers()
+
+    return {
+        'get_coordinates': lambda: get_coordinates('INDEX_FINGER_TIP', 0, next_results(), VIDEO_WIDTH, VIDEO_HEIGHT),
+        'hand_landmarks_array': lambda: get_hand_landmarks_array(0, next_results()),
+        'hand_landmarks_buffer': lambda: frame_buffers.get_hand_landmarks_array(0, next_results()),
+        'convert_frame': lambda: cv2.flip(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), 1),
+        'convert_frame_buffer': lambda: frame_buffers.to_rgb_flipped(frame),
+        'pre_process_hand_landmarks': lambda: pre_process_hand_landmarks(0, next_results(), VIDEO_WIDTH, VIDEO_HEIGHT),
+        f'pre_process_landmarks_batch_{len(batch)}': lambda: pre_process_landmarks_batch(batch, VIDEO_WIDTH, VIDEO_HEIGHT),
+        'model_load': lambda: joblib.load(model_path),
+        'predict_single': lambda: gesture_classifier.predict(next_features()),
+        'model_load_numpy': lambda: NumpyMLPClassifier.load(numpy_model_path),
+        'predict_single_numpy': lambda: numpy_gesture_classifier.predict(next_features()),
+        'predict_single_int8': lambda: int8_gesture_classifier.predict(next_features()),
+        'predict_cached_held_pose': lambda: cached_gesture_classifier.predict(held_features),
+        'pinch_distance': lambda: get_pinch_distance(0, next_results(), VIDEO_WIDTH, VIDEO_HEIGHT),
+        'pinch_array': lambda: pinch(next_hand(), VIDEO_WIDTH, VIDEO_HEIGHT),
+        'finger_flexion': lambda: finger_flexion(next_hand(), VIDEO_WIDTH, VIDEO_HEIGHT),
+        'label_lookup': lambda: gesture_registry[next_label()],
+    }
+
+def compare(results, baseline, threshold):
+    """
+    Params:
+        results = the benchmarks of this run
+        baseline = the benchmarks of the baseline file
+        threshold = relative increase of the median latency, e.g. 0.1 for 10%,
+        above which a benchmark is flagged as a regression
+    Output:
+        regressions: list with the names of the benchmarks that regressed
+    """
+    regressions = []
+    print(f'{"benchmark":<34}{"baseline p50":>14}{"current p50":>14}{"change":>10}')
+    for name, result in results.items():
+        if name not in baseline:
+            print(f'{name:<34}{"-":>14}{result["p50_us"]:>12.2f}us{"new":>10}')
+            continue
+        change = result['p50_us']/baseline[name]['p50_us'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<34}{baseline[name]["p50_us"]:>12.2f}us{result["p50_us"]:>12.2f}us{change:>+10.1%}{flag}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the landmark -> gesture -> servo hot path')
+    parser.add_argument('--landmarks', type=str, default=None, help='.npz landmark dump used instead of synthetic hands')
+    parser.add_argument('--hands', type=int, default=1000, help='number of synthetic hands')
+    parser.add_argument('--batch_size', type=int, default=256, help='number of hands of the batch preprocessing benchmark')
+    parser.add_argument('--model', type=str, default='model/clf.pkl', help='sklearn gesture classifier, relative to the project root')
+    parser.add_argument('--numpy_model', type=str, default='model/clf.npz', help='exported gesture classifier, relative to the project root')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min_time', type=float, default=0.5, help='minimum seconds spent on each benchmark')
+    parser.add_argument('--only', nargs='*', default=None, help='run only the benchmarks containing one of these names')
+    parser.add_argument('--save', type=str, default=None, help='json file that will receive the results')
+    parser.add_argument('--compare', type=str, default=None, help='baseline json file to compare the results against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown of the median flagged as regression')
+    args = parser.parse_args()
+
+    benchmarks = build_benchmarks(args)
+    if args.only:
+        benchmarks = {name: function for name, function in benchmarks.items() if any(only in name for only in args.only)}
+
+    results = {}
+    with warnings.catch_warnings():
+        # The sklearn model was fitted with feature names and gets arrays, as 
+        # in the apply-model.py, which would warn in every call and flood the 
+        # output. Ignoring it also keeps the printing out of the timed calls
+        warnings.filterwarnings('ignore', message='X does not have valid feature names')
+        for name, function in benchmarks.items():
+            # Loading the model is slow, so it's measured less times
+            min_samples = 5 if name.startswith('model_load') else 30
+            results[name] = measure(function, min_time=args.min_time, min_samples=min_samples)
+            print(f'{name:<34}{results[name]["ops_per_sec"]:>14.1f} ops/s   p50 {results[name]["p50_us"]:.2f}us   p99 {results[name]["p99_us"]:.2f}us', file=sys.stderr)
+
+    output = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'landmarks': args.landmarks or 'synthetic'
+        },
+        'benchmarks': results
+    }
+
+    if args.save is not None:
+        with open(args.save, 'w') as file:
+            json.dump(output, file, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)['benchmarks']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s): {", ".join(regressions)}')
+            sys.exit(1)
+
+if __name__=='__main__':
+    main()
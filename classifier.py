@@ -0,0 +1,327 @@
+import numpy as np
+
+def relu(x):
+    np.maximum(x, 0, out=x)
+
+def tanh(x):
+    np.tanh(x, out=x)
+
+def logistic(x):
+    # 1/(1+exp(-x)) computed in place
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1
+    np.reciprocal(x, out=x)
+
+def identity(x):
+    pass
+
+# In place activation functions, by the name used by sklearn's MLPClassifier
+ACTIVATIONS = {
+    'relu': relu,
+    'tanh': tanh,
+    'logistic': logistic,
+    'identity': identity
+}
+
+class NumpyMLPClassifier:
+    """
+    Forward pass of a trained sklearn MLPClassifier using only numpy, giving
+    the same predictions without importing scikit-learn or unpickling the
+    model. The activations of each layer are written in buffers allocated
+    once for each batch size, so predicting one sample per frame doesn't
+    allocate new arrays for the hidden layers.
+
+    Params:
+        coefs = list with the weight matrix of each layer
+        intercepts = list with the bias vector of each layer
+        classes = array with the class of each output of the network
+        activation = activation function of the hidden layers
+        out_activation = activation function of the output layer, 'softmax'
+        for multiclass or 'logistic' for binary classification
+    """
+    # Type of the weights and of the activations of the forward pass
+    dtype = np.float64
+
+    def __init__(self, coefs, intercepts, classes, activation='relu', out_activation='softmax'):
+        self.coefs = [np.ascontiguousarray(coef, dtype=np.float64) for coef in coefs]
+        self.intercepts = [np.ascontiguousarray(intercept, dtype=np.float64) for intercept in intercepts]
+        self.classes_ = np.asarray(classes)
+        self.activation = ACTIVATIONS[activation]
+        self.activation_name = activation
+        self.out_activation = out_activation
+        self.n_features_in_ = self.coefs[0].shape[0]
+        self.buffers = []
+
+    @classmethod
+    def load(cls, path):
+        """
+        Params:
+            path = .npz file written by export_classifier
+        Output:
+            the NumpyMLPClassifier with the weights of the file
+        """
+        model = np.load(path)
+        n_layers = int(model['n_layers'])
+        return cls(
+            coefs = [model[f'coef_{layer}'] for layer in range(n_layers)],
+            intercepts = [model[f'intercept_{layer}'] for layer in range(n_layers)],
+            classes = model['classes'],
+            activation = str(model['activation']),
+            out_activation = str(model['out_activation'])
+        )
+
+    @classmethod
+    def from_sklearn(cls, clf):
+        """
+        Params:
+            clf = a trained sklearn MLPClassifier
+        Output:
+            the NumpyMLPClassifier with the weights of clf, without writing 
+            them to a file
+        """
+        return cls(clf.coefs_, clf.intercepts_, clf.classes_, clf.activation, clf.out_activation_)
+
+    def forward(self, X):
+        """
+        Params:
+            X = array with shape (n_samples, n_features)
+        Output:
+            the output of the last layer before the output activation. It's a
+            buffer reused by the next call, so it must be copied to be kept
+        """
+        X = np.asarray(X, dtype=self.dtype)
+        if X.ndim==1:
+            X = X.reshape(1, -1)
+        if not self.buffers or self.buffers[0].shape[0]!=X.shape[0]:
+            self.buffers = [np.empty((X.shape[0], coef.shape[1]), dtype=self.dtype) for coef in self.coefs]
+
+        activation = X
+        last_layer = len(self.coefs)-1
+        for layer, (coef, intercept, buffer) in enumerate(zip(self.coefs, self.intercepts, self.buffers)):
+            np.dot(activation, coef, out=buffer)
+            buffer += intercept
+            if layer!=last_layer:
+                self.activation(buffer)
+            activation = buffer
+        return activation
+
+    def predict(self, X):
+        """
+        Params:
+            X = array with shape (n_samples, n_features)
+        Output:
+            array with the class predicted for each sample
+        """
+        output = self.forward(X)
+        # The softmax and logistic functions keep the order of the values, so
+        # the class can be taken from the output before them
+        if self.out_activation=='softmax':
+            return self.classes_[output.argmax(axis=1)]
+        return self.classes_[(output[:, 0] > 0).astype(int)]
+
+    def predict_proba(self, X):
+        """
+        Params:
+            X = array with shape (n_samples, n_features)
+        Output:
+            array with shape (n_samples, n_classes) with the probability of each
+            class for each sample
+        """
+        output = self.forward(X)
+        if self.out_activation=='softmax':
+            probabilities = np.exp(output - output.max(axis=1, keepdims=True))
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            return probabilities
+        positive = 1/(1+np.exp(-output[:, 0]))
+        return np.column_stack([1-positive, positive])
+
+class QuantizedMLPClassifier(NumpyMLPClassifier):
+    """
+    MLP whose weights are stored in a compact type, written by
+    quantize_classifier. With 'int8' the weights of each layer are int8 with
+    one scale per layer, and with 'float16' they are float16. The weights are
+    expanded to float32 once, when the model is created, and the forward pass
+    runs in float32, which halves the memory of the weights and of the
+    activations compared to the float64 of the NumpyMLPClassifier.
+
+    Params:
+        coefs = list with the weight matrix of each layer, int8 or float16
+        intercepts = list with the bias vector of each layer
+        classes = array with the class of each output of the network
+        activation = activation function of the hidden layers
+        out_activation = activation function of the output layer
+        quantization = 'int8' or 'float16'
+        weight_scales = with int8, the scale of the weights of each layer
+    """
+    dtype = np.float32
+
+    def __init__(self, coefs, intercepts, classes, activation='relu', out_activation='softmax', quantization='int8', weight_scales=None):
+        self.quantization = quantization
+        self.stored_coefs = [np.asarray(coef) for coef in coefs]
+        self.weight_scales = None if weight_scales is None else np.asarray(weight_scales, dtype=np.float32)
+        self.coefs = [
+            coef.astype(np.float32)*(self.weight_scales[layer] if quantization=='int8' else 1)
+            for layer, coef in enumerate(self.stored_coefs)
+        ]
+        self.intercepts = [np.asarray(intercept, dtype=np.float32) for intercept in intercepts]
+        self.classes_ = np.asarray(classes)
+        self.activation = ACTIVATIONS[activation]
+        self.activation_name = activation
+        self.out_activation = out_activation
+        self.n_features_in_ = self.coefs[0].shape[0]
+        self.buffers = []
+
+    @classmethod
+    def load(cls, path):
+        """
+        Params:
+            path = .npz file written by export_quantized
+        Output:
+            the QuantizedMLPClassifier with the weights of the file
+        """
+        model = np.load(path)
+        n_layers = int(model['n_layers'])
+        quantization = str(model['quantization'])
+        return cls(
+            coefs = [model[f'coef_{layer}'] for layer in range(n_layers)],
+            intercepts = [model[f'intercept_{layer}'] for layer in range(n_layers)],
+            classes = model['classes'],
+            activation = str(model['activation']),
+            out_activation = str(model['out_activation']),
+            quantization = quantization,
+            weight_scales = model['weight_scales'] if quantization=='int8' else None
+        )
+
+class CachedClassifier:
+    """
+    Wraps a classifier to skip the prediction when the sample barely changed
+    since the last one predicted, e.g. while the hand holds the same gesture.
+    The output of the last prediction is reused while the euclidean distance
+    between the new sample and the sample predicted is below max_distance,
+    for at most max_age calls in a row, after which the sample is predicted
+    again even if it didn't move.
+
+    Params:
+        classifier = the classifier, with the predict and predict_proba methods
+        max_distance = maximum distance for the last output to be reused
+        max_age = maximum number of calls in a row answered by the cache
+
+    Only single sample inputs are cached, as the apply-model.py predicts one
+    hand at a time.
+    """
+    def __init__(self, classifier, max_distance=0.05, max_age=10):
+        self.classifier = classifier
+        self.classes_ = classifier.classes_
+        self.max_distance = max_distance
+        self.max_age = max_age
+        # Sample, output and age of the last prediction of each method
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, method, X):
+        X = np.asarray(X, dtype=np.float64).reshape(1, -1)
+        entry = self.entries.get(method)
+        if entry is not None and entry['age'] < self.max_age and np.linalg.norm(X - entry['sample']) < self.max_distance:
+            entry['age'] += 1
+            self.hits += 1
+            return entry['output']
+
+        self.misses += 1
+        output = np.array(getattr(self.classifier, method)(X))
+        # The sample kept is the one predicted, not the last one seen, so a 
+        # slow drift still triggers a new prediction
+        self.entries[method] = {'sample': X.copy(), 'output': output, 'age': 0}
+        return output
+
+    def predict(self, X):
+        return self.cached('predict', X)
+
+    def predict_proba(self, X):
+        return self.cached('predict_proba', X)
+
+    def reset(self):
+        self.entries = {}
+
+    def hit_rate(self):
+        calls = self.hits + self.misses
+        return self.hits/calls if calls else 0.0
+
+    def summary(self):
+        return f'Classifier cache: {self.hits} hits and {self.misses} predictions ({self.hit_rate():.1%} hit rate)'
+
+def export_classifier(clf, path):
+    """
+    Params:
+        clf = a trained sklearn MLPClassifier
+        path = the .npz file that will receive its weights, biases and classes
+    """
+    arrays = {
+        'n_layers': len(clf.coefs_),
+        'classes': clf.classes_,
+        'activation': clf.activation,
+        'out_activation': clf.out_activation_
+    }
+    for layer, (coef, intercept) in enumerate(zip(clf.coefs_, clf.intercepts_)):
+        arrays[f'coef_{layer}'] = coef
+        arrays[f'intercept_{layer}'] = intercept
+    np.savez(path, **arrays)
+
+def quantize_classifier(classifier, quantization='int8'):
+    """
+    Params:
+        classifier = a NumpyMLPClassifier
+        quantization = 'int8' or 'float16'
+    Output:
+        the QuantizedMLPClassifier with the weights of classifier
+    """
+    if quantization=='float16':
+        return QuantizedMLPClassifier(
+            [coef.astype(np.float16) for coef in classifier.coefs], classifier.intercepts, classifier.classes_,
+            classifier.activation_name, classifier.out_activation, quantization
+        )
+
+    # Symmetric quantization: the largest absolute weight of each layer is 127
+    weight_scales = [max(np.abs(coef).max(), 1e-12)/127 for coef in classifier.coefs]
+    coefs = [np.rint(coef/scale).astype(np.int8) for coef, scale in zip(classifier.coefs, weight_scales)]
+    return QuantizedMLPClassifier(
+        coefs, classifier.intercepts, classifier.classes_, classifier.activation_name,
+        classifier.out_activation, quantization, weight_scales
+    )
+
+def export_quantized(classifier, path):
+    """
+    Params:
+        classifier = a QuantizedMLPClassifier
+        path = the .npz file that will receive its weights, scales and classes
+    """
+    arrays = {
+        'n_layers': len(classifier.coefs),
+        'classes': classifier.classes_,
+        'activation': classifier.activation_name,
+        'out_activation': classifier.out_activation,
+        'quantization': classifier.quantization
+    }
+    if classifier.quantization=='int8':
+        arrays['weight_scales'] = classifier.weight_scales
+    for layer, (coef, intercept) in enumerate(zip(classifier.stored_coefs, classifier.intercepts)):
+        arrays[f'coef_{layer}'] = coef
+        arrays[f'intercept_{layer}'] = intercept.astype(np.float16 if classifier.quantization=='float16' else np.float32)
+    np.savez(path, **arrays)
+
+def load_classifier(path):
+    """
+    Params:
+        path = a .npz file written by export_classifier or export_quantized,
+        or a pickle of the sklearn model written by joblib
+    Output:
+        the classifier, with the predict and predict_proba methods. Only the
+        pickle requires scikit-learn and joblib
+    """
+    if path.endswith('.npz'):
+        with np.load(path) as model:
+            quantized = 'quantization' in model.files
+        return QuantizedMLPClassifier.load(path) if quantized else NumpyMLPClassifier.load(path)
+    import joblib
+    return joblib.load(path)
@@ -1,10 +1,26 @@
-import mediapipe as mp
+import time
+# Moment in which the script started, used to profile the startup
+startup_time = time.perf_counter()
 import numpy as np 
-import pandas as pd
+from helpers import get_coordinates, get_handedness, draw_normalized_coordinates, draw_sample_counter, pre_process_hand_landmarks, get_args
+from timing import create_timer, StartupProfiler, AllocationProfiler
+from labels import load_gesture_registry
+from sample_store import SampleStore, BurstRecorder
+
+args = get_args()
+
+# With --profile-startup the duration of each step until the first frame is 
+# processed is printed
+startup = StartupProfiler(startup_time, enabled=args.profile_startup)
+startup.mark('get_args')
+
+# The heavy modules are only imported after the arguments are parsed
 import cv2 
-import csv
-import os
-from helpers import get_coordinates, get_handedness, draw_normalized_coordinates, pre_process_hand_landmarks, get_args
+from frame_buffers import FrameBuffers
+from hands_controller import create_hands
+startup.mark('import cv2')
+import mediapipe as mp
+startup.mark('import mediapipe')
 
 # Object that let us draw landmarks in our image 
 mp_drawing = mp.solutions.drawing_utils
@@ -12,180 +28,270 @@ mp_drawing = mp.solutions.drawing_utils
 # Object with all hand tracking methods of mediapipe
 mp_hands = mp.solutions.hands
 
+# Styles of the landmarks and connections drawn, created once
+landmark_drawing_spec = mp_drawing.DrawingSpec(
+    color = (1, 190, 255),
+    thickness = 2,
+    circle_radius = 4
+)
+connection_drawing_spec = mp_drawing.DrawingSpec(
+    color = (86, 213, 0),
+    thickness = 2,
+    circle_radius = 2
+)
+
 # The cv2.VideoCapture needs an number representing which device will be used 
 # if the program does not work for you, try specifying a device other than 0 
-args = get_args()
 device = args.device
 # Object that reads from the webcam
 cap = cv2.VideoCapture(device)
+startup.mark('open capture')
 
 # Get the width and height so we can draw on the image using opencv
 video_width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
 video_height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
 
 # Hand gesture label map 
-gesture_label = pd.read_csv('data/gesture-label.csv', encoding = 'latin1')
-
-with mp_hands.Hands(
-    static_image_mode=False,
-    max_num_hands=2,
-    model_complexity=1,
-    min_detection_confidence=0.8,
-    min_tracking_confidence=0.5
-) as hands:
-    while cap.isOpened():             
-        # cap.read() return two variables, the 'results' which is a boolean
-        # identifying if the image was read and the frame that is a cv2 image
-        # object of the frame captured
-        ret, frame = cap.read()
-
-        # Before processing our image with mediapipe is necessary to convert it 
-        # from BGR to RGB, because mediapipe works with RGB and opencv with BGR
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        # Flip on horizontal so the lib detects correct handness
-        image = cv2.flip(image, 1)
-
-        # Setting the writable flag to false before process with mediapipe leads 
-        # to improvement in the performance 
-        image.flags.writeable = False
-
-        # Do the actual processing with the mediapipe lib 
-        results = hands.process(image)
-
-        # Setting back the flag of writable so we can draw in the image
-        image.flags.writeable = True
+gesture_registry = load_gesture_registry('data/gesture-label.csv')
+startup.mark('load labels')
+
+# Binary store that receives the training samples. The samples are written in 
+# blocks by a background thread, so saving one doesn't block the frame loop
+sample_store = SampleStore(args.training_data)
+recorder = BurstRecorder(
+    sample_store, 
+    stride = args.record_stride, 
+    min_distance = args.min_sample_distance
+)
+processed_hand_landmarks = None
+# Last label pressed, the one used by the record mode
+active_label = None
+
+# Timer of each stage of the frame loop. When it's not enabled by the user 
+# it does nothing 
+timer = create_timer(args, ['read', 'convert', 'hands_process', 'preprocess', 'draw', 'display'])
+
+# With --reuse_buffers the frame is converted to RGB and back and the landmarks 
+# of the hands are extracted into buffers allocated once
+frame_buffers = FrameBuffers() if args.reuse_buffers==1 else None
+
+# With --trace_allocations the memory allocated in each frame is measured 
+# with tracemalloc and printed at the end
+allocation_profiler = AllocationProfiler() if args.trace_allocations==1 else None
+
+try:
+    # With --adaptive_complexity the model_complexity changes with the rate of 
+    # the frame loop
+    with create_hands(mp_hands, args) as hands:
+        startup.mark('create hands')
+        while cap.isOpened():             
+            # cap.read() return two variables, the 'results' which is a boolean
+            # identifying if the image was read and the frame that is a cv2 image
+            # object of the frame captured
+            if allocation_profiler is not None:
+                allocation_profiler.frame()
+            record = timer.start_frame()
+            with timer.stage(record, 'read'):
+                if frame_buffers is not None:
+                    ret, frame = frame_buffers.read(cap)
+                else:
+                    ret, frame = cap.read()
+            timer.mark_captured(record)
+            recorder.next_frame()
+
+            with timer.stage(record, 'convert'):
+                if frame_buffers is not None:
+                    # The same conversion and flip, written into the buffers
+                    image = frame_buffers.to_rgb_flipped(frame)
+                else:
+                    # Before processing our image with mediapipe is necessary to convert it 
+                    # from BGR to RGB, because mediapipe works with RGB and opencv with BGR
+                    image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+                    # Flip on horizontal so the lib detects correct handness
+                    image = cv2.flip(image, 1)
+
+            # Setting the writable flag to false before process with mediapipe leads 
+            # to improvement in the performance 
+            image.flags.writeable = False
+
+            # Do the actual processing with the mediapipe lib 
+            with timer.stage(record, 'hands_process'):
+                results = hands.process(image)
+
+            if not startup.reported:
+                startup.mark('first hands.process')
+                startup.report()
+
+            # Setting back the flag of writable so we can draw in the image
+            image.flags.writeable = True
         
-        # Writing that is waiting for the key to save the coordinates 
-        image = cv2.putText(
-            img = image, 
-            text = 'Press a number from 0 to 9 to save gesture data',
-            org = (50,50), #coordinates
-            fontFace = cv2.FONT_HERSHEY_SIMPLEX,
-            fontScale = 0.5, 
-            color = (0, 0, 0), #RGB
-            thickness = 2, 
-            lineType = cv2.LINE_AA
-        )
-
-        # Drawing landmarks to the image
-        ## If any hand was detected
-        if results.multi_hand_landmarks:
-            # The enumerate is used to multi hand detection, the hand variable
-            # is basically all the landmarks from one hand
-            for hand_index, hand_landmarks in enumerate(results.multi_hand_landmarks):
+            # Writing that is waiting for the key to save the coordinates 
+            image = cv2.putText(
+                img = image, 
+                text = 'Press a number from 0 to 9 to save gesture data, R to record',
+                org = (50,50), #coordinates
+                fontFace = cv2.FONT_HERSHEY_SIMPLEX,
+                fontScale = 0.5, 
+                color = (0, 0, 0), #RGB
+                thickness = 2, 
+                lineType = cv2.LINE_AA
+            )
+
+            # Drawing landmarks to the image
+            ## If any hand was detected
+            if results.multi_hand_landmarks:
+                # The enumerate is used to multi hand detection, the hand variable
+                # is basically all the landmarks from one hand
+                for hand_index, hand_landmarks in enumerate(results.multi_hand_landmarks):
                                 
-                # Get handedness label
-                handedness_label = get_handedness(
-                    hand_index = hand_index,
-                    results = results
-                )
+                    # Get handedness label
+                    handedness_label = get_handedness(
+                        hand_index = hand_index,
+                        results = results
+                    )
                 
-                # Drawing handedness on the wrist
-                image = cv2.putText(
-                            img = image, 
-                            text = handedness_label,
-                            org = get_coordinates('WRIST', hand_index, results, video_width, video_height), #coordinates
-                            fontFace = cv2.FONT_HERSHEY_SIMPLEX,
-                            fontScale = 0.8, 
-                            color = (255, 255, 255), #RGB
-                            thickness = 2, 
-                            lineType = cv2.LINE_AA
-                        )
+                    # Drawing handedness on the wrist
+                    image = cv2.putText(
+                                img = image, 
+                                text = handedness_label,
+                                org = get_coordinates('WRIST', hand_index, results, video_width, video_height), #coordinates
+                                fontFace = cv2.FONT_HERSHEY_SIMPLEX,
+                                fontScale = 0.8, 
+                                color = (255, 255, 255), #RGB
+                                thickness = 2, 
+                                lineType = cv2.LINE_AA
+                            )
                            
-                # Pre process the hand landmarks coordinates 
-                processed_hand_landmarks = pre_process_hand_landmarks(hand_index, results, video_width, video_height)
-                
-                # Draw the pre-processed coordinates according to the joint list
-                joint_list = ['INDEX_FINGER_TIP','THUMB_TIP', 'MIDDLE_FINGER_TIP', 'RING_FINGER_TIP', 'PINKY_TIP']
-                coordinates = []
-                normalized_coordinates = []
-                for joint in joint_list:
-                    coordinates.append(
-                        get_coordinates(
-                            joint, 
+                    # Pre process the hand landmarks coordinates 
+                    with timer.stage(record, 'preprocess'):
+                        processed_hand_landmarks = pre_process_hand_landmarks(
                             hand_index, 
                             results, 
                             video_width, 
-                            video_height
+                            video_height, 
+                            out = None if frame_buffers is None else frame_buffers.hand_landmarks[hand_index]
                         )
-                    )
-                    joint_index = mp_hands.HandLandmark[joint].numerator
-                    normalized_coordinates.append(
-                        tuple(processed_hand_landmarks[(joint_index*2):((joint_index*2)+2)])
-                    )
+                
+                    # In the record mode the left hand of every frame is saved, unless
+                    # skipped by the stride or too close to the last one saved. Only the
+                    # left hand gives the gestures classified in the apply-model.py, the
+                    # right one moves the arm
+                    if handedness_label=='Left':
+                        recorder.offer(processed_hand_landmarks)
+                
+                    with timer.stage(record, 'draw'):
+                        # Draw the pre-processed coordinates according to the joint list
+                        joint_list = ['INDEX_FINGER_TIP','THUMB_TIP', 'MIDDLE_FINGER_TIP', 'RING_FINGER_TIP', 'PINKY_TIP']
+                        coordinates = []
+                        normalized_coordinates = []
+                        for joint in joint_list:
+                            coordinates.append(
+                                get_coordinates(
+                                    joint, 
+                                    hand_index, 
+                                    results, 
+                                    video_width, 
+                                    video_height
+                                )
+                            )
+                            joint_index = mp_hands.HandLandmark[joint].numerator
+                            normalized_coordinates.append(
+                                tuple(processed_hand_landmarks[(joint_index*2):((joint_index*2)+2)])
+                            )
                     
-                normalized_coordinates = np.around(normalized_coordinates,2)
+                        normalized_coordinates = np.around(normalized_coordinates,2)
 
-                image = draw_normalized_coordinates(
-                    image = image, 
-                    coordinates = coordinates, 
-                    normalized_coordinates = normalized_coordinates
-                )
+                        image = draw_normalized_coordinates(
+                            image = image, 
+                            coordinates = coordinates, 
+                            normalized_coordinates = normalized_coordinates
+                        )
                 
-                # Utility used to draw the image based on the landmark values
-                mp_drawing.draw_landmarks(
-                    image = image,
-                    landmark_list = hand_landmarks,
-                    connections = mp_hands.HAND_CONNECTIONS,
-                    landmark_drawing_spec = mp_drawing.DrawingSpec(
-                                                color = (1, 190, 255),
-                                                thickness = 2,
-                                                circle_radius = 4
-                                            ),
-                    connection_drawing_spec = mp_drawing.DrawingSpec(
-                                                color = (86, 213, 0),
-                                                thickness = 2,
-                                                circle_radius = 2
-                                            )
-                )
-                    
-        # Converting it back to BGR so we can display using opencv
-        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-        
-        # Display the output frame of the webcam
-        cv2.imshow('Hand Tracking', image)
-
-        # - If 'q' is pressed the window is closed;
-        # - If 'e' is pressed all training data will be erased;
-        # - If a number from 0 to 9 is pressed then the coordinates
-        #   will be saved  in the training sv file with those coordinates 
-        #   associated to the number label pressed.
-        key = cv2.waitKey(10)
-        if key==ord('q'):
-            break
-        if key==ord('e'):
-            os.remove('training-data.csv')
-        if key>=ord('0') and key<=ord('9'):
-            # Create the headers of the csv with the joint landmark names 
-            headers = ['gesture_id']
-            for joint in mp_hands.HandLandmark:
-                headers.append(joint.name.lower()+'_x')
-                headers.append(joint.name.lower()+'_y')
-
-            if not os.path.exists('data'):
-                os.makedirs('data')
-            with open('data/training-data.csv','a',newline='') as file:
-                writer = csv.writer(file)
-                row = np.append(int(chr(key)),processed_hand_landmarks) 
-                # If file was created from scratch, append header. If not, 
-                # only append row
-                if file.tell()==0:
-                    writer.writerow(headers)
-                    writer.writerow(row)
+                        # Utility used to draw the image based on the landmark values
+                        mp_drawing.draw_landmarks(
+                            image = image,
+                            landmark_list = hand_landmarks,
+                            connections = mp_hands.HAND_CONNECTIONS,
+                            landmark_drawing_spec = landmark_drawing_spec,
+                            connection_drawing_spec = connection_drawing_spec
+                        )
+
+            # Number of samples saved of each gesture 
+            image = draw_sample_counter(image, recorder.counts, gesture_registry, active_label, recorder.recording)
+
+            with timer.stage(record, 'display'):
+                # Converting it back to BGR so we can display using opencv
+                if frame_buffers is not None:
+                    image = frame_buffers.to_bgr(image)
                 else:
-                    writer.writerow(row)
-            
-            # Erase the coordinates after saving it, to avoid write duplicate data 
-            # when no hand be captured by the video 
-            processed_hand_landmarks = None 
+                    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+                # Writing the FPS and the latency of each stage
+                image = timer.draw(image)
             
-            try:
-                label = gesture_label.loc[gesture_label[gesture_label.Label==int(chr(key))].index[0],'Gesture']
-                print(f'Gesture saved to label {label}')
-            except:
-                print(f'No label detected. Update the "gesture-label.csv" file with the label of "{chr(key)}".')
+                # Display the output frame of the webcam
+                cv2.imshow('Hand Tracking', image)
+            timer.finish_frame(record)
 
-cap.release()
+            # - If 'q' is pressed the window is closed;
+            # - If 'e' is pressed all training data will be erased;
+            # - If 'r' is pressed the record mode is turned on or off. While it's
+            #   on, the coordinates of every frame are saved with the last number
+            #   pressed;
+            # - If a number from 0 to 9 is pressed then the coordinates
+            #   will be saved in the training data store with those coordinates 
+            #   associated to the number label pressed. In the record mode it 
+            #   only changes the label being recorded.
+            key = cv2.waitKey(10)
+            if key==ord('q'):
+                break
+            if key==ord('e'):
+                recorder.clear()
+                print('All training data erased')
+            if key==ord('r'):
+                if recorder.recording:
+                    recorder.stop()
+                    print(f'Recording of label {active_label} stopped')
+                elif active_label is None:
+                    print('Press a number from 0 to 9 to choose the label before recording')
+                else:
+                    recorder.start(active_label)
+                    print(f'Recording label {active_label}')
+            if key>=ord('0') and key<=ord('9'):
+                active_label = int(chr(key))
+                if recorder.recording:
+                    recorder.start(active_label)
+                    print(f'Recording label {active_label}')
+                    continue
+
+                if processed_hand_landmarks is None:
+                    print('No hand detected since the last sample saved, nothing was saved')
+                    continue
+
+                recorder.save(active_label, processed_hand_landmarks, flush=True)
+            
+                # Erase the coordinates after saving it, to avoid write duplicate data 
+                # when no hand be captured by the video 
+                processed_hand_landmarks = None 
+            
+                try:
+                    label = gesture_registry[int(chr(key))].gesture
+                    print(f'Gesture saved to label {label}')
+                except KeyError:
+                    print(f'No label detected. Update the "gesture-label.csv" file with the label of "{chr(key)}".')
+except KeyboardInterrupt:
+    # Ctrl+C stops the frame loop the same way the "Q" key does
+    pass
+finally:
+    cap.release()
+    timer.close()
+    # Write the samples still in the queue and in the buffer of the store, 
+    # also when the frame loop fails or is interrupted
+    recorder.close()
+if allocation_profiler is not None:
+    print(allocation_profiler.summary())
+if args.adaptive_complexity==1:
+    print(hands.summary())
 # Destroy all the windows
 cv2.destroyAllWindows()
\ No newline at end of file
@@ -0,0 +1,30 @@
+import argparse
+from sample_store import SampleStore, import_csv, export_csv
+
+# Converts the training data between the csv layout of the data/training-data.csv
+# and the binary sample store written by the collect-train-data.py. The direction
+# is given by the input: a .csv is imported to the store, a store is exported to
+# a csv. A .session recorded by the apply-model.py has the left hands of its frames 
+# added to the store with the gesture predicted. E.g. of usage:
+# $ python convert-training-data.py --input data/training-data.csv --output data/training-data
+# $ python convert-training-data.py --input data/training-data --output data/training-data.csv
+# $ python convert-training-data.py --input session.session --output data/training-data
+parser = argparse.ArgumentParser()
+parser.add_argument("--input", type=str, default='data/training-data.csv')
+parser.add_argument("--output", type=str, default='data/training-data')
+args = parser.parse_args()
+
+if args.input.endswith('.session'):
+    from session import mine_samples
+
+    features, labels = mine_samples(args.input)
+    store = SampleStore(args.output)
+    store.extend(labels, features)
+    store.close()
+    print(f'{len(labels)} samples mined from the session {args.input} to the store {args.output}')
+elif args.input.endswith('.csv'):
+    count = import_csv(args.input, args.output)
+    print(f'{count} samples imported from {args.input} to the store {args.output}')
+else:
+    count = export_csv(args.input, args.output)
+    print(f'{count} samples exported from the store {args.input} to {args.output}')
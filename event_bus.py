@@ -0,0 +1,337 @@
+import json
+import time
+import asyncio
+import threading
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Command published by the vision side: the articulation, the pin of its servo
+# and the angle, with the wall clock time in which it was published and the
+# index of the frame it came from
+ServoEvent = namedtuple('ServoEvent', ['articulation', 'pin', 'angle', 'timestamp', 'frame'])
+
+def encode_event(event):
+    # json line sent by the socket and file backends
+    return (json.dumps(event._asdict()) + '\n').encode()
+
+class MemoryBackend:
+    """
+    Backend that keeps the events received in a list, used to run and test the
+    bus without any output.
+
+    Attributes:
+        events = list with the events received, in order
+    """
+    name = 'memory'
+
+    def __init__(self):
+        self.events = []
+
+    async def open(self):
+        pass
+
+    async def send(self, event):
+        self.events.append(event)
+
+    async def close(self):
+        pass
+
+class FileBackend:
+    """
+    Backend that writes each event as a json line to a file. The file is
+    written by a thread of its own, in the order of the events, so a slow
+    disk or a full pipe only delays this backend and not the asyncio loop
+    shared with the others.
+
+    Params:
+        path = the file that receives the events
+    """
+    def __init__(self, path):
+        self.path = path
+        self.name = f'file:{path}'
+        self.file = None
+        self.executor = None
+
+    async def open(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='file_backend')
+        self.file = await asyncio.get_running_loop().run_in_executor(self.executor, open, self.path, 'wb')
+
+    async def send(self, event):
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.file.write, encode_event(event))
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.file.close)
+        self.executor.shutdown()
+
+class SocketBackend:
+    """
+    Backend that sends each event as a json line to a remote arm controller,
+    in a UDP datagram or through a TCP connection. If the TCP connection is
+    lost the events fail until it's opened again, which is tried again at
+    each event.
+
+    Params:
+        protocol = 'udp' or 'tcp'
+        host = the host of the controller
+        port = the port of the controller
+    """
+    def __init__(self, protocol, host, port):
+        self.protocol = protocol
+        self.host = host
+        self.port = port
+        self.name = f'{protocol}:{host}:{port}'
+        self.transport = None
+        self.writer = None
+
+    async def open(self):
+        if self.protocol=='udp':
+            loop = asyncio.get_running_loop()
+            self.transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=(self.host, self.port))
+
+    async def send(self, event):
+        if self.protocol=='udp':
+            self.transport.sendto(encode_event(event))
+            return
+        try:
+            if self.writer is None:
+                _, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.writer.write(encode_event(event))
+            await self.writer.drain()
+        except OSError:
+            self.writer = None
+            return False
+
+    async def close(self):
+        if self.transport is not None:
+            self.transport.close()
+        if self.writer is not None:
+            self.writer.close()
+
+class FirmataBackend:
+    """
+    Backend that moves the servos of an Arduino through a servo.ServoWriter,
+    which does the blocking serial writes in its own thread.
+
+    Params:
+        port = the serial port of the Arduino, or None for a servo.FakeBoard
+        pins = the pins of the servos
+        deadband = see servo.ServoWriter
+        max_rate = see servo.ServoWriter
+    """
+    def __init__(self, port, pins, deadband=1, max_rate=50):
+        self.name = f'firmata:{port or "fake"}'
+        self.port = port
+        self.pins = pins
+        self.deadband = deadband
+        self.max_rate = max_rate
+        self.servo_writer = None
+
+    async def open(self):
+        from servo import open_board, ServoWriter
+
+        self.board = open_board(self.port, self.pins)
+        self.servo_writer = ServoWriter(self.board, deadband=self.deadband, max_rate=self.max_rate)
+        self.servo_writer.start()
+
+    async def send(self, event):
+        self.servo_writer.command(event.pin, event.angle)
+
+    async def close(self):
+        self.servo_writer.close()
+        self.board.exit()
+
+def create_backend(spec, pins, deadband=1, max_rate=50):
+    """
+    Params:
+        spec = the backend, one of:
+            - firmata:<port> -> the Arduino in the serial port, e.g. firmata:COM3
+            - firmata:fake -> a servo.FakeBoard
+            - udp:<host>:<port> or tcp:<host>:<port> -> a remote arm controller
+            - file:<path> -> a json lines file
+            - memory -> a list in memory
+        pins = the pins of the servos, used by the firmata backend
+        deadband = see servo.ServoWriter
+        max_rate = see servo.ServoWriter
+    Output:
+        the backend
+    """
+    kind, _, target = spec.partition(':')
+    if kind=='firmata':
+        return FirmataBackend(None if target in ('', 'fake') else target, pins, deadband, max_rate)
+    if kind in ('udp', 'tcp'):
+        host, _, port = target.rpartition(':')
+        return SocketBackend(kind, host, int(port))
+    if kind=='file':
+        return FileBackend(target)
+    if kind=='memory':
+        return MemoryBackend()
+    raise ValueError(f'Unknown actuator {spec}')
+
+class Consumer:
+    """
+    Delivers the events of the bus to one backend. Only the latest event of
+    each articulation waits to be sent: an event that arrives while the
+    previous one of the same articulation wasn't sent replaces it, and an
+    event older than max_age seconds when its turn comes is dropped, so a
+    slow backend never receives stale commands and never slows the others.
+
+    Params:
+        backend = the backend
+        max_age = maximum age, in seconds, of an event sent. 0 for no limit
+    """
+    def __init__(self, backend, max_age=0.25):
+        self.backend = backend
+        self.max_age = max_age
+        self.pending = {}
+        self.wake = asyncio.Event()
+        self.sent = 0
+        self.replaced = 0
+        self.stale = 0
+        self.failed = 0
+        # First unexpected error raised by the backend, printed when raised
+        self.error = None
+        # Time from the publication to the send of the last events, in seconds
+        self.latencies = deque(maxlen=1000)
+
+    def offer(self, event):
+        if event.articulation in self.pending:
+            self.replaced += 1
+        self.pending[event.articulation] = event
+        self.wake.set()
+
+    async def run(self, stopped):
+        while not (stopped.is_set() and not self.pending):
+            await self.wake.wait()
+            self.wake.clear()
+            pending, self.pending = self.pending, {}
+            for event in pending.values():
+                if self.max_age and time.time() - event.timestamp > self.max_age:
+                    self.stale += 1
+                    continue
+                # The backends return False when the event couldn't be sent.
+                # Any other error would end the task silently, leaving the
+                # backend without events, so it's counted as a failure too
+                try:
+                    sent = await self.backend.send(event)
+                except Exception as error:
+                    if self.error is None:
+                        self.error = error
+                        print(f'Actuator {self.backend.name}: {type(error).__name__}: {error}, the events that fail are counted')
+                    sent = False
+                if sent is False:
+                    self.failed += 1
+                    continue
+                self.sent += 1
+                self.latencies.append(time.time() - event.timestamp)
+
+    def summary(self):
+        latency = ''
+        if self.latencies:
+            p50, p99 = np.percentile(self.latencies, [50, 99])*1000
+            latency = f', latency p50 {p50:.2f} / p99 {p99:.2f} ms'
+        return (
+            f'Actuator {self.backend.name}: {self.sent} events sent '
+            f'({self.replaced} replaced by a newer one, {self.stale} stale, {self.failed} failed){latency}'
+        )
+
+class EventBus:
+    """
+    Bus that carries the ServoEvent published by the vision side to the
+    actuation backends. The bus runs an asyncio loop in its own thread, so
+    publishing an event only hands it to the loop and the frame loop never
+    waits for the outputs. Each backend has its own Consumer, so one vision
+    process can drive several actuators and a slow one doesn't delay the others.
+
+    Params:
+        backends = list with the backends, see create_backend
+        max_age = see Consumer
+
+    Usage:
+        bus = EventBus([create_backend('firmata:COM3', pins)])
+        bus.start()
+        bus.publish(ServoEvent('Indicador', 5, 45.0, time.time(), frame_index))
+        bus.close()
+    """
+    def __init__(self, backends, max_age=0.25):
+        self.backends = backends
+        self.max_age = max_age
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run, name='event_bus', daemon=True)
+        self.ready = threading.Event()
+        self.consumers = []
+        self.published = 0
+        self.error = None
+
+    def start(self):
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.serve())
+        except Exception as error:
+            # Keep the error so the main thread can raise it
+            self.error = error
+        finally:
+            self.ready.set()
+            self.loop.close()
+
+    async def serve(self):
+        self.stopped = asyncio.Event()
+        opened = []
+        try:
+            for backend in self.backends:
+                await backend.open()
+                opened.append(backend)
+        except Exception:
+            # The backends already opened are closed, e.g. freeing the serial
+            # port of an Arduino, before the error reaches the main thread
+            for backend in reversed(opened):
+                await backend.close()
+            raise
+        self.consumers = [Consumer(backend, self.max_age) for backend in self.backends]
+        tasks = [asyncio.create_task(consumer.run(self.stopped)) for consumer in self.consumers]
+        self.ready.set()
+
+        await self.stopped.wait()
+        # The consumers send what is pending and return
+        for consumer in self.consumers:
+            consumer.wake.set()
+        await asyncio.gather(*tasks)
+        for backend in self.backends:
+            await backend.close()
+
+    def dispatch(self, event):
+        for consumer in self.consumers:
+            consumer.offer(event)
+
+    def publish(self, event):
+        """
+        Params:
+            event = the ServoEvent, handed to every backend. It can be called
+            from any thread
+        """
+        if self.error is not None:
+            raise self.error
+        self.published += 1
+        self.loop.call_soon_threadsafe(self.dispatch, event)
+
+    def close(self):
+        # Sends the events still pending, closes the backends and stops the loop
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def summary(self):
+        lines = [f'Event bus: {self.published} events published']
+        lines += [consumer.summary() for consumer in self.consumers]
+        for backend in self.backends:
+            if isinstance(backend, FirmataBackend) and backend.servo_writer is not None:
+                lines.append(backend.servo_writer.summary())
+        return '\n'.join(lines)
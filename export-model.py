@@ -0,0 +1,23 @@
+import argparse
+import joblib
+import numpy as np
+from classifier import export_classifier, NumpyMLPClassifier
+
+# Exports the weights, biases and classes of the MLPClassifier pickled by the
+# model-training.ipynb to a .npz file, which is loaded by the apply-model.py
+# without scikit-learn. E.g. of usage:
+# $ python export-model.py --model model/clf.pkl --output model/clf.npz
+parser = argparse.ArgumentParser()
+parser.add_argument("--model", type=str, default='model/clf.pkl')
+parser.add_argument("--output", type=str, default='model/clf.npz')
+args = parser.parse_args()
+
+gesture_classifier = joblib.load(args.model)
+export_classifier(gesture_classifier, args.output)
+
+# Checking the exported model gives the same predictions, using the first
+# layer size to build random inputs in the range of the normalized coordinates
+X = np.random.default_rng(0).random((1000, gesture_classifier.coefs_[0].shape[0]))
+exported_classifier = NumpyMLPClassifier.load(args.output)
+agreement = (exported_classifier.predict(X)==gesture_classifier.predict(X)).mean()
+print(f'Model exported to {args.output}, agreement with the original model: {agreement:.1%}')
@@ -0,0 +1,86 @@
+import numpy as np
+import cv2
+from helpers import get_hand_landmarks_array
+
+class FrameBuffers:
+    """
+    Buffers allocated once and reused every frame by the frame loop: the
+    frame captured, the frame converted to RGB and flipped on horizontal for
+    the hand tracking, the image converted back to BGR for the display and
+    the landmarks of each hand. The opencv functions write straight into the
+    buffers with dst, so in the steady state the conversions allocate nothing
+    and the garbage collector and the allocator have less work between two
+    frames.
+
+    The buffers are overwritten by the next frame, so what is kept from a
+    frame must be copied, and they must be used by only one thread.
+
+    Params:
+        max_num_hands = the max_num_hands of the hand tracking
+    """
+    def __init__(self, max_num_hands=2):
+        self.frame = None
+        self.rgb = None
+        self.flipped = None
+        self.bgr = None
+        # The mediapipe coordinates are float32, so they are kept exactly
+        self.landmarks = np.empty((max_num_hands, 21, 3), dtype=np.float32)
+        # One view per hand, created once
+        self.hand_landmarks = list(self.landmarks)
+
+    def read(self, cap):
+        """
+        Params:
+            cap = the capture, from sources.open_capture
+        Output:
+            (ret, frame): the output of cap.read(). A cv2.VideoCapture decodes
+            each frame into the frame it returned before, the other captures of
+            the sources.py give a new frame
+        """
+        if not isinstance(cap, cv2.VideoCapture):
+            return cap.read()
+        ret, frame = cap.read(self.frame)
+        if ret:
+            self.frame = frame
+        return ret, frame
+
+    def to_rgb_flipped(self, frame):
+        """
+        Params:
+            frame = the BGR frame captured
+        Output:
+            the buffer with the frame converted to RGB and flipped on horizontal,
+            the same image cv2.flip(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), 1) gives
+        """
+        if self.flipped is None or self.flipped.shape!=frame.shape:
+            self.rgb = np.empty_like(frame)
+            self.flipped = np.empty_like(frame)
+        # The hand tracking of the previous frame got the buffer read only
+        self.flipped.flags.writeable = True
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        cv2.flip(self.rgb, 1, dst=self.flipped)
+        return self.flipped
+
+    def to_bgr(self, image):
+        """
+        Params:
+            image = the RGB image drawn
+        Output:
+            the buffer with the image converted back to BGR, to be displayed
+        """
+        if self.bgr is None or self.bgr.shape!=image.shape:
+            self.bgr = np.empty_like(image)
+        cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=self.bgr)
+        return self.bgr
+
+    def get_hand_landmarks_array(self, hand_index, results):
+        """
+        Params:
+            hand_index = the positional index of the hand in the
+            results.multi_hand_landmarks list
+            results = the output of mp.solutions.hands.Hands(...).process(image)
+        Output:
+            the row of the buffer with the landmarks of the hand, see
+            helpers.get_hand_landmarks_array
+        """
+        return get_hand_landmarks_array(hand_index, results, self.hand_landmarks[hand_index])
@@ -0,0 +1,202 @@
+import time
+
+# Mean handedness score below which the hands are considered poorly tracked,
+# so the model_complexity 1 is preferred whenever the frame rate allows it
+LOW_CONFIDENCE = 0.85
+
+# Time of the model_complexity 1 relative to the 0, used until both are measured
+COMPLEXITY_RATIO = 2.0
+
+class AdaptiveHands:
+    """
+    Hand tracking with the same process method of mp.solutions.hands.Hands,
+    which switches between the model_complexity 0 and 1 to keep the hand
+    tracking within the time per frame of target_fps. Both instances are
+    created at the start and initialized with the first frame, so the one in
+    standby is warm and a switch doesn't stall the frame loop loading its
+    model.
+
+    The time taken by the process call of the instance in use is followed
+    with an exponential moving average, so the wait for the camera isn't
+    counted. When it's above the time per frame for patience calls in a row
+    the complexity 0 is used. The complexity 1 is used again when its time,
+    estimated from the complexity 0 by the ratio between both measured
+    before, fits the time per frame with headroom (or just fits it, if the
+    hands are poorly tracked), unless it was too slow less than
+    retry_interval seconds ago. Each time the complexity 1 is too slow again
+    right after being tried, the wait before the next try doubles, up to 8
+    times retry_interval.
+
+    An instance that starts processing has to detect the palms again, so
+    while all the hands stay in view and the hand tracking only tracks them,
+    the switch waits until a hand leaves the view, when the detection would
+    run anyway. Only a time above the time per frame by more than a half
+    switches right away. On a switch, the new instance processes the
+    current frame before taking over, so it doesn't track the hands from the
+    old frame it last processed.
+
+    Params:
+        mp_hands = mp.solutions.hands
+        options = the arguments of mp_hands.Hands besides the model_complexity
+        target_fps = the frame rate whose time per frame the hand tracking
+        must fit
+        patience = number of calls in a row beyond the limits before a switch
+        headroom = fraction of the time per frame that the estimated time of
+        the complexity 1 must fit before it's tried
+        retry_interval = seconds after a switch to the complexity 0 before
+        the complexity 1 can be tried again
+        stable_frames = number of frames with all the hands in view after
+        which only tracking is assumed to run
+        verbose = if True each switch is printed
+        clock = function that gives the time in seconds
+    """
+    def __init__(self, mp_hands, options, target_fps=30, patience=15, headroom=0.8, retry_interval=10, stable_frames=30, verbose=True, clock=time.perf_counter):
+        self.instances = {complexity: mp_hands.Hands(model_complexity=complexity, **options) for complexity in (0, 1)}
+        self.max_num_hands = options.get('max_num_hands', 2)
+        self.budget = 1/target_fps
+        self.patience = patience
+        self.headroom = headroom
+        self.retry_interval = retry_interval
+        self.stable_frames = stable_frames
+        self.verbose = verbose
+        self.clock = clock
+
+        self.complexity = 1
+        self.warm = False
+        # Time of the process call of each complexity, in seconds, and the
+        # ratio between the complexity 1 and 0, assumed 2 until measured
+        self.cost = {0: None, 1: None}
+        self.ratio = COMPLEXITY_RATIO
+        self.calls = 0
+        self.confidence = None
+        self.over = 0
+        self.under = 0
+        self.in_view = 0
+        # Moments of the last switches, for the wait before trying again
+        self.downgraded_at = None
+        self.upgraded_at = None
+        self.retry_wait = retry_interval
+        self.frames = {0: 0, 1: 0}
+        self.switches = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        for instance in self.instances.values():
+            instance.close()
+
+    def process(self, image):
+        """
+        Params:
+            image = the RGB image, as given to mp.solutions.hands.Hands.process
+        Output:
+            results: the output of the process of the instance in use
+        """
+        if not self.warm:
+            # The standby instance loads its model with the first frame
+            self.instances[1 - self.complexity].process(image)
+            self.warm = True
+
+        start = self.clock()
+        results = self.instances[self.complexity].process(image)
+        elapsed = self.clock() - start
+        self.frames[self.complexity] += 1
+        self.calls += 1
+        # The first call of an instance loads its model or detects the hands 
+        # again, so it isn't part of its time
+        if self.calls > 1:
+            cost = self.cost[self.complexity]
+            self.cost[self.complexity] = elapsed if cost is None else 0.9*cost + 0.1*elapsed
+
+        scores = [handedness.classification[0].score for handedness in (results.multi_handedness or [])]
+        self.confidence = sum(scores)/len(scores) if scores else None
+        self.in_view = self.in_view + 1 if len(scores)==self.max_num_hands else 0
+        self.update(image)
+        return results
+
+    def update(self, image):
+        # Decides the complexity of the next frame from the time measured
+        cost = self.cost[self.complexity]
+        if cost is None:
+            return
+        if self.complexity==1:
+            self.over = self.over + 1 if cost > self.budget else 0
+            if self.over >= self.patience:
+                self.switch(0, image)
+            return
+
+        # The ratio is measured once both complexities ran
+        if self.cost[1] is not None and self.calls==self.patience:
+            self.ratio = max(1.0, self.cost[1]/cost)
+        low_confidence = self.confidence is not None and self.confidence < LOW_CONFIDENCE
+        limit = self.budget if low_confidence else self.budget*self.headroom
+        self.under = self.under + 1 if cost*self.ratio < limit else 0
+        retry = self.downgraded_at is None or self.clock() - self.downgraded_at >= self.retry_wait
+        if self.under >= self.patience and retry:
+            self.switch(1, image)
+
+    def switch(self, complexity, image):
+        cost = self.cost[self.complexity]
+        # While all the hands are tracked, a switch would make the other
+        # instance detect them again, so it waits unless the time is far off
+        if self.in_view >= self.stable_frames and cost < self.budget*1.5:
+            return
+        reason = f'{cost*1000:.1f} ms per frame, budget {self.budget*1000:.1f} ms'
+        if self.confidence is not None:
+            reason += f', confidence {self.confidence:.2f}'
+        self.switches.append((self.complexity, complexity, reason))
+        if self.verbose:
+            print(f'Hand tracking: model_complexity {self.complexity} -> {complexity} ({reason})')
+
+        now = self.clock()
+        if complexity==0:
+            if self.upgraded_at is not None and now - self.upgraded_at < self.retry_wait:
+                self.retry_wait = min(2*self.retry_wait, 8*self.retry_interval)
+            else:
+                self.retry_wait = self.retry_interval
+            self.downgraded_at = now
+        else:
+            self.upgraded_at = now
+
+        # The new instance last processed an old frame, so it processes the 
+        # current one to track the hands from where they are now
+        self.instances[complexity].process(image)
+        self.complexity = complexity
+        self.over = 0
+        self.under = 0
+        self.calls = 0
+        # The time of the new complexity is measured from the start
+        self.cost[complexity] = None
+
+    def summary(self):
+        frames = self.frames[0] + self.frames[1]
+        share = self.frames[1]/frames if frames else 0.0
+        return (
+            f'Hand tracking: model_complexity 1 in {self.frames[1]} of {frames} frames ({share:.0%}), '
+            f'{len(self.switches)} switches, ending in model_complexity {self.complexity}'
+        )
+
+def create_hands(mp_hands, args):
+    """
+    Params:
+        mp_hands = mp.solutions.hands
+        args = the output of helpers.get_args
+    Output:
+        hands: an AdaptiveHands if --adaptive_complexity is 1, otherwise a
+        mp_hands.Hands with the --model_complexity given
+    """
+    options = dict(
+        static_image_mode=False,
+        max_num_hands=2,
+        min_detection_confidence=args.min_detection_confidence,
+        min_tracking_confidence=args.min_tracking_confidence
+    )
+    if args.adaptive_complexity==1:
+        print(f'Hand tracking: adaptive model_complexity, starting in 1, target {args.target_fps:.1f} FPS')
+        return AdaptiveHands(mp_hands, options, target_fps=args.target_fps, patience=args.complexity_patience)
+    return mp_hands.Hands(model_complexity=args.model_complexity, **options)
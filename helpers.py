@@ -1,9 +1,19 @@
-from itertools import chain
-import cv2
+import csv
 import numpy as np
-import mediapipe as mp
 import argparse
 
+# Index of each joint of the hand in the results.multi_hand_landmarks[hand_index].landmark 
+# list, the same of mp.solutions.hands.HandLandmark. It's kept here so the helpers 
+# don't need to import mediapipe, which is slow to import
+HAND_LANDMARKS = [
+    'WRIST', 'THUMB_CMC', 'THUMB_MCP', 'THUMB_IP', 'THUMB_TIP',
+    'INDEX_FINGER_MCP', 'INDEX_FINGER_PIP', 'INDEX_FINGER_DIP', 'INDEX_FINGER_TIP',
+    'MIDDLE_FINGER_MCP', 'MIDDLE_FINGER_PIP', 'MIDDLE_FINGER_DIP', 'MIDDLE_FINGER_TIP',
+    'RING_FINGER_MCP', 'RING_FINGER_PIP', 'RING_FINGER_DIP', 'RING_FINGER_TIP',
+    'PINKY_MCP', 'PINKY_PIP', 'PINKY_DIP', 'PINKY_TIP'
+]
+HAND_LANDMARK_INDEX = {joint: index for index, joint in enumerate(HAND_LANDMARKS)}
+
 def get_coordinates(joint, hand_index, results, video_width, video_height):
     """
     Params:
@@ -23,12 +33,11 @@ def get_coordinates(joint, hand_index, results, video_width, video_height):
             - x -> x axis coordinate in pixel 
             - y -> y axis coordinate in pixel
     """
-    normalized_coordinates = results.multi_hand_landmarks[hand_index].landmark[mp.solutions.hands.HandLandmark[joint]]
-    coordinates = tuple(
-                      np.multiply(
-                          [normalized_coordinates.x, normalized_coordinates.y],
-                          [video_width,video_height]
-                      ).astype(int)
+    normalized_coordinates = results.multi_hand_landmarks[hand_index].landmark[HAND_LANDMARK_INDEX[joint]]
+    # Truncated to whole pixels with plain floats, without numpy temporaries
+    coordinates = (
+                      int(normalized_coordinates.x*video_width),
+                      int(normalized_coordinates.y*video_height)
                   )
     return coordinates
 
@@ -77,6 +86,8 @@ def draw_normalized_coordinates(image, coordinates, normalized_coordinates):
     Outputs:
         - handedness = if the hand is 'left' or 'right'
     """
+    import cv2
+
     for coordinate, normalized_coordinate in zip(coordinates,normalized_coordinates):    
         norm_x, norm_y = normalized_coordinate
         image = cv2.putText(
@@ -91,7 +102,115 @@ def draw_normalized_coordinates(image, coordinates, normalized_coordinates):
         )
     return image 
 
-def pre_process_hand_landmarks(hand_index, results, video_width, video_height):
+def draw_sample_counter(image, counts, gesture_registry, active_label=None, recording=False):
+    """
+    Params:
+        image = the image to draw the counter
+        counts = dictionary with the number of samples saved of each label
+        gesture_registry = the labels.GestureRegistry with the gesture names
+        active_label = the label being recorded, highlighted in the counter
+        recording = if the record mode is on
+    
+    Outputs:
+        - image = the image with the number of samples of each gesture in the 
+        top right corner and, when recording, the label being recorded
+    """
+    import cv2
+
+    width = image.shape[1]
+    lines = []
+    for record in gesture_registry:
+        lines.append((record.label, f'{record.label} {record.gesture}: {counts.get(record.label, 0)}'))
+    # Labels saved that aren't in the gesture-label.csv
+    for label in sorted(set(counts) - {record.label for record in gesture_registry}):
+        lines.append((label, f'{label}: {counts[label]}'))
+
+    for line_index, (label, text) in enumerate(lines):
+        active = recording and label==active_label
+        image = cv2.putText(
+            img = image, 
+            text = text,
+            org = (width - 180, 25 + 20*line_index), 
+            fontFace = cv2.FONT_HERSHEY_SIMPLEX,
+            fontScale = 0.5, 
+            color = (255, 0, 0) if active else (0, 0, 0), #RGB
+            thickness = 2 if active else 1, 
+            lineType = cv2.LINE_AA
+        )
+    if recording:
+        image = cv2.putText(
+            img = image, 
+            text = f'REC {active_label}',
+            org = (50, 80), 
+            fontFace = cv2.FONT_HERSHEY_SIMPLEX,
+            fontScale = 0.7, 
+            color = (255, 0, 0), #RGB
+            thickness = 2, 
+            lineType = cv2.LINE_AA
+        )
+    return image 
+
+def get_hand_landmarks_array(hand_index, results, out=None):
+    """
+    Params:
+        hand_index = the positional index of the hand identified in the 
+        results.multi_hand_landmarks list. If two hands were detected 
+        for example, the hand in the second position of the array will 
+        have index 1, and the first index 0
+        results = the output of mp.solutions.hands.Hands(...).process(image)
+        out = C contiguous array with shape (21, 3) that receives the 
+        coordinates, e.g. a row of a buffer reused every frame. The float32 
+        dtype keeps the mediapipe coordinates exactly. If None a new float64 
+        array is created
+    Output:
+        hand_landmarks_array: array with shape (21, 3) containing the 
+        normalized x, y and z coordinates of each joint, ordered by the 
+        joint index. It's out when given.
+    """
+    if out is None:
+        out = np.empty((21, 3))
+    # The coordinates are written one by one, without building a list of tuples
+    values = out.reshape(-1)
+    position = 0
+    for coordinates in results.multi_hand_landmarks[hand_index].landmark:
+        values[position] = coordinates.x
+        values[position+1] = coordinates.y
+        values[position+2] = coordinates.z
+        position += 3
+    return out
+
+def pre_process_landmarks_batch(landmarks, video_width=1, video_height=1):
+    """
+    Params:
+        landmarks = array with shape (N, 21, 2) or (N, 21, 3) with the 
+        normalized coordinates of N hands (or N frames of the same hand), 
+        as returned by get_hand_landmarks_array. The z coordinate, if 
+        present, is ignored
+        video_width = the width of the video output. Usually gotten from 
+        cap.get(cv2.CAP_PROP_FRAME_WIDTH) 
+        video_height = the height of the video output. Usually gotten from 
+        cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+    Output:
+        processed_landmarks: array with shape (N, 42) where each row is the 
+        same output pre_process_hand_landmarks gives for that hand, computed 
+        for all the rows at once (wrist translation and min-max normalization 
+        are done per row).
+    """
+    # Scale the x and y coordinates to pixels
+    coordinates = np.asarray(landmarks, dtype=np.float64)[:, :, :2] * (video_width, video_height)
+
+    # Translate the coordinates of each hand making its wrist the origin
+    translated_coordinates = coordinates - coordinates[:, :1, :]
+
+    # Flat each hand and normalize its coordinates using the min-max normalization
+    flatted_coordinates = translated_coordinates.reshape(len(translated_coordinates), -1)
+    coordinates_min = flatted_coordinates.min(axis=1, keepdims=True)
+    coordinates_max = flatted_coordinates.max(axis=1, keepdims=True)
+    processed_landmarks = (flatted_coordinates-coordinates_min)/(coordinates_max-coordinates_min)
+
+    return processed_landmarks
+
+def pre_process_hand_landmarks(hand_index, results, video_width, video_height, out=None):
     """
     Params:
         hand_index = the positional index of the hand identified in the 
@@ -103,6 +222,8 @@ def pre_process_hand_landmarks(hand_index, results, video_width, video_height):
         cap.get(cv2.CAP_PROP_FRAME_WIDTH) 
         video_height = the height of the video output. Usually gotten from 
         cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        out = array that receives the landmarks of the hand, see 
+        get_hand_landmarks_array
     Output:
         processed_hand_landmarks: flatten, normalized and traslated coordinates
         that will be used as input for the MLP model. Is an array with 42 points, 
@@ -110,44 +231,253 @@ def pre_process_hand_landmarks(hand_index, results, video_width, video_height):
         thumb_cmc.x, thumb_cmc.y, ..., pinky_dip.x, pinky_dip.y, pinky_dip.x, 
         pinky_dip.y].
     """
-    # Extract the x and y coordinates from the results
-    hand_landmarks_coordinates = []
-    for coordinates in results.multi_hand_landmarks[hand_index].landmark:
-        x_coord = coordinates.x * video_width
-        y_coord = coordinates.y * video_height
-        hand_landmarks_coordinates.append((x_coord, y_coord))
-
-    # Translate the coordinates making the wrist coordinates the origin
-    hand_landmarks_translated_coordinates = []
-    for idx, coordinate_pair in enumerate(hand_landmarks_coordinates):
-        if idx==0:
-            base_coordinate_pair = coordinate_pair
-            hand_landmarks_translated_coordinates.append((0,0))
-        else:
-            translated_coordinate_pair = np.subtract(coordinate_pair, base_coordinate_pair)
-            hand_landmarks_translated_coordinates.append(tuple(translated_coordinate_pair))
-        
-    # Flat array and normalize all coordinates using the min-max normalization   
-    flatted_hand_landmarks_translated_coordinates = list(chain.from_iterable(hand_landmarks_translated_coordinates))
-    array = np.array(flatted_hand_landmarks_translated_coordinates)
-    processed_hand_landmarks = (array-array.min())/(array.max()-array.min())
+    # Extract the coordinates from the results and process them as a batch of one hand
+    hand_landmarks_array = get_hand_landmarks_array(hand_index, results, out)
+    processed_hand_landmarks = pre_process_landmarks_batch(hand_landmarks_array[np.newaxis], video_width, video_height)[0]
     
     return processed_hand_landmarks
 
-def get_args():
+def get_pinch_distance(hand_index, results, video_width, video_height):
     """
+    Params:
+        hand_index = the positional index of the hand identified in the 
+        results.multi_hand_landmarks list. If two hands were detected 
+        for example, the hand in the second position of the array will 
+        have index 1, and the first index 0
+        results = the output of mp.solutions.hands.Hands(...).process(image)
+        video_width = the width of the video output. Usually gotten from 
+        cap.get(cv2.CAP_PROP_FRAME_WIDTH) 
+        video_height = the height of the video output. Usually gotten from 
+        cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+    Output:
+        (joints_coordinates, relative_distance_thumb_index)
+            - joints_coordinates -> dictionary with the pixel coordinates of the 
+            THUMB_TIP and INDEX_FINGER_TIP, e.g. {'THUMB_TIP': {'x': 10, 'y': 20}, ...}
+            - relative_distance_thumb_index -> the distance between the thumb tip 
+            and the index finger tip relative to the distance between the wrist and 
+            the index finger tip, with an offset and limited between 0 and 1
+    """
+    from kinematics import pinch
+
+    # Computed from the array of the landmarks of the hand, see kinematics.pinch
+    pinch_points, relative_distance_thumb_index = pinch(get_hand_landmarks_array(hand_index, results), video_width, video_height)
+    joints_coordinates = {
+        joint: {'x': x, 'y': y} for joint, (x, y) in zip(['THUMB_TIP', 'INDEX_FINGER_TIP'], pinch_points.tolist())
+    }
+    relative_distance_thumb_index = float(relative_distance_thumb_index)
+
+    return joints_coordinates, relative_distance_thumb_index
+
+def load_gesture_labels(path='data/gesture-label.csv'):
+    """
+    Params:
+        path = the csv file mapping the gestures to numbers, with the Label 
+        and Gesture columns
+    Output:
+        gesture_labels: dictionary mapping each label number to its gesture, 
+        e.g. {0: 'Pulso', 1: 'Polegar', ...}
+    """
+    with open(path, newline='', encoding='latin1') as file:
+        return {int(row['Label']): row['Gesture'] for row in csv.DictReader(file)}
+
+def get_args(unsupported=()):
+    """
+    Params:
+        unsupported = names of the arguments the script doesn't use, which
+        are rejected when given instead of silently ignored
     Output:
         args: object with the attribute device capturing the int number
         of the device passed by the user when executing the python script. 
         E.g. of usage: 
         $ python3 print-args.py --device 0 
         args.device = 0
+        The other attributes are:
+            - arduino_mode -> 1 to drive the servos through the Arduino, 2 to 
+            drive them through a fake board that only counts the writes
+            - port -> the serial port the Arduino is connected, e.g. 'COM3' 
+            or '/dev/ttyACM0'
+            - servo_deadband -> minimum change, in degrees, for a new angle to 
+            be written to a servo
+            - servo_rate -> maximum number of writes per second to each servo, 
+            0 for no limit
+            - pipeline -> 'serial' to run capture, inference and rendering one 
+            after the other in the same thread, or 'threaded' to run each of 
+            them in its own thread
+            - queue_size -> the size of the queues between the stages of the 
+            threaded pipeline. The oldest frame is dropped when a queue is full
+            - timing -> 1 to show the FPS and the p50/p95/p99 latency of each 
+            stage of the frame loop over the image
+            - timing_output -> path of a .csv or .jsonl file that will receive 
+            the timing of each frame
+            - timing_window -> how many frames are used to compute the FPS and 
+            the percentiles
+            - input -> video file, directory of images or .npz landmark dump 
+            read instead of the webcam
+            - headless -> if given nothing is drawn or displayed, the same as 
+            display 'off'
+            - display -> 'full' draws the landmarks, the gesture and the pinch 
+            bar, 'minimal' draws only the gesture and the pinch bar and 'off' 
+            doesn't display anything
+            - display_fps -> maximum number of frames displayed per second, 0 
+            for no limit. The frames are still analysed at the camera rate
+            - output -> path of a .jsonl file that will receive the gesture, 
+            module and servo command of each frame
+            - dump_landmarks -> path of a .npz file that will receive the hand 
+            landmarks of each frame, which can be used later as the input
+            - record_session -> path of a .session file that receives the 
+            landmarks, gesture predicted and servo command of every frame, 
+            which can be given later as the input
+            - model -> the gesture classifier, a .npz exported by export-model.py 
+            or the .pkl of the sklearn model
+            - profile_startup -> if given, prints how long each step of the 
+            startup took, from the imports to the first frame processed
+            - gesture_vote -> 'none' to use the gesture predicted in each frame, 
+            'majority' to use the most frequent of the last vote_window frames or 
+            'confidence' to weight each frame by the probability of its gesture
+            - vote_window -> number of frames of the gesture vote
+            - gesture_hysteresis -> number of frames in a row a new gesture must 
+            be given before the articulation selected changes
+            - pinch_filter -> 'none', 'ema' or 'one_euro', the filter of the 
+            distance between the right thumb and index
+            - ema_alpha -> weight of the new distance in the 'ema' filter
+            - one_euro_min_cutoff -> cutoff frequency, in Hz, of the 'one_euro' 
+            filter when the hand is still. Lower values remove more jitter
+            - one_euro_beta -> how much the 'one_euro' cutoff grows with the speed 
+            of the hand. Higher values reduce the lag
+            - process_width -> if greater than 0, the frames are downsized to this 
+            width before the hand tracking
+            - roi -> 1 to give the hand tracking only the region around the hands 
+            of the previous frames
+            - roi_padding -> padding of the region on each side of the hands, 
+            relative to the largest side of their bounding box
+            - roi_refresh -> number of frames after which the whole frame is 
+            processed again, to find hands outside the region
+            - skip_mode -> 'none' to run the hand tracking in every frame, 'fixed' 
+            to run it every detect_interval frames or 'adaptive' to choose the 
+            interval so the average time per frame fits frame_budget
+            - detect_interval -> frames between the hand tracking runs of the 
+            'fixed' skip_mode
+            - frame_budget -> time per frame, in milliseconds, of the 'adaptive' 
+            skip_mode
+            - max_detect_interval -> maximum interval of the 'adaptive' skip_mode
+            - skip_tracker -> 'flow' to move the landmarks in the frames skipped 
+            with the optical flow, or 'linear' to extrapolate their speed
+            - cache_distance -> if greater than 0, the gesture predicted is 
+            reused while the pre processed coordinates of the left hand move less 
+            than this distance from the ones last predicted
+            - cache_max_age -> maximum number of frames in a row the gesture 
+            predicted is reused before predicting again
+            - training_data -> directory of the sample store that receives the 
+            samples saved by the collect-train-data.py
+            - record_stride -> in the record mode of the collect-train-data.py, 
+            saves one of every record_stride frames with a hand
+            - min_sample_distance -> in the record mode of the 
+            collect-train-data.py, discards the samples closer than this to the 
+            last sample saved with the same label. 0 keeps every sample
+            - actuators -> outputs of the servo commands, published to each one 
+            by an event bus instead of written by the arduino_mode, so both 
+            can't be given together: 
+            firmata:<serial port>, firmata:fake, udp:<host>:<port>, 
+            tcp:<host>:<port>, file:<path> or memory
+            - event_max_age -> the commands older than this, in milliseconds, 
+            when an actuator is ready to receive them are dropped
+            - actuation -> 'single' moves the servo of the articulation selected 
+            by the left hand gesture with the pinch of the right hand, 'multi' 
+            moves the servo of each finger with the flexion of the same finger 
+            of the right hand
+            - reuse_buffers -> 1 to convert the frames and extract the landmarks 
+            into buffers allocated once and reused every frame, 0 to allocate 
+            new arrays every frame
+            - trace_allocations -> 1 to measure with tracemalloc the memory 
+            allocated in each frame, printed when the script ends
+            - model_complexity -> 0 or 1, the complexity of the hand landmark 
+            model of mediapipe. 0 is faster and 1 more accurate
+            - adaptive_complexity -> 1 to switch between the model_complexity 0 
+            and 1 while running, keeping the time of the hand tracking within 
+            the time per frame of target_fps
+            - target_fps -> the frame rate whose time per frame the hand 
+            tracking must fit with the adaptive_complexity
+            - complexity_patience -> number of frames in a row the time of the 
+            hand tracking must be off before the adaptive_complexity switches
+            - min_detection_confidence -> minimum confidence of the palm 
+            detection for a hand to be detected
+            - min_tracking_confidence -> minimum confidence of the tracking of 
+            a hand, below which the palm detection runs again
+            - streams -> in the serve-cameras.py, the sources of the cameras, 
+            each one a webcam number or the path of a video, a directory of 
+            images or a landmark dump
+            - ports -> in the serve-cameras.py, the port of the Arduino of each 
+            stream, in the same order as the streams
+            - report_interval -> in the serve-cameras.py, seconds between the 
+            reports with the FPS and latency of each stream
     """
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--device", type=int, default=0)
     parser.add_argument("--arduino_mode", type=int, default=0)
+    parser.add_argument("--port", type=str, default='COM3')
+    parser.add_argument("--servo_deadband", type=float, default=1)
+    parser.add_argument("--servo_rate", type=float, default=50)
+    parser.add_argument("--pipeline", choices=['serial', 'threaded'], default='serial')
+    parser.add_argument("--queue_size", type=int, default=1)
+    parser.add_argument("--timing", type=int, default=0)
+    parser.add_argument("--timing_output", type=str, default=None)
+    parser.add_argument("--timing_window", type=int, default=120)
+    parser.add_argument("--input", type=str, default=None)
+    parser.add_argument("--headless", action='store_true')
+    parser.add_argument("--display", choices=['full', 'minimal', 'off'], default='full')
+    parser.add_argument("--display_fps", type=float, default=30)
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--dump_landmarks", type=str, default=None)
+    parser.add_argument("--record_session", type=str, default=None)
+    parser.add_argument("--model", type=str, default='model/clf.npz')
+    parser.add_argument("--profile_startup", "--profile-startup", action='store_true')
+    parser.add_argument("--gesture_vote", choices=['none', 'majority', 'confidence'], default='none')
+    parser.add_argument("--vote_window", type=int, default=5)
+    parser.add_argument("--gesture_hysteresis", type=int, default=1)
+    parser.add_argument("--pinch_filter", choices=['none', 'ema', 'one_euro'], default='none')
+    parser.add_argument("--ema_alpha", type=float, default=0.5)
+    parser.add_argument("--one_euro_min_cutoff", type=float, default=1.0)
+    parser.add_argument("--one_euro_beta", type=float, default=0.1)
+    parser.add_argument("--process_width", type=int, default=0)
+    parser.add_argument("--roi", type=int, default=0)
+    parser.add_argument("--roi_padding", type=float, default=0.25)
+    parser.add_argument("--roi_refresh", type=int, default=30)
+    parser.add_argument("--skip_mode", choices=['none', 'fixed', 'adaptive'], default='none')
+    parser.add_argument("--detect_interval", type=int, default=2)
+    parser.add_argument("--frame_budget", type=float, default=33)
+    parser.add_argument("--max_detect_interval", type=int, default=5)
+    parser.add_argument("--skip_tracker", choices=['flow', 'linear'], default='flow')
+    parser.add_argument("--cache_distance", type=float, default=0)
+    parser.add_argument("--cache_max_age", type=int, default=10)
+    parser.add_argument("--training_data", type=str, default='data/training-data')
+    parser.add_argument("--record_stride", type=int, default=1)
+    parser.add_argument("--min_sample_distance", type=float, default=0)
+    parser.add_argument("--reuse_buffers", type=int, default=1)
+    parser.add_argument("--trace_allocations", type=int, default=0)
+    parser.add_argument("--model_complexity", type=int, choices=[0, 1], default=1)
+    parser.add_argument("--adaptive_complexity", type=int, default=0)
+    parser.add_argument("--target_fps", type=float, default=30)
+    parser.add_argument("--complexity_patience", type=int, default=15)
+    parser.add_argument("--min_detection_confidence", type=float, default=0.8)
+    parser.add_argument("--min_tracking_confidence", type=float, default=0.5)
+    parser.add_argument("--actuators", type=str, nargs='+', default=None)
+    parser.add_argument("--event_max_age", type=float, default=250)
+    parser.add_argument("--actuation", choices=['single', 'multi'], default='single')
+    parser.add_argument("--streams", type=str, nargs='+', default=['0'])
+    parser.add_argument("--ports", type=str, nargs='+', default=[])
+    parser.add_argument("--report_interval", type=float, default=5)
 
     args = parser.parse_args()
 
+    # The actuators replace the arduino_mode, which would be silently ignored
+    if args.actuators and args.arduino_mode in (1, 2):
+        parser.error(
+            '--actuators replaces --arduino_mode and --port, give the Arduino '
+            'as an actuator instead, e.g. --actuators firmata:COM3 or firmata:fake'
+        )
+    for name in unsupported:
+        if getattr(args, name)!=parser.get_default(name):
+            parser.error(f'--{name} is not supported by this script')
+
     return args
\ No newline at end of file
@@ -0,0 +1,120 @@
+import numpy as np
+from helpers import HAND_LANDMARK_INDEX
+
+# Every function works on the landmarks of a hand as an array with shape
+# (21, 3), as returned by helpers.get_hand_landmarks_array, or on a batch of
+# hands with shape (N, 21, 3), so the landmarks are extracted once per hand
+# and feed both the gesture and the actuation
+
+WRIST = HAND_LANDMARK_INDEX['WRIST']
+THUMB_TIP = HAND_LANDMARK_INDEX['THUMB_TIP']
+INDEX_FINGER_TIP = HAND_LANDMARK_INDEX['INDEX_FINGER_TIP']
+
+# Offset subtracted from the pinch ratio, so the fingers touching give 0
+PINCH_OFFSET = 0.08
+
+# Joints of each finger from the wrist to the tip. The flexion of a finger is
+# given by the bend at its three middle joints
+FINGERS = ['THUMB', 'INDEX_FINGER', 'MIDDLE_FINGER', 'RING_FINGER', 'PINKY']
+FINGER_JOINTS = np.array([
+    [WRIST] + [HAND_LANDMARK_INDEX[f'THUMB_{joint}'] for joint in ('CMC', 'MCP', 'IP', 'TIP')]
+] + [
+    [WRIST] + [HAND_LANDMARK_INDEX[f'{finger}_{joint}'] for joint in ('MCP', 'PIP', 'DIP', 'TIP')]
+    for finger in FINGERS[1:]
+])
+# Sum of the bends of the joints of each finger, in radians, when it's fully
+# flexed. The thumb bends less than the other fingers
+MAX_FLEXION = np.radians([150, 250, 250, 250, 250])
+
+# Articulation of the articulation_dict driven by each finger in the
+# multi-articulation mode, in the order of FINGERS
+FINGER_ARTICULATIONS = ['Polegar', 'Indicador', 'Medio', 'Anelar', 'Mindinho']
+
+def to_pixels(landmarks, video_width, video_height):
+    """
+    Params:
+        landmarks = array with shape (..., 21, 3) with the normalized coordinates
+        video_width = the width of the video output
+        video_height = the height of the video output
+    Output:
+        array with shape (..., 21, 2) with the x and y coordinates in pixels
+    """
+    return np.asarray(landmarks, dtype=np.float64)[..., :2]*(video_width, video_height)
+
+def bounding_box(landmarks, video_width, video_height):
+    """
+    Params:
+        landmarks = array with shape (21, 3) with the normalized coordinates
+        video_width = the width of the video output
+        video_height = the height of the video output
+    Output:
+        (x_min, y_min, x_max, y_max) of the hand, in pixels
+    """
+    pixels = to_pixels(landmarks, video_width, video_height).astype(int)
+    x_min, y_min = pixels.min(axis=0)
+    x_max, y_max = pixels.max(axis=0)
+    # Limited to the frame on the same side the hand left it
+    return int(min(x_min, video_width)), int(min(y_min, video_height)), int(max(x_max, 0)), int(max(y_max, 0))
+
+def pinch(landmarks, video_width, video_height):
+    """
+    Params:
+        landmarks = array with shape (..., 21, 3) with the normalized coordinates
+        video_width = the width of the video output
+        video_height = the height of the video output
+    Output:
+        (pinch_points, pinch_ratio)
+            - pinch_points -> integer array with shape (..., 2, 2) with the pixel
+            coordinates of the THUMB_TIP and INDEX_FINGER_TIP
+            - pinch_ratio -> the distance between the thumb tip and the index
+            finger tip relative to the distance between the wrist and the index
+            finger tip, with an offset and limited between 0 and 1
+    """
+    pixels = to_pixels(landmarks, video_width, video_height)
+    pinch_points = pixels[..., [THUMB_TIP, INDEX_FINGER_TIP], :].astype(int)
+
+    # The tips are taken in whole pixels, as they are drawn
+    thumb_index = pinch_points[..., 0, :] - pinch_points[..., 1, :]
+    wrist_index = pixels[..., WRIST, :] - pinch_points[..., 1, :]
+    distance_thumb_index = np.sqrt(np.sum(thumb_index**2, axis=-1))
+    distance_wrist_index = np.sqrt(np.sum(wrist_index**2, axis=-1))
+
+    pinch_ratio = np.clip(distance_thumb_index/distance_wrist_index - PINCH_OFFSET, 0, 1)
+    return pinch_points, pinch_ratio
+
+def finger_flexion(landmarks, video_width, video_height):
+    """
+    Params:
+        landmarks = array with shape (..., 21, 3) with the normalized coordinates
+        video_width = the width of the video output
+        video_height = the height of the video output
+    Output:
+        array with shape (..., 5) with the flexion of each finger, in the order
+        of FINGERS, from 0 (straight) to 1 (fully flexed). It's the sum of the
+        angles the finger bends at its joints, relative to MAX_FLEXION
+    """
+    # The depth has the scale of the image width
+    points = np.asarray(landmarks, dtype=np.float64)*(video_width, video_height, video_width)
+    chains = points[..., FINGER_JOINTS, :]
+    segments = chains[..., 1:, :] - chains[..., :-1, :]
+    lengths = np.sqrt(np.sum(segments**2, axis=-1))
+    lengths = np.maximum(lengths, 1e-9)
+
+    # Angle between each segment and the next one, 0 when they are aligned
+    cosines = np.sum(segments[..., :-1, :]*segments[..., 1:, :], axis=-1)/(lengths[..., :-1]*lengths[..., 1:])
+    bends = np.arccos(np.clip(cosines, -1, 1))
+    return np.clip(bends.sum(axis=-1)/MAX_FLEXION, 0, 1)
+
+def flexion_commands(flexion, articulation_dict):
+    """
+    Params:
+        flexion = the output of finger_flexion for one hand
+        articulation_dict = dictionary with the pin and factor of each articulation
+    Output:
+        list with the (pin, angle) of the servo of each finger, moved as the
+        single articulation mode moves it with the module of the pinch
+    """
+    return [
+        (articulation_dict[articulation]['pin'], float(finger)*90*articulation_dict[articulation]['fator'])
+        for articulation, finger in zip(FINGER_ARTICULATIONS, flexion)
+    ]
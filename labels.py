@@ -0,0 +1,117 @@
+from collections import namedtuple
+from helpers import load_gesture_labels
+
+# Everything needed to act on a gesture predicted by the model: the label
+# number, the gesture name shown in the image and, when the gesture controls
+# an articulation, the pin of its servo and the factor applied to the angle
+GestureRecord = namedtuple('GestureRecord', ['label', 'gesture', 'pin', 'fator'])
+
+# Dictionary containing the pins of the servo of each articulation and the factor
+# ("fator") applied to its angle, used by the apply-model.py and serve-cameras.py
+ARTICULATION_DICT = {
+    'Mindinho' : {
+        'pin': 2,
+        'fator': 1.3
+    },
+    'Anelar' : {
+        'pin': 3,
+        'fator': 1
+    },
+    'Medio' : {
+        'pin': 4,
+        'fator': 1.4
+    },
+    'Indicador' : {
+        'pin': 5,
+        'fator': 1.1
+    },
+    'Polegar' : {
+        'pin': 6,
+        'fator': 1
+    },
+    'Pulso' : {
+        'pin': 7,
+        'fator': 1
+    },
+}
+
+class GestureRegistry:
+    """
+    Maps the label numbers predicted by the model to their GestureRecord
+    through a list indexed by the label, so each lookup is a single index
+    instead of filtering the gesture-label.csv every frame.
+
+    Params:
+        records = list of GestureRecord
+    """
+    def __init__(self, records):
+        size = max((record.label for record in records), default=-1) + 1
+        self.records = [None]*size
+        for record in records:
+            self.records[record.label] = record
+
+    def __getitem__(self, label):
+        """
+        Params:
+            label = the label number, as predicted by the model
+        Output:
+            the GestureRecord of the label. A KeyError is raised if the label
+            isn't in the gesture-label.csv
+        """
+        if 0 <= label < len(self.records) and self.records[label] is not None:
+            return self.records[label]
+        raise KeyError(label)
+
+    def __contains__(self, label):
+        return 0 <= label < len(self.records) and self.records[label] is not None
+
+    def __iter__(self):
+        return (record for record in self.records if record is not None)
+
+def load_gesture_registry(path='data/gesture-label.csv', articulation_dict=None, classes=None):
+    """
+    Params:
+        path = the csv file mapping the gestures to numbers
+        articulation_dict = dictionary with the pin and factor ('fator') of the
+        servo of each gesture. If None the records have no pin and factor
+        classes = the classes the model predicts, e.g. gesture_classifier.classes_
+    Output:
+        gesture_registry: the GestureRegistry with the gestures of the csv
+
+    A ValueError is raised at startup, instead of failing in the middle of the
+    frame loop, if the model predicts a class that isn't in the csv, if a gesture
+    the model predicts has no articulation or if an articulation isn't a gesture
+    of the csv.
+    """
+    gesture_labels = load_gesture_labels(path)
+    if any(label < 0 for label in gesture_labels):
+        raise ValueError(f'The labels of "{path}" must be non-negative numbers')
+
+    if classes is not None:
+        missing_labels = sorted({int(label) for label in classes} - set(gesture_labels))
+        if missing_labels:
+            raise ValueError(f'The model predicts the labels {missing_labels}, which are not in "{path}"')
+        predicted_labels = {int(label) for label in classes}
+    else:
+        predicted_labels = set(gesture_labels)
+
+    records = []
+    if articulation_dict is not None:
+        missing_gestures = sorted(
+            gesture_labels[label] for label in predicted_labels if gesture_labels[label] not in articulation_dict
+        )
+        if missing_gestures:
+            raise ValueError(f'The gestures {missing_gestures} have no pin in the articulation_dict')
+        unknown_gestures = sorted(set(articulation_dict) - set(gesture_labels.values()))
+        if unknown_gestures:
+            raise ValueError(f'The articulations {unknown_gestures} are not gestures of "{path}"')
+
+    for label, gesture in gesture_labels.items():
+        articulation = (articulation_dict or {}).get(gesture)
+        records.append(GestureRecord(
+            label = label,
+            gesture = gesture,
+            pin = None if articulation is None else articulation['pin'],
+            fator = None if articulation is None else articulation['fator']
+        ))
+    return GestureRegistry(records)
@@ -0,0 +1,228 @@
+import time
+import queue
+import multiprocessing
+from types import SimpleNamespace
+from contextlib import nullcontext
+import numpy as np
+
+def parse_source(source):
+    """
+    Params:
+        source = the webcam number, e.g. '0', or the path of a video file, a
+        directory of images or a .npz landmark dump
+    Output:
+        object with the device and input attributes used by sources.open_capture
+    """
+    if source.isdigit():
+        return SimpleNamespace(device=int(source), input=None)
+    return SimpleNamespace(device=0, input=source)
+
+def analyze_stream_hands(results, video_width, video_height):
+    """
+    Params:
+        results = the output of hands.process(image)
+        video_width = the width of the frame
+        video_height = the height of the frame
+    Output:
+        (features, module)
+            - features -> the pre processed coordinates of the left hand, the
+            input of the gesture classifier, or None if there's no left hand
+            - module -> the module in which the servo will be moved, given by the
+            right hand, or None if there's no right hand
+    """
+    from helpers import get_handedness, get_hand_landmarks_array, pre_process_landmarks_batch
+    from kinematics import pinch
+
+    features = None
+    module = None
+    if results.multi_hand_landmarks:
+        for hand_index in range(len(results.multi_hand_landmarks)):
+            handedness_label = get_handedness(hand_index, results)
+            hand_landmarks_array = get_hand_landmarks_array(hand_index, results)
+            if handedness_label=='Left':
+                features = pre_process_landmarks_batch(hand_landmarks_array[np.newaxis], video_width, video_height)[0]
+            elif handedness_label=='Right':
+                relative_distance_thumb_index = float(pinch(hand_landmarks_array, video_width, video_height)[1])
+                module = 1 - relative_distance_thumb_index
+    return features, module
+
+def camera_worker(stream_index, source, args, output_queue, stop_event):
+    """
+    Params:
+        stream_index = the index of the stream, sent with each message
+        source = the source of the frames, see parse_source
+        args = the output of helpers.get_args, with the options of the hand
+        tracking, see hands_controller.create_hands
+        output_queue = multiprocessing.Queue that receives the messages
+        stop_event = multiprocessing.Event that stops the worker
+
+    Runs in its own process: reads the frames of one camera, runs the hand
+    tracking and sends, for each frame, a message with the features of the
+    left hand and the module of the right hand, so only a few numbers cross
+    the process boundary. The classification is left to the main process,
+    which predicts the frames of all the cameras together. When the stream
+    ends a message with frame None is sent, with the error that stopped the
+    worker, if any.
+    """
+    import cv2
+    from sources import open_capture
+
+    cap = None
+    error = None
+    frame_index = 0
+    try:
+        # Opening the source or loading the model may fail, which must still
+        # send the end message, or the main process would wait for the stream
+        cap, landmark_input = open_capture(parse_source(source))
+        video_width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+        video_height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        if landmark_input:
+            hands = nullcontext()
+        else:
+            import mediapipe as mp
+            from hands_controller import create_hands
+            hands = create_hands(mp.solutions.hands, args)
+
+        with hands:
+            while not stop_event.is_set() and cap.isOpened():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                # Wall clock time, which is the same in every process
+                captured = time.time()
+
+                start = time.perf_counter()
+                if landmark_input:
+                    results = frame
+                else:
+                    image = cv2.flip(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), 1)
+                    image.flags.writeable = False
+                    results = hands.process(image)
+                features, module = analyze_stream_hands(results, video_width, video_height)
+
+                output_queue.put({
+                    'stream': stream_index,
+                    'frame': frame_index,
+                    'captured': captured,
+                    'hands_process': (time.perf_counter() - start)*1000,
+                    'features': features,
+                    'module': module
+                })
+                frame_index += 1
+    except Exception as exception:
+        # Sent with the end message, so the main process reports it
+        error = f'{type(exception).__name__}: {exception}'
+        raise
+    finally:
+        if cap is not None:
+            cap.release()
+        output_queue.put({'stream': stream_index, 'frame': None, 'error': error})
+
+class CameraPool:
+    """
+    Pool with one worker process per camera, see camera_worker.
+
+    Params:
+        sources = list with the source of each stream, see parse_source
+        args = the output of helpers.get_args, whose hand tracking options
+        are used by every worker
+    """
+    def __init__(self, sources, args):
+        self.sources = sources
+        self.output_queue = multiprocessing.Queue()
+        self.stop_event = multiprocessing.Event()
+        self.processes = [
+            multiprocessing.Process(
+                target = camera_worker,
+                args = (stream_index, source, args, self.output_queue, self.stop_event),
+                name = f'camera_{stream_index}',
+                daemon = True
+            )
+            for stream_index, source in enumerate(sources)
+        ]
+        self.running = set(range(len(sources)))
+        self.coalesced = [0]*len(sources)
+        # Error that stopped each stream, if any
+        self.errors = {}
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def collect(self, timeout=0.1):
+        """
+        Params:
+            timeout = seconds to wait for the first message
+        Output:
+            dictionary with the newest message of each stream that sent one
+            since the last call. The older messages of a stream are discarded,
+            so a slow tick never makes a servo act on an old frame
+        """
+        messages = {}
+        self.receive(messages, timeout)
+        # A worker that stopped without sending its end message, e.g. killed
+        # by the system, would be waited forever, so after reading what it
+        # sent before stopping its stream is given up
+        stopped = [stream_index for stream_index in self.running if not self.processes[stream_index].is_alive()]
+        if stopped:
+            self.receive(messages, 0)
+            for stream_index in stopped:
+                if stream_index in self.running:
+                    self.running.discard(stream_index)
+                    self.errors[stream_index] = f'the process stopped with exit code {self.processes[stream_index].exitcode}'
+        return messages
+
+    def receive(self, messages, timeout):
+        # Reads the messages waiting into messages, see collect
+        try:
+            message = self.output_queue.get(timeout=timeout)
+            while True:
+                stream_index = message['stream']
+                if message['frame'] is None:
+                    self.running.discard(stream_index)
+                    if message['error'] is not None:
+                        self.errors[stream_index] = message['error']
+                else:
+                    if stream_index in messages:
+                        self.coalesced[stream_index] += 1
+                    messages[stream_index] = message
+                message = self.output_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def close(self):
+        self.stop_event.set()
+        # The queue is emptied so the workers don't block on it while exiting
+        while any(process.is_alive() for process in self.processes):
+            try:
+                self.output_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for process in self.processes:
+            process.join()
+
+def predict_batch(gesture_classifier, messages, with_confidence=False):
+    """
+    Params:
+        gesture_classifier = the classifier, see classifier.load_classifier
+        messages = the messages of one tick, from CameraPool.collect
+        with_confidence = if True predict_proba is used, to also give the
+        probability of each label predicted
+    Output:
+        dictionary with the (label, confidence) predicted for each stream with
+        a left hand, computed with a single call of the classifier for all the
+        streams. Without with_confidence the confidence is always 1
+    """
+    streams = [stream_index for stream_index, message in messages.items() if message['features'] is not None]
+    if not streams:
+        return {}
+    features = np.stack([messages[stream_index]['features'] for stream_index in streams])
+    if with_confidence:
+        probabilities = gesture_classifier.predict_proba(features)
+        class_indexes = np.argmax(probabilities, axis=1)
+        return {
+            stream_index: (int(gesture_classifier.classes_[class_index]), float(probabilities[row, class_index]))
+            for row, (stream_index, class_index) in enumerate(zip(streams, class_indexes))
+        }
+    labels = gesture_classifier.predict(features)
+    return {stream_index: (int(label), 1) for stream_index, label in zip(streams, labels)}
@@ -0,0 +1,187 @@
+import time
+import numpy as np
+import cv2
+
+# Colors of the overlay, written in RGB as in the rest of the project and
+# reversed to BGR because the overlay is drawn straight in the BGR frame
+BOX_COLOR = (50, 50, 50)
+TEXT_COLOR = (255, 255, 255)
+LANDMARK_COLOR = (1, 190, 255)
+CONNECTION_COLOR = (86, 213, 0)
+JOINT_COLOR = (148, 0, 211)
+PINCH_COLOR = (255, 4, 163)
+
+# Horizontal limits of the bar with the relative distance between the right
+# thumb and index
+BAR_BEGINNING_X = 85
+BAR_END_X = 485
+
+def bgr(color):
+    return color[::-1]
+
+class OverlayRenderer:
+    """
+    Draws the hands analysed by the apply-model.py over the frame and shows it,
+    at most max_fps times per second, independently of the rate in which the
+    frames are analysed and the servo is written.
+
+    The frame is flipped straight into a BGR buffer allocated once, instead of
+    being converted to RGB and back, the DrawingSpec objects are created once,
+    and the border of the pinch bar, which never moves, is rasterized once and
+    copied to the buffer.
+
+    Params:
+        mode = 'full' draws everything, 'minimal' draws only the bounding box
+        and gesture of the left hand and the pinch bar of the right hand
+        max_fps = maximum number of frames displayed per second, 0 for no limit
+        mp_drawing = mp.solutions.drawing_utils, needed by the 'full' mode
+        hand_connections = mp.solutions.hands.HAND_CONNECTIONS, needed by the
+        'full' mode
+    """
+    def __init__(self, mode='full', max_fps=30, mp_drawing=None, hand_connections=None):
+        self.mode = mode
+        self.min_interval = 1/max_fps if max_fps else 0
+        self.last_display = float('-inf')
+        self.buffer = None
+        self.bar_frame_index = None
+        self.mp_drawing = mp_drawing
+        self.hand_connections = hand_connections
+        if mode=='full':
+            self.landmark_drawing_spec = mp_drawing.DrawingSpec(
+                color = bgr(LANDMARK_COLOR),
+                thickness = 2,
+                circle_radius = 4
+            )
+            self.connection_drawing_spec = mp_drawing.DrawingSpec(
+                color = bgr(CONNECTION_COLOR),
+                thickness = 2,
+                circle_radius = 2
+            )
+        self.displayed = 0
+        self.skipped = 0
+
+    def due(self):
+        """
+        Output:
+            True if a frame must be displayed now, respecting max_fps
+        """
+        if time.perf_counter() - self.last_display >= self.min_interval:
+            return True
+        self.skipped += 1
+        return False
+
+    def prepare_buffer(self, frame, shape):
+        """
+        Params:
+            frame = the BGR frame captured, or None to draw on a black image
+            shape = the shape of the black image, used when frame is None
+        Output:
+            the buffer with the frame flipped on horizontal
+        """
+        shape = frame.shape if frame is not None else shape
+        if self.buffer is None or self.buffer.shape!=shape:
+            self.buffer = np.empty(shape, dtype=np.uint8)
+            self.bar_frame_index = None
+        if frame is None:
+            self.buffer.fill(0)
+        else:
+            cv2.flip(frame, 1, dst=self.buffer)
+        return self.buffer
+
+    def draw_bar_frame(self, image):
+        # The border of the pinch bar is rasterized once in a mask and its
+        # pixels are copied to every frame
+        if self.bar_frame_index is None:
+            mask = np.zeros(image.shape[:2], dtype=np.uint8)
+            cv2.rectangle(mask, (BAR_BEGINNING_X, 30), (BAR_END_X, 70), 255, 2)
+            self.bar_frame_index = np.nonzero(mask)
+        image[self.bar_frame_index] = bgr(PINCH_COLOR)
+
+    def draw(self, image, analysis):
+        """
+        Params:
+            image = the BGR buffer given by prepare_buffer
+            analysis = the output of analyze_hands of the apply-model.py
+        Output:
+            image: the image with the landmarks, the gesture predicted and the
+            relative distance between the right thumb and index drawn
+        """
+        full = self.mode=='full'
+        for hand_info in analysis['hands']:
+            # Draw bounding box and gesture only to the left hand
+            if hand_info['handedness']=='Left':
+                x_min, y_min, x_max, y_max = hand_info['bounding_box']
+                cv2.rectangle(image, (x_min-10, y_min-10), (x_max+10, y_max+10), bgr(BOX_COLOR), 2)
+                cv2.rectangle(image, (x_min-10, y_min-10), (x_max+10, y_min-50), bgr(BOX_COLOR), -1)
+
+                # Writing the predicted label to the frame
+                cv2.putText(
+                    img = image,
+                    text = hand_info['gesture'].gesture,
+                    org = (x_min+5, y_min-20),
+                    fontFace = cv2.FONT_HERSHEY_SIMPLEX,
+                    fontScale = 0.7,
+                    color = bgr(TEXT_COLOR),
+                    thickness = 2,
+                    lineType = cv2.LINE_AA
+                )
+
+                if full:
+                    self.mp_drawing.draw_landmarks(
+                        image = image,
+                        landmark_list = hand_info['landmarks'],
+                        connections = self.hand_connections,
+                        landmark_drawing_spec = self.landmark_drawing_spec,
+                        connection_drawing_spec = self.connection_drawing_spec
+                    )
+            elif hand_info['handedness']=='Right':
+                if full:
+                    self.draw_pinch(image, hand_info['pinch_points'])
+
+                self.draw_bar_frame(image)
+
+                # Fill of the bar according to the distance between the thumb
+                # tip and index finger tip
+                relative_distance_thumb_index = hand_info['relative_distance']
+                linear_interpolation = int(BAR_BEGINNING_X + ((BAR_END_X-BAR_BEGINNING_X)*relative_distance_thumb_index))
+                cv2.rectangle(image, (BAR_BEGINNING_X, 30), (linear_interpolation, 70), bgr(PINCH_COLOR), -1)
+
+                # Writing relative distance
+                cv2.putText(
+                    img = image,
+                    text = str(int(relative_distance_thumb_index*100))+' %',
+                    org = (BAR_END_X+15, 55),
+                    fontFace = cv2.FONT_HERSHEY_SIMPLEX,
+                    fontScale = 0.8,
+                    color = bgr(PINCH_COLOR),
+                    thickness = 2,
+                    lineType = cv2.LINE_AA
+                )
+        return image
+
+    def draw_pinch(self, image, pinch_points):
+        # The pixel coordinates of the THUMB_TIP and INDEX_FINGER_TIP, see kinematics.pinch
+        thumb, index = (tuple(point) for point in pinch_points.tolist())
+
+        # Circles with white border in the THUMB_TIP and INDEX_FINGER_TIP
+        for center in (thumb, index):
+            cv2.circle(image, center, 4, bgr(JOINT_COLOR), 2)
+            cv2.circle(image, center, 6, bgr(TEXT_COLOR), 1)
+
+        # Line between them and circle with white border in its center
+        cv2.line(image, thumb, index, bgr(PINCH_COLOR), 2)
+        center = (
+            min(thumb[0], index[0]) + int(abs(thumb[0] - index[0])/2),
+            min(thumb[1], index[1]) + int(abs(thumb[1] - index[1])/2)
+        )
+        cv2.circle(image, center, 6, bgr(JOINT_COLOR), 3)
+        cv2.circle(image, center, 8, bgr(TEXT_COLOR), 1)
+
+    def show(self, image, window_name='Hand Tracking'):
+        cv2.imshow(window_name, image)
+        self.last_display = time.perf_counter()
+        self.displayed += 1
+
+    def summary(self):
+        frames = self.displayed + self.skipped
+        return f'Display: {self.displayed} of {frames} frames displayed'
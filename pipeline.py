@@ -0,0 +1,111 @@
+import threading
+from collections import deque
+
+class LatestQueue:
+    """
+    Bounded queue that drops the oldest item when full, so the consumer
+    always gets the newest data available. It's used to join the stages of
+    the threaded pipeline: if a stage is slower than the one feeding it, the
+    old frames are discarded instead of piling up and delaying the servo.
+
+    Params:
+        maxsize = the maximum number of items kept in the queue
+    """
+    def __init__(self, maxsize=1):
+        self.items = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items)==self.items.maxlen:
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Params:
+            timeout = seconds to wait for an item. If None, wait until an
+            item arrives or the queue is closed
+        Output:
+            the oldest item in the queue, or None if the timeout expired or
+            the queue was closed
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.items or self.closed, timeout)
+            if self.items:
+                return self.items.popleft()
+            return None
+
+    def close(self):
+        # Wake up every consumer waiting in get()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+class CaptureThread(threading.Thread):
+    """
+    Thread that reads frames from a cv2.VideoCapture-like object as fast as
+    it can and puts them in the output queue.
+
+    Params:
+        cap = object with the isOpened() and read() methods, e.g. cv2.VideoCapture
+        output_queue = LatestQueue that will receive the frames
+        stop_event = threading.Event used to stop all the pipeline stages
+        prepare = function applied to each frame right after it's read, e.g. 
+        to start its timing record. Its output is what goes to the queue
+    """
+    def __init__(self, cap, output_queue, stop_event, prepare=None):
+        super().__init__(name='capture', daemon=True)
+        self.cap = cap
+        self.output_queue = output_queue
+        self.stop_event = stop_event
+        self.prepare = prepare
+
+    def run(self):
+        while not self.stop_event.is_set() and self.cap.isOpened():
+            ret, frame = self.cap.read()
+            # End of the stream or camera disconnected
+            if not ret:
+                break
+            if self.prepare is not None:
+                frame = self.prepare(frame)
+            self.output_queue.put(frame)
+        self.output_queue.close()
+
+class StageThread(threading.Thread):
+    """
+    Thread that applies a function to every item of the input queue and puts
+    the output in the output queue.
+
+    Params:
+        name = the name of the stage
+        function = the function applied to each item
+        input_queue = LatestQueue the items are read from
+        output_queue = LatestQueue that will receive the outputs
+        stop_event = threading.Event used to stop all the pipeline stages
+    """
+    def __init__(self, name, function, input_queue, output_queue, stop_event):
+        super().__init__(name=name, daemon=True)
+        self.function = function
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.stop_event = stop_event
+        self.error = None
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                item = self.input_queue.get(timeout=0.1)
+                if item is None:
+                    if self.input_queue.closed:
+                        break
+                    continue
+                self.output_queue.put(self.function(item))
+        except Exception as error:
+            # Keep the error so the main thread can raise it
+            self.error = error
+        finally:
+            self.output_queue.close()
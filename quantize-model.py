@@ -0,0 +1,84 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from classifier import NumpyMLPClassifier, load_classifier, quantize_classifier, export_quantized
+from sample_store import load_training_data
+
+# Quantizes the weights of the gesture classifier to int8 or float16 and writes
+# them to a .npz, which is loaded by the apply-model.py with --model. The
+# quantized model is validated against the float model on the training data,
+# printing the agreement between them, their accuracy, the size of the files
+# and the speedup of the prediction. E.g. of usage:
+# $ python quantize-model.py --quantization int8 --output model/clf-int8.npz
+# $ python apply-model.py --model model/clf-int8.npz
+parser = argparse.ArgumentParser()
+parser.add_argument("--model", type=str, default='model/clf.npz', help='float model, a .npz exported by export-model.py or the .pkl')
+parser.add_argument("--quantization", choices=['int8', 'float16'], default='int8')
+parser.add_argument("--output", type=str, default=None, help='default model/clf-<quantization>.npz')
+parser.add_argument("--data", type=str, default='data/training-data', help='sample store or csv used to validate the model')
+parser.add_argument("--min_time", type=float, default=1.0, help='seconds each latency is measured')
+parser.add_argument("--report", type=str, default=None, help='json file that receives the report')
+args = parser.parse_args()
+output_path = args.output or f'model/clf-{args.quantization}.npz'
+
+def latency(classifier, X, min_time):
+    """
+    Params:
+        classifier = the classifier measured
+        X = the samples predicted in each call
+        min_time = seconds the calls are repeated
+    Output:
+        the median time of a predict call, in microseconds
+    """
+    times = []
+    end = time.perf_counter() + min_time
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        classifier.predict(X)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))*1e6
+
+float_classifier = load_classifier(args.model)
+if not isinstance(float_classifier, NumpyMLPClassifier):
+    float_classifier = NumpyMLPClassifier.from_sklearn(float_classifier)
+quantized_classifier = quantize_classifier(float_classifier, args.quantization)
+export_quantized(quantized_classifier, output_path)
+# The report is made with the model read back from the file
+quantized_classifier = load_classifier(output_path)
+
+features, labels = load_training_data(args.data)
+features = np.asarray(features, dtype=np.float64)
+float_predictions = float_classifier.predict(features)
+quantized_predictions = quantized_classifier.predict(features)
+
+report = {
+    'quantization': args.quantization,
+    'samples': len(labels),
+    'agreement': float(np.mean(float_predictions==quantized_predictions)),
+    'float_accuracy': float(np.mean(float_predictions==labels)),
+    'quantized_accuracy': float(np.mean(quantized_predictions==labels)),
+    'float_size_bytes': os.path.getsize(args.model),
+    'quantized_size_bytes': os.path.getsize(output_path)
+}
+# One sample, as predicted every frame, and the whole data at once
+for name, X in (('single', features[:1]), ('batch', features)):
+    float_latency = latency(float_classifier, X, args.min_time)
+    quantized_latency = latency(quantized_classifier, X, args.min_time)
+    report[f'{name}_float_us'] = float_latency
+    report[f'{name}_quantized_us'] = quantized_latency
+    report[f'{name}_speedup'] = float_latency/quantized_latency
+
+print(f'Model quantized to {args.quantization} and saved to {output_path}')
+print(f'Agreement with the float model: {report["agreement"]:.2%} of {report["samples"]} samples')
+print(f'Accuracy: {report["float_accuracy"]:.2%} float, {report["quantized_accuracy"]:.2%} quantized')
+print(f'Size: {report["float_size_bytes"]} bytes float, {report["quantized_size_bytes"]} bytes quantized')
+for name in ('single', 'batch'):
+    print(
+        f'Predict {name}: {report[f"{name}_float_us"]:.1f}us float, '
+        f'{report[f"{name}_quantized_us"]:.1f}us quantized ({report[f"{name}_speedup"]:.2f}x)'
+    )
+if args.report is not None:
+    with open(args.report, 'w') as file:
+        json.dump(report, file, indent=2)
@@ -0,0 +1,155 @@
+import math
+import cv2
+
+# Region of the whole frame, as (x_min, y_min, x_max, y_max) normalized from 0 to 1
+FULL_FRAME = (0.0, 0.0, 1.0, 1.0)
+
+class AdaptiveFrontEnd:
+    """
+    Prepares the frames given to hands.process: the frame is cropped to the
+    region around the hands tracked in the previous frames and downsized to
+    the processing width, and the landmarks found are mapped back to the
+    coordinates of the whole frame, so everything after hands.process works
+    as if the whole frame had been processed.
+
+    The region is the union of the bounding boxes of the hands, padded on
+    each side. It's kept while the hands stay inside it, instead of following
+    them every frame, so the tracking of mediapipe sees the same crop between
+    frames. The whole frame is processed again when no hand is found and
+    every refresh frames, to find hands that entered outside the region.
+
+    Params:
+        process_width = maximum width of the image given to hands.process. 0
+        keeps the size of the frame or of the crop
+        roi = if True the frame is cropped to the region of the hands
+        padding = padding added to each side of the bounding box of the hands,
+        relative to its largest side
+        refresh = number of frames after which the whole frame is processed
+        again, even if the hands are tracked
+    """
+    def __init__(self, process_width=0, roi=False, padding=0.25, refresh=30):
+        self.process_width = process_width
+        self.roi = roi
+        self.padding = padding
+        self.refresh = refresh
+        self.region = None
+        self.frames_in_region = 0
+        # Region of the last image prepared, in the coordinates of the whole
+        # frame, as (x_min, y_min, width, height)
+        self.transform = (0.0, 0.0, 1.0, 1.0)
+        self.full_frames = 0
+        self.cropped_frames = 0
+
+    def prepare(self, frame):
+        """
+        Params:
+            frame = the BGR frame captured by cap.read()
+        Output:
+            image: the region of the frame processed, downsized, converted
+            to RGB and flipped on horizontal
+        """
+        frame_height, frame_width = frame.shape[:2]
+        region = FULL_FRAME
+        if self.region is not None and self.frames_in_region < self.refresh:
+            region = self.region
+            self.frames_in_region += 1
+            self.cropped_frames += 1
+        else:
+            self.frames_in_region = 0
+            self.full_frames += 1
+
+        # The region is in the coordinates of the flipped image, so its columns
+        # are mirrored to crop the frame before flipping
+        x_min, y_min, x_max, y_max = region
+        first_column = max(0, int(math.floor((1 - x_max)*frame_width)))
+        last_column = min(frame_width, int(math.ceil((1 - x_min)*frame_width)))
+        first_row = max(0, int(math.floor(y_min*frame_height)))
+        last_row = min(frame_height, int(math.ceil(y_max*frame_height)))
+        crop = frame[first_row:last_row, first_column:last_column]
+
+        # The exact region cropped, after rounding to pixels
+        self.transform = (
+            1 - last_column/frame_width,
+            first_row/frame_height,
+            (last_column - first_column)/frame_width,
+            (last_row - first_row)/frame_height
+        )
+
+        # The landmarks are normalized by the image size, so downsizing
+        # doesn't change them
+        crop_height, crop_width = crop.shape[:2]
+        if self.process_width and crop_width > self.process_width:
+            crop = cv2.resize(
+                crop,
+                (self.process_width, max(1, round(crop_height*self.process_width/crop_width))),
+                interpolation = cv2.INTER_AREA
+            )
+
+        # Converting to RGB and flipping on horizontal as done with the whole frame
+        image = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+        return cv2.flip(image, 1)
+
+    def remap(self, results):
+        """
+        Params:
+            results = the output of hands.process(image) for the image given by
+            prepare. Its landmarks are changed to the coordinates of the whole
+            frame
+        Output:
+            results
+        """
+        x_offset, y_offset, width, height = self.transform
+        if results.multi_hand_landmarks and self.transform!=(0.0, 0.0, 1.0, 1.0):
+            for hand_landmarks in results.multi_hand_landmarks:
+                for coordinates in hand_landmarks.landmark:
+                    coordinates.x = x_offset + coordinates.x*width
+                    coordinates.y = y_offset + coordinates.y*height
+                    # The depth has the scale of the image width
+                    coordinates.z = coordinates.z*width
+        return results
+
+    def update(self, results):
+        """
+        Params:
+            results = the output of remap, in the coordinates of the whole frame
+
+        Chooses the region of the next frames from the hands found.
+        """
+        if not self.roi:
+            return
+        if not results.multi_hand_landmarks:
+            # Track lost, the next frame is processed whole
+            self.region = None
+            return
+
+        x_values = [coordinates.x for hand_landmarks in results.multi_hand_landmarks for coordinates in hand_landmarks.landmark]
+        y_values = [coordinates.y for hand_landmarks in results.multi_hand_landmarks for coordinates in hand_landmarks.landmark]
+        box = (min(x_values), min(y_values), max(x_values), max(y_values))
+
+        # The current region is kept while the hands are inside it, with at
+        # least half of the padding to the border, and it isn't much larger
+        # than needed
+        if self.region is not None:
+            margin = 0.5*self.padding*max(box[2] - box[0], box[3] - box[1])
+            inside = (
+                box[0] - margin >= self.region[0] and box[1] - margin >= self.region[1]
+                and box[2] + margin <= self.region[2] and box[3] + margin <= self.region[3]
+            )
+            region_area = (self.region[2] - self.region[0])*(self.region[3] - self.region[1])
+            padded_area = (box[2] - box[0] + 4*margin)*(box[3] - box[1] + 4*margin)
+            if inside and region_area <= 2*padded_area:
+                return
+
+        # A minimum padding, so the region is never empty
+        pad = max(self.padding*max(box[2] - box[0], box[3] - box[1]), 0.02)
+        self.region = (
+            max(0.0, box[0] - pad),
+            max(0.0, box[1] - pad),
+            min(1.0, box[2] + pad),
+            min(1.0, box[3] + pad)
+        )
+
+    def summary(self):
+        frames = self.full_frames + self.cropped_frames
+        share = self.cropped_frames/frames if frames else 0.0
+        return f'Region of interest: {self.cropped_frames} of {frames} frames processed cropped ({share:.1%})'
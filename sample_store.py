@@ -0,0 +1,330 @@
+import os
+import json
+import queue
+import threading
+import numpy as np
+from helpers import HAND_LANDMARKS
+
+# Name of the label column and of the 42 feature columns, the same header of
+# the data/training-data.csv
+LABEL_COLUMN = 'gesture_id'
+FEATURE_COLUMNS = [f'{joint.lower()}_{axis}' for joint in HAND_LANDMARKS for axis in ('x', 'y')]
+
+class SampleStore:
+    """
+    Append-only binary store of training samples. The features are kept as a
+    raw float32 file with one row of 42 values per sample and the labels as a
+    raw int32 sidecar file, so appending a sample is writing its bytes at the
+    end of the files and reading the whole dataset is memory-mapping them,
+    without parsing text. Appended samples are buffered in memory and written
+    in blocks of buffer_size samples, or when flush/close are called.
+
+    Params:
+        path = directory of the store, created if it doesn't exist
+        n_features = number of features of each sample
+        buffer_size = number of samples kept in memory before being written
+
+    Files inside the directory:
+        - features.f32 -> the features, float32 in C order
+        - labels.i32 -> the label of each sample, int32
+        - columns.json -> the name of the label and feature columns
+    """
+    def __init__(self, path, n_features=len(FEATURE_COLUMNS), buffer_size=256):
+        self.path = path
+        self.features_path = os.path.join(path, 'features.f32')
+        self.labels_path = os.path.join(path, 'labels.i32')
+        self.columns_path = os.path.join(path, 'columns.json')
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+        if os.path.exists(self.columns_path):
+            with open(self.columns_path) as file:
+                columns = json.load(file)
+            n_features = len(columns['features'])
+        else:
+            columns = {
+                'label': LABEL_COLUMN,
+                'features': FEATURE_COLUMNS if n_features==len(FEATURE_COLUMNS) else [f'feature_{index}' for index in range(n_features)]
+            }
+            with open(self.columns_path, 'w') as file:
+                json.dump(columns, file, indent=2)
+        self.columns = columns
+        self.n_features = n_features
+
+        self.buffer_features = np.empty((buffer_size, n_features), dtype=np.float32)
+        self.buffer_labels = np.empty(buffer_size, dtype=np.int32)
+        self.buffered = 0
+
+    def stored_count(self):
+        # Number of samples already written. If a write was interrupted the
+        # incomplete sample at the end of the files is ignored
+        if not os.path.exists(self.features_path) or not os.path.exists(self.labels_path):
+            return 0
+        return min(
+            os.path.getsize(self.features_path)//(4*self.n_features),
+            os.path.getsize(self.labels_path)//4
+        )
+
+    def __len__(self):
+        return self.stored_count() + self.buffered
+
+    def append(self, label, features):
+        """
+        Params:
+            label = the gesture label of the sample
+            features = the 42 pre processed coordinates of the sample
+        """
+        self.buffer_features[self.buffered] = features
+        self.buffer_labels[self.buffered] = label
+        self.buffered += 1
+        if self.buffered==len(self.buffer_labels):
+            self.flush()
+
+    def extend(self, labels, features):
+        """
+        Params:
+            labels = array with the label of each sample
+            features = array with shape (n_samples, n_features)
+        """
+        self.flush()
+        self.write(
+            np.ascontiguousarray(features, dtype=np.float32).reshape(-1, self.n_features),
+            np.ascontiguousarray(labels, dtype=np.int32)
+        )
+
+    def write(self, features, labels):
+        with open(self.features_path, 'ab') as file:
+            file.write(features.tobytes())
+        with open(self.labels_path, 'ab') as file:
+            file.write(labels.tobytes())
+
+    def flush(self):
+        # Writes the buffered samples to the files
+        if self.buffered:
+            self.write(self.buffer_features[:self.buffered], self.buffer_labels[:self.buffered])
+            self.buffered = 0
+
+    def close(self):
+        self.flush()
+
+    def clear(self):
+        # Erases all the samples of the store
+        self.buffered = 0
+        for file_path in (self.features_path, self.labels_path):
+            open(file_path, 'wb').close()
+
+    def load(self):
+        """
+        Output:
+            (features, labels)
+                - features -> read-only float32 array with shape (n_samples, n_features),
+                memory-mapped from the store, so nothing is read until it's used
+                - labels -> read-only int32 array with the label of each sample
+            The samples still in the buffer are written before loading.
+        """
+        self.flush()
+        count = self.stored_count()
+        if count==0:
+            return np.empty((0, self.n_features), dtype=np.float32), np.empty(0, dtype=np.int32)
+        features = np.memmap(self.features_path, dtype=np.float32, mode='r', shape=(count, self.n_features))
+        labels = np.memmap(self.labels_path, dtype=np.int32, mode='r', shape=(count,))
+        return features, labels
+
+class SampleWriterThread(threading.Thread):
+    """
+    Thread that writes the samples to a SampleStore, so the frame loop only
+    puts the samples in a queue and never waits for the disk. Once started it's
+    the only one that touches the store, so the store is also cleared through it.
+
+    Params:
+        store = the SampleStore that receives the samples
+    """
+    # Item of the queue that asks the thread to erase the store
+    CLEAR = 'clear'
+
+    def __init__(self, store):
+        super().__init__(name='sample_writer', daemon=True)
+        self.store = store
+        # The queue has no size limit: a sample is never dropped
+        self.queue = queue.Queue()
+        self.error = None
+
+    def put(self, label, features, flush=False):
+        # The features are copied because the caller may reuse its array. With
+        # flush the sample is written to the disk right away, not buffered
+        self.queue.put((label, np.array(features, dtype=np.float32), flush))
+
+    def clear(self):
+        self.queue.put(self.CLEAR)
+
+    def run(self):
+        try:
+            while True:
+                item = self.queue.get()
+                # None is put by close() after the last sample
+                if item is None:
+                    break
+                if item==self.CLEAR:
+                    self.store.clear()
+                else:
+                    label, features, flush = item
+                    self.store.append(label, features)
+                    if flush:
+                        self.store.flush()
+        except Exception as error:
+            # Keep the error so the main thread can raise it
+            self.error = error
+        finally:
+            self.store.close()
+
+    def close(self):
+        # Writes the samples still in the queue and stops the thread
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+class BurstRecorder:
+    """
+    Record mode of the collect-train-data.py. While it's recording, the hands
+    of every frame are offered to it and saved with the active label, except
+    the frames skipped by the stride and the samples too close to the last one
+    saved with the same label. The stride only counts the frames with a hand
+    offered, so the frames without a hand don't take the turn of one. The samples are written by a SampleWriterThread
+    and the number of samples of each label is kept to be shown in the image.
+
+    Params:
+        store = the SampleStore that receives the samples
+        stride = 1 saves every frame with a hand offered, 2 every other one
+        and so on
+        min_distance = the samples whose euclidean distance to the last sample
+        saved with the same label is smaller than this are discarded. 0 keeps
+        every sample
+    """
+    def __init__(self, store, stride=1, min_distance=0):
+        self.stride = max(1, stride)
+        self.min_distance = min_distance
+        self.label = None
+        self.recording = False
+        self.frames = 0
+        self.counted = False
+        self.rejected = 0
+        self.last_features = {}
+
+        # Samples of each label already in the store
+        labels = store.load()[1]
+        self.counts = {int(label): int(count) for label, count in enumerate(np.bincount(labels)) if count}
+
+        self.writer = SampleWriterThread(store)
+        self.writer.start()
+
+    def start(self, label):
+        self.label = label
+        self.recording = True
+        self.frames = 0
+        self.counted = False
+
+    def stop(self):
+        self.recording = False
+
+    def save(self, label, features, flush=False):
+        # Saves one sample, regardless of the record mode. The samples saved 
+        # one at a time by a key press are given with flush, so they reach the 
+        # disk right away as before, and only the record mode is buffered
+        self.writer.put(label, features, flush)
+        self.counts[label] = self.counts.get(label, 0) + 1
+        self.last_features[label] = np.asarray(features, dtype=np.float32)
+
+    def next_frame(self):
+        # Must be called once per frame, before offering its hands. The frame
+        # is counted by the stride when its first hand is offered
+        self.counted = False
+
+    def offer(self, features):
+        """
+        Params:
+            features = the pre processed coordinates of a hand of the frame
+        Output:
+            True if the sample was saved with the active label
+        """
+        if not self.recording:
+            return False
+        if not self.counted:
+            self.frames += 1
+            self.counted = True
+        if (self.frames - 1)%self.stride:
+            return False
+        last_features = self.last_features.get(self.label)
+        if (
+            self.min_distance > 0 and last_features is not None
+            and np.linalg.norm(np.asarray(features, dtype=np.float32) - last_features) < self.min_distance
+        ):
+            self.rejected += 1
+            return False
+        self.save(self.label, features)
+        return True
+
+    def clear(self):
+        self.stop()
+        self.writer.clear()
+        self.counts = {}
+        self.last_features = {}
+
+    def close(self):
+        self.writer.close()
+
+def read_csv(csv_path):
+    """
+    Params:
+        csv_path = csv with the layout of the data/training-data.csv, the label
+        in the first column and the features in the others
+    Output:
+        (features, labels) as numpy arrays
+    """
+    data = np.loadtxt(csv_path, delimiter=',', skiprows=1, ndmin=2)
+    return data[:, 1:], data[:, 0].astype(np.int32)
+
+def import_csv(csv_path, store_path):
+    """
+    Params:
+        csv_path = csv with the layout of the data/training-data.csv
+        store_path = directory of the store that will receive its samples
+    Output:
+        the number of samples imported
+    """
+    features, labels = read_csv(csv_path)
+    store = SampleStore(store_path, n_features=features.shape[1])
+    store.extend(labels, features)
+    return len(labels)
+
+def export_csv(store_path, csv_path):
+    """
+    Params:
+        store_path = directory of the store
+        csv_path = csv that will be written with the layout of the
+        data/training-data.csv
+    Output:
+        the number of samples exported
+    """
+    import csv
+
+    store = SampleStore(store_path)
+    features, labels = store.load()
+    with open(csv_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow([store.columns['label']] + store.columns['features'])
+        for label, row in zip(labels, features):
+            writer.writerow([float(label)] + row.tolist())
+    return len(labels)
+
+def load_training_data(path):
+    """
+    Params:
+        path = directory of a SampleStore or a csv with the layout of the
+        data/training-data.csv
+    Output:
+        (features, labels), memory-mapped when read from a store
+    """
+    if path.endswith('.csv'):
+        return read_csv(path)
+    return SampleStore(path).load()
@@ -0,0 +1,180 @@
+import math
+import time
+import numpy as np
+import cv2
+from sources import build_results
+
+class DetectionScheduler:
+    """
+    Decides in which frames the hand tracking of mediapipe runs and, in the
+    frames between them, moves the landmarks of the last detection with the
+    optical flow of the frame or by extrapolating their speed. The landmarks
+    of the skipped frames are given in a results-shaped object (see
+    sources.build_results), so the code after hands.process doesn't change.
+
+    Params:
+        mode = 'fixed' to run the hand tracking every interval frames, or
+        'adaptive' to choose the interval from the time the hand tracking and
+        the propagation take, so the average time per frame fits the budget
+        interval = the interval of the 'fixed' mode
+        budget = the time per frame, in milliseconds, of the 'adaptive' mode
+        max_interval = the maximum interval of the 'adaptive' mode
+        tracker = 'flow' to move the landmarks with cv2.calcOpticalFlowPyrLK,
+        or 'linear' to extrapolate the speed between the last two detections
+        min_tracked = share of the landmarks of a hand that must be found by
+        the optical flow. Below it the hand tracking runs in the next frame
+    """
+    def __init__(self, mode='fixed', interval=2, budget=33, max_interval=5, tracker='flow', min_tracked=0.5):
+        self.mode = mode
+        self.interval = max(1, interval)
+        self.budget = budget
+        self.max_interval = max(1, max_interval)
+        self.tracker = tracker
+        self.min_tracked = min_tracked
+
+        self.frames_since_detection = None
+        self.force_detection = False
+        # Average time, in milliseconds, of the hand tracking and of the propagation
+        self.detect_ms = None
+        self.track_ms = 0.0
+
+        # Hands of the last detection
+        self.landmarks = np.empty((0, 21, 3), dtype=np.float32)
+        self.handedness = []
+        self.scores = []
+        self.velocity = None
+        self.gray = None
+
+        self.detections = 0
+        self.propagations = 0
+
+        self.flow_params = dict(
+            winSize = (21, 21),
+            maxLevel = 3,
+            criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+        )
+
+    def current_interval(self):
+        if self.mode!='adaptive' or self.detect_ms is None:
+            return self.interval
+        # With N frames per detection the average time per frame is
+        # (detect + (N-1)*track)/N, which must fit the budget
+        if self.detect_ms <= self.budget:
+            return 1
+        if self.track_ms >= self.budget:
+            return self.max_interval
+        interval = math.ceil((self.detect_ms - self.track_ms)/(self.budget - self.track_ms))
+        return min(self.max_interval, max(1, interval))
+
+    def should_detect(self):
+        """
+        Output:
+            True if the hand tracking must run in this frame
+        """
+        return (
+            self.force_detection or self.frames_since_detection is None
+            or self.frames_since_detection + 1 >= self.current_interval()
+        )
+
+    def detected(self, frame, results, elapsed_ms):
+        """
+        Params:
+            frame = the BGR frame processed by the hand tracking
+            results = the output of hands.process, in the coordinates of the
+            whole frame
+            elapsed_ms = the time the hand tracking took
+        """
+        # Frames since the previous detection, this one included
+        frames = None if self.frames_since_detection is None else self.frames_since_detection + 1
+        self.detections += 1
+        self.frames_since_detection = 0
+        self.force_detection = False
+        self.detect_ms = elapsed_ms if self.detect_ms is None else 0.8*self.detect_ms + 0.2*elapsed_ms
+
+        landmarks = []
+        handedness = []
+        scores = []
+        if results.multi_hand_landmarks:
+            for hand_landmarks, hand_handedness in zip(results.multi_hand_landmarks, results.multi_handedness):
+                landmarks.append([(coordinates.x, coordinates.y, coordinates.z) for coordinates in hand_landmarks.landmark])
+                handedness.append(hand_handedness.classification[0].label)
+                scores.append(hand_handedness.classification[0].score)
+        landmarks = np.array(landmarks, dtype=np.float32).reshape(-1, 21, 3)
+
+        # The speed, in landmark coordinates per frame, is only known when the
+        # same hands were in the last two detections
+        if self.tracker=='linear' and handedness==self.handedness and len(self.landmarks) and frames:
+            self.velocity = (landmarks - self.landmarks)/frames
+        else:
+            self.velocity = None
+        self.landmarks = landmarks
+        self.handedness = handedness
+        self.scores = scores
+
+        if self.tracker=='flow':
+            self.gray = self.to_gray(frame)
+
+    @staticmethod
+    def to_gray(frame):
+        # Flipped as the image given to the hand tracking
+        return cv2.flip(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), 1)
+
+    def propagate(self, frame):
+        """
+        Params:
+            frame = the BGR frame in which the hand tracking is skipped
+        Output:
+            results: results-shaped object with the landmarks of the last
+            detection moved to this frame
+        """
+        start = time.perf_counter()
+        self.propagations += 1
+        self.frames_since_detection += 1
+
+        if len(self.landmarks)==0:
+            results = build_results([], [])
+        elif self.tracker=='flow':
+            results = self.propagate_flow(frame)
+        else:
+            landmarks = self.landmarks
+            if self.velocity is not None:
+                landmarks = landmarks + self.velocity*self.frames_since_detection
+            results = build_results(landmarks, self.handedness, self.scores)
+
+        elapsed_ms = (time.perf_counter() - start)*1000
+        self.track_ms = 0.8*self.track_ms + 0.2*elapsed_ms
+        return results
+
+    def propagate_flow(self, frame):
+        gray = self.to_gray(frame)
+        height, width = gray.shape
+        scale = np.array([width, height], dtype=np.float32)
+        points = (self.landmarks[:, :, :2]*scale).reshape(-1, 1, 2)
+
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.gray, gray, points, None, **self.flow_params)
+        status = status.reshape(len(self.landmarks), 21).astype(bool)
+        new_points = new_points.reshape(len(self.landmarks), 21, 2)/scale
+
+        # The points not found keep the mean motion of the points of their hand
+        # that were found. If too many are lost, the next frame is detected
+        landmarks = self.landmarks.copy()
+        for hand_index in range(len(landmarks)):
+            found = status[hand_index]
+            if found.mean() < self.min_tracked:
+                self.force_detection = True
+            if found.any():
+                shift = (new_points[hand_index][found] - landmarks[hand_index, found, :2]).mean(axis=0)
+                landmarks[hand_index, :, :2] += shift
+                landmarks[hand_index, found, :2] = new_points[hand_index][found]
+
+        self.landmarks = landmarks
+        self.gray = gray
+        return build_results(landmarks, self.handedness, self.scores)
+
+    def summary(self):
+        frames = self.detections + self.propagations
+        share = self.propagations/frames if frames else 0.0
+        return (
+            f'Hand tracking run in {self.detections} of {frames} frames, '
+            f'{self.propagations} propagated with {self.tracker} ({share:.1%})'
+        )
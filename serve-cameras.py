@@ -0,0 +1,157 @@
+import time
+import json
+from helpers import get_args
+from labels import load_gesture_registry, ARTICULATION_DICT
+from smoothing import create_smoothers
+from timing import FrameTimer
+from classifier import load_classifier
+from multi_camera import CameraPool, predict_batch
+
+def open_servo_writers(args, stream_count):
+    """
+    Params:
+        args = the output of helpers.get_args
+        stream_count = the number of streams
+    Output:
+        (boards, servo_writers): the board and the ServoWriter of each stream,
+        or lists of None when the servos aren't written
+    """
+    if args.arduino_mode not in (1, 2):
+        return [None]*stream_count, [None]*stream_count
+
+    from servo import open_board, ServoWriter
+
+    # Each operator moves the servos of its own Arduino
+    if args.arduino_mode==1 and len(args.ports)!=stream_count:
+        raise ValueError(f'{stream_count} streams given, but {len(args.ports)} ports. Give one port per stream')
+    pins = [info['pin'] for info in ARTICULATION_DICT.values()]
+    boards = [
+        open_board(port=args.ports[stream_index] if args.arduino_mode==1 else None, pins=pins)
+        for stream_index in range(stream_count)
+    ]
+    servo_writers = [ServoWriter(board, deadband=args.servo_deadband, max_rate=args.servo_rate) for board in boards]
+    for servo_writer in servo_writers:
+        servo_writer.start()
+    return boards, servo_writers
+
+def report(timers, pool):
+    # FPS and p50/p95/p99 latency, from the capture to the servo command, of 
+    # each stream, and the error that stopped it, if any
+    for stream_index, timer in enumerate(timers):
+        if stream_index in pool.errors:
+            print(f'Stream {stream_index} ({pool.sources[stream_index]}) stopped by an error: {pool.errors[stream_index]}')
+            continue
+        latency = timer.percentiles('latency')
+        latency_text = 'no frames' if latency is None else '{:.1f} / {:.1f} / {:.1f} ms'.format(*latency)
+        print(
+            f'Stream {stream_index} ({pool.sources[stream_index]}): {timer.fps():.1f} FPS, '
+            f'latency {latency_text}, {pool.coalesced[stream_index]} frames coalesced'
+        )
+
+def main():
+    # The servo commands of the streams aren't published to an event bus
+    args = get_args(unsupported=['actuators'])
+    stream_count = len(args.streams)
+
+    # Loading gesture recognition model, shared by all the streams
+    gesture_classifier = load_classifier(args.model)
+    gesture_registry = load_gesture_registry('data/gesture-label.csv', ARTICULATION_DICT, gesture_classifier.classes_)
+
+    # Each stream has its own filters, its own servos and its own timer, as
+    # each one is an operator
+    smoothers = [create_smoothers(args) for _ in range(stream_count)]
+    boards, servo_writers = open_servo_writers(args, stream_count)
+    timers = [
+        FrameTimer(['hands_process', 'predict'], window=args.timing_window, show_hud=False)
+        for _ in range(stream_count)
+    ]
+
+    # File that receives the gesture, module and servo command of each frame of each stream
+    output_file = open(args.output, 'w') if args.output is not None else None
+
+    # One process per camera runs its hand tracking
+    pool = CameraPool(args.streams, args)
+    pool.start()
+
+    last_report = time.perf_counter()
+    try:
+        while pool.running:
+            # The newest frame of each stream since the last tick
+            messages = pool.collect()
+            if not messages:
+                continue
+
+            # The gestures of all the streams are predicted in one call
+            start = time.perf_counter()
+            predictions = predict_batch(gesture_classifier, messages, with_confidence=args.gesture_vote=='confidence')
+            predict_ms = (time.perf_counter() - start)*1000
+
+            for stream_index, message in messages.items():
+                gesture_smoother, pinch_filter = smoothers[stream_index]
+
+                # The capture time of the worker is in the wall clock, which
+                # is converted to the clock of the timer
+                record = timers[stream_index].start_frame()
+                record['captured'] = record['start'] - (time.time() - message['captured'])
+                record['hands_process'] = message['hands_process']
+
+                gesture = None
+                if stream_index in predictions:
+                    record['predict'] = predict_ms
+                    label_predicted, confidence = predictions[stream_index]
+                    gesture = gesture_registry[gesture_smoother.update(label_predicted, confidence)]
+                else:
+                    gesture_smoother.reset()
+
+                module = None
+                if message['module'] is not None:
+                    # The frames read from a file are timed by the frame rate, not the clock
+                    module = 1 - pinch_filter.update(
+                        1 - message['module'],
+                        None if not args.streams[stream_index].isdigit() else message['captured']
+                    )
+                else:
+                    pinch_filter.reset()
+
+                servo_command = None
+                if gesture is not None and module is not None:
+                    servo_command = (gesture.pin, module*90*gesture.fator)
+                    if servo_writers[stream_index] is not None:
+                        servo_writers[stream_index].command(*servo_command)
+                timers[stream_index].mark_actuated(record)
+                timers[stream_index].finish_frame(record)
+
+                if output_file is not None:
+                    line = {
+                        'stream': stream_index,
+                        'frame': message['frame'],
+                        'gesture': None if gesture is None else gesture.gesture,
+                        'module': module,
+                        'pin': None if servo_command is None else servo_command[0],
+                        'angle': None if servo_command is None else servo_command[1]
+                    }
+                    output_file.write(json.dumps(line)+'\n')
+
+            if args.report_interval > 0 and time.perf_counter() - last_report >= args.report_interval:
+                report(timers, pool)
+                last_report = time.perf_counter()
+    except KeyboardInterrupt:
+        # The way to stop reading from the webcams is Ctrl+C
+        pass
+
+    pool.close()
+    report(timers, pool)
+    for board, servo_writer in zip(boards, servo_writers):
+        if servo_writer is not None:
+            servo_writer.close()
+            board.exit()
+            print(servo_writer.summary())
+    if output_file is not None:
+        output_file.close()
+    if pool.errors:
+        raise SystemExit(f'{len(pool.errors)} of {stream_count} streams stopped by an error')
+
+# The camera processes import this script again when they are spawned, e.g.
+# in Windows, so it only runs when executed
+if __name__ == '__main__':
+    main()
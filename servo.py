@@ -0,0 +1,186 @@
+import time
+import threading
+
+class FakePin:
+    """
+    Pin of the FakeBoard, with the mode attribute and the write method of the
+    pins of pyfirmata.Arduino(...).digital.
+
+    Params:
+        board = the FakeBoard the pin belongs to
+        number = the number of the pin
+    """
+    def __init__(self, board, number):
+        self.board = board
+        self.number = number
+        self.mode = None
+
+    def write(self, value):
+        self.board.writes.append((time.perf_counter(), self.number, value))
+        # Simulates the time the serial transaction blocks the caller
+        if self.board.write_delay:
+            time.sleep(self.board.write_delay)
+
+class FakeBoard:
+    """
+    Board with the digital pins and the exit method of pyfirmata.Arduino, which
+    records the writes instead of sending them, so the servo output can be
+    used and tested without an Arduino.
+
+    Params:
+        write_delay = seconds each write blocks, simulating the serial port
+
+    Attributes:
+        writes = list with a (time, pin, value) tuple for each write
+    """
+    def __init__(self, write_delay=0):
+        self.write_delay = write_delay
+        self.writes = []
+        self.digital = FakeDigital(self)
+
+    def exit(self):
+        pass
+
+class FakeDigital(dict):
+    # Creates the pins when they are first used, as any pin number is valid
+    def __init__(self, board):
+        super().__init__()
+        self.board = board
+
+    def __missing__(self, number):
+        pin = self[number] = FakePin(self.board, number)
+        return pin
+
+def open_board(port, pins):
+    """
+    Params:
+        port = the serial port the Arduino is connected, e.g. 'COM3' or
+        '/dev/ttyACM0'. If None a FakeBoard is used
+        pins = the pins of the servos
+    Output:
+        board: the pyfirmata.Arduino or FakeBoard with the pins in servo mode
+    """
+    if port is None:
+        board = FakeBoard()
+        servo_mode = 'servo'
+    else:
+        import pyfirmata
+        board = pyfirmata.Arduino(port)
+        servo_mode = pyfirmata.SERVO
+
+    for pin in pins:
+        board.digital[pin].mode = servo_mode
+    return board
+
+class ServoWriter(threading.Thread):
+    """
+    Thread that owns the board and writes the servo angles, so the blocking
+    serial writes are out of the frame loop. Only the latest angle commanded
+    to each pin is kept: if a pin gets a new angle before the previous one
+    was written, the previous one is discarded. An angle closer than the
+    deadband to the last angle written to the pin isn't written, and each pin
+    is written at most max_rate times per second.
+
+    Params:
+        board = the pyfirmata.Arduino or FakeBoard, see open_board
+        deadband = minimum change, in degrees, for a new angle to be written
+        max_rate = maximum number of writes per second to each servo. 0 for
+        no limit
+    """
+    def __init__(self, board, deadband=1, max_rate=50):
+        super().__init__(name='servo_writer', daemon=True)
+        self.board = board
+        self.deadband = deadband
+        self.min_interval = 1/max_rate if max_rate else 0
+        self.condition = threading.Condition()
+        # Latest angle not written yet of each pin
+        self.targets = {}
+        # Last angle written to each pin and when
+        self.written = {}
+        self.write_times = {}
+        self.closed = False
+        self.error = None
+
+        self.commands = 0
+        self.writes = 0
+        self.coalesced = 0
+        self.suppressed = 0
+
+    def command(self, pin, angle):
+        """
+        Params:
+            pin = the pin of the servo
+            angle = the angle the servo must go to
+        """
+        with self.condition:
+            self.commands += 1
+            if pin in self.targets:
+                del self.targets[pin]
+                self.coalesced += 1
+            last_angle = self.written.get(pin)
+            if last_angle is not None and abs(angle - last_angle) < self.deadband:
+                self.suppressed += 1
+                return
+            self.targets[pin] = angle
+            self.condition.notify()
+
+    def next_write(self):
+        """
+        Output:
+            (command, wait)
+                - command -> (pin, angle) of a pin that can be written now,
+                or None
+                - wait -> if no pin can be written now, the seconds until the
+                rate limit allows the next one. None if there are no angles
+                waiting
+        """
+        now = time.perf_counter()
+        wait = None
+        # The dictionary keeps the order the pins got their angles, so the
+        # pins waiting longer are written first
+        for pin, angle in self.targets.items():
+            ready_time = self.write_times.get(pin, float('-inf')) + self.min_interval
+            if ready_time <= now:
+                return (pin, angle), None
+            wait = ready_time - now if wait is None else min(wait, ready_time - now)
+        return None, wait
+
+    def run(self):
+        try:
+            while True:
+                with self.condition:
+                    command, wait = self.next_write()
+                    while command is None:
+                        # When closed the angles still waiting are written
+                        # before stopping
+                        if self.closed and not self.targets:
+                            return
+                        self.condition.wait(wait)
+                        command, wait = self.next_write()
+                    pin, angle = command
+                    del self.targets[pin]
+                    self.written[pin] = angle
+                    self.write_times[pin] = time.perf_counter()
+
+                # The serial write is done outside the lock, so the frame loop
+                # is never blocked by it
+                self.board.digital[pin].write(angle)
+                self.writes += 1
+        except Exception as error:
+            # Keep the error so the main thread can raise it
+            self.error = error
+
+    def close(self):
+        # Writes the angles still waiting and stops the thread
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def summary(self):
+        return (
+            f'Servo writes: {self.writes} of {self.commands} commands '
+            f'({self.coalesced} replaced by a newer angle, {self.suppressed} inside the deadband)'
+        )
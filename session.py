@@ -0,0 +1,260 @@
+import os
+import time
+import queue
+import threading
+import numpy as np
+from sources import HANDEDNESS_LABELS, build_results
+
+# Version of the layout of the records, written in the header of the file
+FORMAT_VERSION = 1
+
+# Columns of a record. After the timestamp come max_num_hands blocks of
+# HAND_SIZE values, one per hand slot, and after them the prediction and the
+# servo command of the frame
+TIMESTAMP = 0
+HAND_OFFSET = 1
+# Handedness code (-1 for an empty slot), handedness score and the 21 x 3 landmarks
+HAND_SIZE = 2 + 21*3
+PREDICTION_SIZE = 4
+
+def record_size(max_num_hands):
+    return HAND_OFFSET + max_num_hands*HAND_SIZE + PREDICTION_SIZE
+
+def prediction_columns(max_num_hands):
+    """
+    Output:
+        dictionary with the column of the label predicted, the module, the pin
+        and the angle written in a record with max_num_hands hand slots. The
+        label and the pin are -1 and the module and the angle are nan when
+        they weren't given in the frame
+    """
+    first = HAND_OFFSET + max_num_hands*HAND_SIZE
+    return {'label': first, 'module': first + 1, 'pin': first + 2, 'angle': first + 3}
+
+def encode_header(max_num_hands, video_width, video_height, start_time):
+    # The header has the size of a record, so the file can be memory-mapped as
+    # one float32 matrix. The start time is a float64 kept in two float32 slots
+    header = np.zeros(record_size(max_num_hands), dtype=np.float32)
+    header[:4] = (FORMAT_VERSION, max_num_hands, video_width, video_height)
+    header[4:6] = np.array([start_time], dtype=np.float64).view(np.float32)
+    return header
+
+def encode_record(timestamp, results, max_num_hands, label=None, module=None, servo_command=None):
+    """
+    Params:
+        timestamp = seconds since the start of the session
+        results = the output of hands.process(image)
+        max_num_hands = the number of hand slots of the record
+        label = the label predicted for the left hand, None if there's none
+        module = the module given by the right hand, None if there's none
+        servo_command = the (pin, angle) written to the servo, None if none
+    Output:
+        record: float32 array with record_size(max_num_hands) values
+    """
+    record = np.zeros(record_size(max_num_hands), dtype=np.float32)
+    record[TIMESTAMP] = timestamp
+    hands = record[HAND_OFFSET:HAND_OFFSET + max_num_hands*HAND_SIZE].reshape(max_num_hands, HAND_SIZE)
+    hands[:, 0] = -1
+    if results.multi_hand_landmarks:
+        for hand_index, hand_landmarks in enumerate(results.multi_hand_landmarks[:max_num_hands]):
+            classification = results.multi_handedness[hand_index].classification[0]
+            hands[hand_index, 0] = HANDEDNESS_LABELS.index(classification.label)
+            hands[hand_index, 1] = classification.score
+            hands[hand_index, 2:] = [value for coordinates in hand_landmarks.landmark for value in (coordinates.x, coordinates.y, coordinates.z)]
+
+    columns = prediction_columns(max_num_hands)
+    record[columns['label']] = -1 if label is None else label
+    record[columns['module']] = np.nan if module is None else module
+    record[columns['pin']] = -1 if servo_command is None else servo_command[0]
+    record[columns['angle']] = np.nan if servo_command is None else servo_command[1]
+    return record
+
+class SessionRecorder(threading.Thread):
+    """
+    Records a session of the apply-model.py in a binary file of fixed-size
+    float32 records, one per frame, with the time of the frame, the landmarks,
+    handedness and score of each hand, the label predicted and the servo
+    command. The frame loop only encodes the record and puts it in a queue,
+    and this thread writes the records in blocks, so the frame loop never
+    waits for the disk. The file can be read with SessionCapture or
+    load_session.
+
+    Params:
+        path = the .session file that will be written
+        video_width = the width of the video the landmarks came from
+        video_height = the height of the video the landmarks came from
+        max_num_hands = the maximum number of hands in a frame
+        block_size = number of records written to the file at once
+    """
+    def __init__(self, path, video_width, video_height, max_num_hands=2, block_size=64):
+        super().__init__(name='session_recorder', daemon=True)
+        self.path = path
+        self.max_num_hands = max_num_hands
+        self.block_size = block_size
+        self.start_time = time.time()
+        self.start_counter = time.perf_counter()
+        self.file = open(path, 'wb')
+        self.file.write(encode_header(max_num_hands, video_width, video_height, self.start_time).tobytes())
+        # The queue has no size limit: a frame is never dropped
+        self.queue = queue.Queue()
+        self.error = None
+        self.recorded = 0
+
+    def put(self, results, label=None, module=None, servo_command=None, timestamp=None):
+        """
+        Params:
+            results = the output of hands.process(image) of the frame
+            label = the label predicted for the left hand, None if there's none
+            module = the module given by the right hand, None if there's none
+            servo_command = the (pin, angle) written to the servo, None if none
+            timestamp = the perf_counter of the frame. If None it's now
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        # The record is encoded here, as the results may be changed by the
+        # frame loop after it's put in the queue
+        self.queue.put(encode_record(timestamp - self.start_counter, results, self.max_num_hands, label, module, servo_command))
+
+    def run(self):
+        block = []
+        try:
+            while True:
+                record = self.queue.get()
+                # None is put by close() after the last frame
+                if record is not None:
+                    block.append(record)
+                if block and (record is None or len(block)==self.block_size or self.queue.empty()):
+                    self.file.write(np.stack(block).tobytes())
+                    self.recorded += len(block)
+                    block = []
+                if record is None:
+                    break
+        except Exception as error:
+            # Keep the error so the main thread can raise it
+            self.error = error
+        finally:
+            self.file.close()
+
+    def close(self):
+        # Writes the frames still in the queue and stops the thread
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def summary(self):
+        return f'Session: {self.recorded} frames recorded to {self.path}'
+
+def load_session(path):
+    """
+    Params:
+        path = a .session file written by the SessionRecorder
+    Output:
+        (header, records)
+            - header -> dictionary with the max_num_hands, video_width,
+            video_height and start_time of the session
+            - records -> read-only float32 array with one row per frame,
+            memory-mapped from the file, so nothing is read until it's used.
+            An incomplete record at the end of the file is ignored
+    """
+    first = np.fromfile(path, dtype=np.float32, count=6)
+    if len(first) < 6 or int(first[0])!=FORMAT_VERSION:
+        raise ValueError(f'{path} is not a session file of version {FORMAT_VERSION}')
+    header = {
+        'max_num_hands': int(first[1]),
+        'video_width': float(first[2]),
+        'video_height': float(first[3]),
+        'start_time': float(first[4:6].view(np.float64)[0])
+    }
+    size = record_size(header['max_num_hands'])
+    count = os.path.getsize(path)//(4*size) - 1
+    if count <= 0:
+        return header, np.empty((0, size), dtype=np.float32)
+    records = np.memmap(path, dtype=np.float32, mode='r', offset=4*size, shape=(count, size))
+    return header, records
+
+def split_hands(records, max_num_hands):
+    """
+    Params:
+        records = the records of load_session
+        max_num_hands = the number of hand slots of the records
+    Output:
+        (handedness, scores, landmarks) of every hand slot of every frame, with
+        shapes (N, max_num_hands), (N, max_num_hands) and (N, max_num_hands, 21, 3).
+        The empty slots have the handedness code -1
+    """
+    hands = records[:, HAND_OFFSET:HAND_OFFSET + max_num_hands*HAND_SIZE].reshape(-1, max_num_hands, HAND_SIZE)
+    return hands[:, :, 0].astype(np.int8), hands[:, :, 1], hands[:, :, 2:].reshape(-1, max_num_hands, 21, 3)
+
+class SessionCapture:
+    """
+    Object with the same methods of cv2.VideoCapture used by the scripts,
+    reading a session written by the SessionRecorder. As the LandmarkDumpCapture,
+    the read method returns a results-shaped object (see sources.build_results)
+    instead of a frame, so the session is replayed through the classifier and
+    the servo logic without the hand tracking, as fast as they run.
+
+    Params:
+        path = the .session file
+    """
+    def __init__(self, path):
+        header, self.records = load_session(path)
+        self.max_num_hands = header['max_num_hands']
+        self.video_width = header['video_width']
+        self.video_height = header['video_height']
+        self.handedness, self.scores, self.landmarks = split_hands(self.records, self.max_num_hands)
+        self.position = 0
+
+    def isOpened(self):
+        return self.position < len(self.records)
+
+    def read(self):
+        if not self.isOpened():
+            return False, None
+        detected = self.handedness[self.position] >= 0
+        results = build_results(
+            self.landmarks[self.position][detected].tolist(),
+            [HANDEDNESS_LABELS[code] for code in self.handedness[self.position][detected]],
+            self.scores[self.position][detected].tolist()
+        )
+        self.position += 1
+        return True, results
+
+    def get(self, prop):
+        import cv2
+
+        if prop==cv2.CAP_PROP_FRAME_WIDTH:
+            return self.video_width
+        if prop==cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.video_height
+        if prop==cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.records))
+        return 0.0
+
+    def release(self):
+        self.position = len(self.records)
+
+def mine_samples(path, min_score=0):
+    """
+    Params:
+        path = a .session file written by the SessionRecorder
+        min_score = the left hands with a handedness score below it are skipped
+    Output:
+        (features, labels): the pre processed coordinates of every left hand of
+        the session that had a gesture predicted, and the label predicted, to
+        be added to the training data. All the frames are pre processed at once
+    """
+    from helpers import pre_process_landmarks_batch
+
+    header, records = load_session(path)
+    max_num_hands = header['max_num_hands']
+    handedness, scores, landmarks = split_hands(records, max_num_hands)
+    labels = records[:, prediction_columns(max_num_hands)['label']].astype(np.int32)
+
+    # The label predicted belongs to the left hand of the frame
+    left = (handedness==HANDEDNESS_LABELS.index('Left')) & (scores >= min_score) & (labels[:, np.newaxis] >= 0)
+    frame_indexes, hand_indexes = np.nonzero(left)
+    features = pre_process_landmarks_batch(
+        landmarks[frame_indexes, hand_indexes], header['video_width'], header['video_height']
+    )
+    return features, labels[frame_indexes]
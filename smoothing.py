@@ -0,0 +1,254 @@
+import math
+from collections import deque
+
+class MajorityVote:
+    """
+    Sliding window vote of the labels predicted in the last frames. The label
+    given is the most frequent of the window, and it only changes when another
+    label becomes strictly more frequent, so a tie keeps the current one.
+
+    Params:
+        window = number of frames in the window
+    """
+    def __init__(self, window=5):
+        self.votes = deque(maxlen=window)
+        self.weights = {}
+        self.counts = {}
+        self.current = None
+
+    def update(self, label, confidence=1):
+        """
+        Params:
+            label = the label predicted in the frame
+            confidence = the weight of the vote. The MajorityVote always uses 1
+        Output:
+            the label voted
+        """
+        return self.vote(label, 1)
+
+    def vote(self, label, weight):
+        # The oldest vote leaves the window before the new one enters
+        if len(self.votes)==self.votes.maxlen:
+            old_label, old_weight = self.votes[0]
+            self.counts[old_label] -= 1
+            if self.counts[old_label]==0:
+                del self.counts[old_label]
+                del self.weights[old_label]
+            else:
+                self.weights[old_label] -= old_weight
+        self.votes.append((label, weight))
+        self.counts[label] = self.counts.get(label, 0) + 1
+        self.weights[label] = self.weights.get(label, 0) + weight
+
+        best = max(self.weights, key=self.weights.get)
+        if self.weights[best] > self.weights.get(self.current, 0):
+            self.current = best
+        return self.current
+
+    def reset(self):
+        self.votes.clear()
+        self.weights = {}
+        self.counts = {}
+        self.current = None
+
+class ConfidenceVote(MajorityVote):
+    """
+    Sliding window vote in which each frame votes with the probability the
+    model gave to the label predicted, so uncertain predictions count less.
+
+    Params:
+        window = number of frames in the window
+    """
+    def update(self, label, confidence=1):
+        return self.vote(label, confidence)
+
+class Hysteresis:
+    """
+    Only switches to a new label after it's been given in a number of frames
+    in a row, so the articulation selected doesn't flicker between two gestures.
+
+    Params:
+        frames = number of frames in a row needed to switch. 1 switches
+        immediately
+    """
+    def __init__(self, frames=1):
+        self.frames = frames
+        self.reset()
+
+    def update(self, label):
+        """
+        Params:
+            label = the label of the frame
+        Output:
+            the label selected
+        """
+        if self.current is None or label==self.current:
+            self.current = label
+            self.candidate = None
+            self.streak = 0
+            return self.current
+
+        if label==self.candidate:
+            self.streak += 1
+        else:
+            self.candidate = label
+            self.streak = 1
+        if self.streak >= self.frames:
+            self.current = label
+            self.candidate = None
+            self.streak = 0
+        return self.current
+
+    def reset(self):
+        self.current = None
+        self.candidate = None
+        self.streak = 0
+
+class EMAFilter:
+    """
+    Exponential moving average of a signal.
+
+    Params:
+        alpha = weight of the new value, from 0 to 1. 1 doesn't filter
+    """
+    def __init__(self, alpha=0.5):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, value, timestamp=None):
+        """
+        Params:
+            value = the value of the frame
+            timestamp = not used, kept so all the filters are called the same way
+        Output:
+            the filtered value
+        """
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha*(value - self.value)
+        return self.value
+
+    def reset(self):
+        self.value = None
+
+class OneEuroFilter:
+    """
+    One Euro filter (Casiez et al., 2012): a low pass filter whose cutoff
+    frequency grows with the speed of the signal, so it removes the jitter
+    when the hand is still without adding lag when it moves.
+
+    Params:
+        min_cutoff = cutoff frequency, in Hz, when the signal is still. Lower
+        values remove more jitter
+        beta = how much the cutoff grows with the speed. Higher values reduce
+        the lag
+        d_cutoff = cutoff frequency of the speed estimate
+        frequency = frames per second assumed when no timestamp is given
+    """
+    def __init__(self, min_cutoff=1.0, beta=0.1, d_cutoff=1.0, frequency=30):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.frequency = frequency
+        self.reset()
+
+    @staticmethod
+    def smoothing_factor(period, cutoff):
+        r = 2*math.pi*cutoff*period
+        return r/(r + 1)
+
+    def update(self, value, timestamp=None):
+        """
+        Params:
+            value = the value of the frame
+            timestamp = the time of the frame, in seconds. If None the frames
+            are assumed to be 1/frequency seconds apart
+        Output:
+            the filtered value
+        """
+        if self.value is None:
+            self.value = value
+            self.timestamp = timestamp
+            return self.value
+
+        period = 1/self.frequency
+        if timestamp is not None and self.timestamp is not None and timestamp > self.timestamp:
+            period = timestamp - self.timestamp
+        self.timestamp = timestamp
+
+        # Filtered speed of the signal
+        speed = (value - self.value)/period
+        self.speed += self.smoothing_factor(period, self.d_cutoff)*(speed - self.speed)
+
+        cutoff = self.min_cutoff + self.beta*abs(self.speed)
+        self.value += self.smoothing_factor(period, cutoff)*(value - self.value)
+        return self.value
+
+    def reset(self):
+        self.value = None
+        self.speed = 0.0
+        self.timestamp = None
+
+class NullFilter:
+    # Gives the values unchanged, used when the smoothing is disabled
+    def update(self, value, *args):
+        return value
+
+    def reset(self):
+        pass
+
+class GestureSmoother:
+    """
+    Vote over the last frames followed by the hysteresis, applied to the
+    labels predicted for one hand.
+
+    Params:
+        vote = MajorityVote, ConfidenceVote or NullFilter
+        hysteresis = Hysteresis or NullFilter
+    """
+    def __init__(self, vote, hysteresis):
+        self.vote = vote
+        self.hysteresis = hysteresis
+
+    def update(self, label, confidence=1):
+        """
+        Params:
+            label = the label predicted in the frame
+            confidence = the probability of the label, used by the ConfidenceVote
+        Output:
+            the label selected
+        """
+        return self.hysteresis.update(self.vote.update(label, confidence))
+
+    def reset(self):
+        # Called when the hand leaves the screen, so it starts over when it returns
+        self.vote.reset()
+        self.hysteresis.reset()
+
+def create_smoothers(args):
+    """
+    Params:
+        args = the output of helpers.get_args
+    Output:
+        (gesture_smoother, pinch_filter)
+            - gesture_smoother -> GestureSmoother of the gesture of the left hand
+            - pinch_filter -> filter of the relative distance between the thumb
+            and index of the right hand
+        With the default arguments both give the values unchanged.
+    """
+    if args.gesture_vote=='majority':
+        vote = MajorityVote(args.vote_window)
+    elif args.gesture_vote=='confidence':
+        vote = ConfidenceVote(args.vote_window)
+    else:
+        vote = NullFilter()
+    hysteresis = Hysteresis(args.gesture_hysteresis) if args.gesture_hysteresis > 1 else NullFilter()
+
+    if args.pinch_filter=='ema':
+        pinch_filter = EMAFilter(args.ema_alpha)
+    elif args.pinch_filter=='one_euro':
+        pinch_filter = OneEuroFilter(args.one_euro_min_cutoff, args.one_euro_beta)
+    else:
+        pinch_filter = NullFilter()
+    return GestureSmoother(vote, hysteresis), pinch_filter
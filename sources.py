@@ -0,0 +1,217 @@
+import os
+from types import SimpleNamespace
+import numpy as np
+import cv2
+
+# Extensions of the files read by the ImageDirectoryCapture
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# Handedness labels and the codes used to store them in the landmark dump
+HANDEDNESS_LABELS = ['Left', 'Right']
+
+class Landmark:
+    """
+    Landmark with the x, y and z attributes of the mediapipe landmarks. The
+    HasField method is used by mp.solutions.drawing_utils.draw_landmarks
+    """
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def HasField(self, name):
+        return False
+
+def build_results(landmarks, handedness, scores=None):
+    """
+    Params:
+        landmarks = array with shape (H, 21, 3) with the normalized coordinates
+        of the H hands of a frame
+        handedness = list with the handedness label ('Left' or 'Right') of each hand
+        scores = list with the handedness score of each hand. If None 1 is used
+    Output:
+        results: object with the same multi_hand_landmarks and multi_handedness
+        attributes of the output of mp.solutions.hands.Hands(...).process(image),
+        so it can be used by the same code that uses the mediapipe output, without
+        importing mediapipe. If there are no hands the attributes are None, as in 
+        mediapipe
+    """
+    results = SimpleNamespace(multi_hand_landmarks=None, multi_handedness=None)
+    if len(landmarks)==0:
+        return results
+
+    results.multi_hand_landmarks = []
+    results.multi_handedness = []
+    for hand_index, hand_landmarks in enumerate(landmarks):
+        label = handedness[hand_index]
+        classification = SimpleNamespace(
+            index = HANDEDNESS_LABELS.index(label),
+            label = label,
+            score = 1 if scores is None else scores[hand_index]
+        )
+        results.multi_hand_landmarks.append(
+            SimpleNamespace(landmark=[Landmark(x, y, z) for x, y, z in hand_landmarks])
+        )
+        results.multi_handedness.append(SimpleNamespace(classification=[classification]))
+    return results
+
+class ImageDirectoryCapture:
+    """
+    Object with the same methods of cv2.VideoCapture used by the scripts,
+    reading the images of a directory in alphabetical order as frames.
+
+    Params:
+        path = the directory with the images
+    """
+    def __init__(self, path):
+        self.paths = [
+            os.path.join(path, file_name) for file_name in sorted(os.listdir(path))
+            if file_name.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        self.position = 0
+        self.shape = cv2.imread(self.paths[0]).shape if self.paths else (0, 0, 3)
+
+    def isOpened(self):
+        return self.position < len(self.paths)
+
+    def read(self):
+        if not self.isOpened():
+            return False, None
+        frame = cv2.imread(self.paths[self.position])
+        self.position += 1
+        return frame is not None, frame
+
+    def get(self, prop):
+        if prop==cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.shape[1])
+        if prop==cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.shape[0])
+        if prop==cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.paths))
+        return 0.0
+
+    def release(self):
+        self.position = len(self.paths)
+
+class LandmarkDumpCapture:
+    """
+    Object with the same methods of cv2.VideoCapture used by the scripts,
+    reading a landmark dump written by the LandmarkDumpWriter. Instead of
+    a frame, the read method returns a results-shaped object (see
+    build_results), so the hand tracking is skipped.
+
+    Params:
+        path = the .npz landmark dump
+    """
+    def __init__(self, path):
+        dump = np.load(path)
+        self.landmarks = dump['landmarks']
+        self.handedness = dump['handedness']
+        self.scores = dump['scores']
+        self.video_width = float(dump['video_width'])
+        self.video_height = float(dump['video_height'])
+        self.position = 0
+
+    def isOpened(self):
+        return self.position < len(self.landmarks)
+
+    def read(self):
+        if not self.isOpened():
+            return False, None
+        # Hands not detected in the frame have the handedness code -1
+        detected = self.handedness[self.position] >= 0
+        results = build_results(
+            self.landmarks[self.position][detected].tolist(),
+            [HANDEDNESS_LABELS[code] for code in self.handedness[self.position][detected]],
+            self.scores[self.position][detected].tolist()
+        )
+        self.position += 1
+        return True, results
+
+    def get(self, prop):
+        if prop==cv2.CAP_PROP_FRAME_WIDTH:
+            return self.video_width
+        if prop==cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.video_height
+        if prop==cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.landmarks))
+        return 0.0
+
+    def release(self):
+        self.position = len(self.landmarks)
+
+class LandmarkDumpWriter:
+    """
+    Keeps the landmarks of every frame processed and writes them to a .npz
+    landmark dump when closed, which can be used later as the --input of
+    apply-model.py to replay the session without a camera.
+
+    Params:
+        path = the .npz file that will be written
+        video_width = the width of the video the landmarks came from
+        video_height = the height of the video the landmarks came from
+        max_num_hands = the maximum number of hands in a frame
+    """
+    def __init__(self, path, video_width, video_height, max_num_hands=2):
+        self.path = path
+        self.video_width = video_width
+        self.video_height = video_height
+        self.max_num_hands = max_num_hands
+        self.landmarks = []
+        self.handedness = []
+        self.scores = []
+
+    def append(self, results):
+        """
+        Params:
+            results = the output of hands.process(image)
+        """
+        landmarks = np.zeros((self.max_num_hands, 21, 3), dtype=np.float32)
+        handedness = np.full(self.max_num_hands, -1, dtype=np.int8)
+        scores = np.zeros(self.max_num_hands, dtype=np.float32)
+        if results.multi_hand_landmarks:
+            for hand_index, hand_landmarks in enumerate(results.multi_hand_landmarks[:self.max_num_hands]):
+                classification = results.multi_handedness[hand_index].classification[0]
+                landmarks[hand_index] = [(coordinates.x, coordinates.y, coordinates.z) for coordinates in hand_landmarks.landmark]
+                handedness[hand_index] = HANDEDNESS_LABELS.index(classification.label)
+                scores[hand_index] = classification.score
+        self.landmarks.append(landmarks)
+        self.handedness.append(handedness)
+        self.scores.append(scores)
+
+    def close(self):
+        np.savez_compressed(
+            self.path,
+            landmarks = np.array(self.landmarks, dtype=np.float32).reshape(-1, self.max_num_hands, 21, 3),
+            handedness = np.array(self.handedness, dtype=np.int8).reshape(-1, self.max_num_hands),
+            scores = np.array(self.scores, dtype=np.float32).reshape(-1, self.max_num_hands),
+            video_width = self.video_width,
+            video_height = self.video_height
+        )
+
+def open_capture(args):
+    """
+    Params:
+        args = the output of helpers.get_args
+    Output:
+        (cap, landmark_input)
+            - cap -> object with the methods of cv2.VideoCapture reading from
+            the webcam (args.device) or from args.input, which can be a video
+            file, a directory of images, a .npz landmark dump or a .session
+            recorded by the session.SessionRecorder
+            - landmark_input -> True if cap reads a landmark dump or a session,
+            meaning that it gives the results of the hand tracking instead of
+            frames
+    """
+    if args.input is None:
+        return cv2.VideoCapture(args.device), False
+    if os.path.isdir(args.input):
+        return ImageDirectoryCapture(args.input), False
+    if args.input.endswith('.npz'):
+        return LandmarkDumpCapture(args.input), True
+    if args.input.endswith('.session'):
+        from session import SessionCapture
+        return SessionCapture(args.input), True
+    return cv2.VideoCapture(args.input), False
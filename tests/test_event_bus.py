@@ -0,0 +1,83 @@
+import gc
+import time
+import pytest
+from event_bus import EventBus, ServoEvent, MemoryBackend, FileBackend
+
+class SlowFile:
+    # File whose writes block, as a slow disk or a full pipe
+    def __init__(self, file, delay):
+        self.file = file
+        self.delay = delay
+
+    def write(self, data):
+        time.sleep(self.delay)
+        return self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+def test_slow_file_backend_does_not_delay_the_others(tmp_path):
+    file_backend = FileBackend(str(tmp_path/'commands.jsonl'))
+    memory_backend = MemoryBackend()
+    bus = EventBus([file_backend, memory_backend], max_age=0)
+    # A full collection of the garbage collector during the burst would hold
+    # the loop longer than the time between two events
+    gc.collect()
+    bus.start()
+    file_backend.file = SlowFile(file_backend.file, 0.2)
+
+    for frame in range(10):
+        bus.publish(ServoEvent('Indicador', 5, float(frame), time.time(), frame))
+        time.sleep(0.01)
+    time.sleep(0.02)
+    # Every event reached the memory backend while the file was still blocked 
+    # in its first write
+    assert [event.frame for event in memory_backend.events]==list(range(10))
+    bus.close()
+
+    memory_consumer = bus.consumers[1]
+    assert max(memory_consumer.latencies) < 0.1
+    # The file kept the first event and the latest one, the others were replaced
+    lines = (tmp_path/'commands.jsonl').read_text().splitlines()
+    assert len(lines)>=2 and '"frame": 9' in lines[-1]
+
+class FailingBackend(MemoryBackend):
+    # Backend whose open or send raise an error that isn't an OSError
+    def __init__(self, fail_open=False):
+        super().__init__()
+        self.name = 'failing'
+        self.fail_open = fail_open
+        self.closed = False
+
+    async def open(self):
+        if self.fail_open:
+            raise ValueError('bad actuator')
+
+    async def send(self, event):
+        raise ValueError('bad event')
+
+    async def close(self):
+        self.closed = True
+
+def test_backends_opened_are_closed_when_another_fails_to_open():
+    opened_backend = FailingBackend()
+    unopened_backend = FailingBackend(fail_open=True)
+    bus = EventBus([opened_backend, unopened_backend])
+    with pytest.raises(ValueError):
+        bus.start()
+    assert opened_backend.closed and not unopened_backend.closed
+
+def test_error_of_a_backend_does_not_stop_its_consumer():
+    failing_backend = FailingBackend()
+    memory_backend = MemoryBackend()
+    bus = EventBus([failing_backend, memory_backend], max_age=0)
+    bus.start()
+    for frame in range(5):
+        bus.publish(ServoEvent('Indicador', 5, float(frame), time.time(), frame))
+        time.sleep(0.01)
+    bus.close()
+
+    failing_consumer = bus.consumers[0]
+    assert failing_consumer.failed==5 and isinstance(failing_consumer.error, ValueError)
+    assert failing_backend.closed
+    assert len(memory_backend.events)==5
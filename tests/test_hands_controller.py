@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+from hands_controller import AdaptiveHands
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class FakeHands:
+    """
+    Hand tracking whose process call takes the time of its complexity in the
+    fake clock and finds the number of hands of the scene.
+    """
+    def __init__(self, scene, model_complexity, **options):
+        self.scene = scene
+        self.complexity = model_complexity
+        self.images = []
+
+    def process(self, image):
+        self.images.append(image)
+        self.scene.clock.now += self.scene.costs[self.complexity]
+        handedness = [
+            SimpleNamespace(classification=[SimpleNamespace(score=0.95)])
+            for _ in range(self.scene.hands)
+        ]
+        return SimpleNamespace(multi_handedness=handedness or None)
+
+    def close(self):
+        pass
+
+def create_scene(costs, hands=1, **params):
+    scene = SimpleNamespace(clock=FakeClock(), costs=dict(costs), hands=hands)
+    mp_hands = SimpleNamespace(Hands=lambda **options: FakeHands(scene, **options))
+    params = dict(dict(target_fps=30, patience=5, retry_interval=1, verbose=False), **params)
+    scene.controller = AdaptiveHands(mp_hands, {'max_num_hands': 2}, clock=scene.clock, **params)
+    return scene
+
+def run(scene, frames, camera_wait=1/30):
+    # The camera wait passes between the calls, as in a webcam bound loop
+    for frame in range(frames):
+        scene.clock.now += camera_wait
+        scene.controller.process(frame)
+
+def test_fast_model_in_a_camera_bound_loop_keeps_complexity_1():
+    scene = create_scene({0: 0.002, 1: 0.004})
+    run(scene, 600)
+    assert scene.controller.complexity==1
+    assert scene.controller.frames[1]==600
+    assert scene.controller.switches==[]
+
+def test_slow_model_switches_to_complexity_0():
+    scene = create_scene({0: 0.015, 1: 0.045})
+    run(scene, 10)
+    assert scene.controller.complexity==0
+    assert len(scene.controller.switches)==1
+
+def test_complexity_1_is_used_again_when_it_fits():
+    scene = create_scene({0: 0.015, 1: 0.045})
+    run(scene, 10)
+    assert scene.controller.complexity==0
+    # The load drops, so the complexity 1 fits the time per frame again
+    scene.costs.update({0: 0.005, 1: 0.012})
+    run(scene, 60)
+    assert scene.controller.complexity==1
+    assert [(old, new) for old, new, _ in scene.controller.switches]==[(1, 0), (0, 1)]
+
+def test_complexity_1_isnt_tried_while_it_wouldnt_fit():
+    scene = create_scene({0: 0.015, 1: 0.045})
+    run(scene, 600)
+    assert scene.controller.complexity==0
+    assert len(scene.controller.switches)==1
+
+def test_new_instance_processes_the_current_frame_on_switch():
+    scene = create_scene({0: 0.015, 1: 0.045})
+    run(scene, 10)
+    # Warmed with the first frame, then given the last frame of the old 
+    # instance before taking over with the next one
+    last_frame = scene.controller.instances[1].images[-1]
+    assert scene.controller.instances[0].images[:3]==[0, last_frame, last_frame + 1]
+
+def test_switch_waits_while_both_hands_are_tracked():
+    scene = create_scene({0: 0.015, 1: 0.040}, hands=2, stable_frames=3)
+    run(scene, 100)
+    assert scene.controller.complexity==1
+    # One hand leaves the view and the detection runs anyway
+    scene.hands = 1
+    run(scene, 2)
+    assert scene.controller.complexity==0
@@ -0,0 +1,14 @@
+from multi_camera import CameraPool
+
+def test_stream_that_fails_to_open_is_reported(tmp_path):
+    # The landmark dumps don't run the hand tracking, so it has no options
+    pool = CameraPool([str(tmp_path/'missing.npz')], None)
+    pool.start()
+    for _ in range(50):
+        if not pool.running:
+            break
+        pool.collect()
+    pool.close()
+
+    assert not pool.running
+    assert 'FileNotFoundError' in pool.errors[0]
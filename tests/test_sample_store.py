@@ -0,0 +1,56 @@
+import time
+import numpy as np
+from sample_store import SampleStore, BurstRecorder
+
+def wait_for(condition, timeout=5):
+    end = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < end, 'timed out'
+        time.sleep(0.01)
+
+def test_saved_sample_reaches_disk_before_close(tmp_path):
+    store = SampleStore(str(tmp_path/'store'))
+    recorder = BurstRecorder(store)
+    recorder.save(3, np.arange(42), flush=True)
+    # Another store of the same directory only sees what is on the disk
+    wait_for(lambda: SampleStore(str(tmp_path/'store')).stored_count()==1)
+    recorder.close()
+
+def test_samples_queued_before_an_exception_are_persisted(tmp_path):
+    store = SampleStore(str(tmp_path/'store'))
+    recorder = BurstRecorder(store)
+    features = np.random.default_rng(0).random((500, 42))
+    try:
+        # The frame loop of the collect-train-data.py fails right after 
+        # recording, with the samples still in the queue and the buffer
+        try:
+            recorder.start(2)
+            for row in features:
+                recorder.next_frame()
+                recorder.offer(row)
+            raise RuntimeError('camera error')
+        finally:
+            recorder.close()
+    except RuntimeError:
+        pass
+
+    stored_features, stored_labels = SampleStore(str(tmp_path/'store')).load()
+    assert len(stored_labels)==500
+    assert np.all(stored_labels==2)
+    np.testing.assert_allclose(stored_features, features.astype(np.float32))
+
+def test_stride_counts_only_frames_with_a_hand(tmp_path):
+    store = SampleStore(str(tmp_path/'store'))
+    recorder = BurstRecorder(store, stride=2)
+    recorder.start(1)
+    saved = []
+    # Every other frame has no hand, which the stride must not count
+    for frame in range(12):
+        recorder.next_frame()
+        if frame%2==0:
+            saved.append(recorder.offer(np.full(42, frame)))
+    recorder.close()
+
+    assert saved==[True, False]*3
+    stored_features = SampleStore(str(tmp_path/'store')).load()[0]
+    np.testing.assert_allclose(stored_features[:, 0], [0, 4, 8])
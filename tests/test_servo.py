@@ -0,0 +1,69 @@
+import time
+from servo import ServoWriter, FakeBoard
+
+def wait_for(condition, timeout=5):
+    end = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < end, 'timed out'
+        time.sleep(0.01)
+
+def written(board):
+    return [(pin, value) for _, pin, value in board.writes]
+
+def test_only_the_latest_angle_of_each_pin_is_written():
+    board = FakeBoard()
+    writer = ServoWriter(board, deadband=0, max_rate=0)
+    # The angles are commanded before the thread starts, so none is written
+    # before the next one of the same pin arrives
+    for angle in (10, 20, 30):
+        writer.command(3, angle)
+    writer.command(5, 40)
+    writer.command(3, 50)
+    writer.start()
+    writer.close()
+
+    assert written(board)==[(5, 40), (3, 50)]
+    assert writer.coalesced==3 and writer.writes==2
+
+def test_angle_inside_the_deadband_of_the_last_written_is_not_written():
+    board = FakeBoard()
+    writer = ServoWriter(board, deadband=5, max_rate=0)
+    writer.start()
+    writer.command(3, 90)
+    wait_for(lambda: writer.writes==1)
+    # Compared to the 90 written, not to the 94 commanded before
+    writer.command(3, 94)
+    writer.command(3, 86)
+    writer.command(3, 96)
+    writer.close()
+
+    assert written(board)==[(3, 90), (3, 96)]
+    assert writer.suppressed==2
+
+def test_each_pin_is_written_at_most_max_rate_times_per_second():
+    board = FakeBoard()
+    writer = ServoWriter(board, deadband=0, max_rate=10)
+    writer.start()
+    writer.command(3, 10)
+    wait_for(lambda: writer.writes==1)
+    writer.command(3, 20)
+    # Another pin isn't held by the rate limit of the pin 3
+    writer.command(5, 30)
+    wait_for(lambda: writer.writes==2)
+    assert written(board)==[(3, 10), (5, 30)]
+    writer.close()
+
+    times = {value: write_time for write_time, _, value in board.writes}
+    assert written(board)==[(3, 10), (5, 30), (3, 20)]
+    assert times[20] - times[10] >= 0.1 - 1e-3
+
+def test_close_writes_the_angles_still_waiting():
+    board = FakeBoard(write_delay=0.02)
+    writer = ServoWriter(board, deadband=0, max_rate=0)
+    writer.start()
+    for pin in range(2, 8):
+        writer.command(pin, 10*pin)
+    writer.close()
+
+    assert not writer.is_alive()
+    assert written(board)==[(pin, 10*pin) for pin in range(2, 8)]
@@ -0,0 +1,25 @@
+import time
+from timing import StartupProfiler
+
+def run_frames(startup, frames):
+    # The same guards of the frame loop of the apply-model.py
+    for _ in range(frames):
+        if not startup.reported:
+            startup.mark('first frame read')
+        if not startup.reported:
+            startup.mark('first hands.process')
+            startup.report()
+
+def test_disabled_profiler_keeps_no_steps():
+    startup = StartupProfiler(time.perf_counter(), enabled=False)
+    startup.mark('get_args')
+    run_frames(startup, 1000)
+    assert startup.reported
+    assert len(startup.steps) == 1
+
+def test_enabled_profiler_stops_marking_after_report(capsys):
+    startup = StartupProfiler(time.perf_counter(), enabled=True)
+    startup.mark('get_args')
+    run_frames(startup, 1000)
+    assert [step for step, _ in startup.steps] == ['start', 'get_args', 'first frame read', 'first hands.process']
+    assert 'first hands.process' in capsys.readouterr().out
@@ -0,0 +1,321 @@
+import gc
+import csv
+import json
+import time
+import tracemalloc
+from collections import deque
+from contextlib import nullcontext
+import numpy as np
+
+class StageTimer:
+    """
+    Context manager that measures how long a stage of the frame loop takes
+    and stores it, in milliseconds, in the timing record of the frame.
+
+    Params:
+        record = the dictionary returned by FrameTimer.start_frame
+        name = the name of the stage
+    """
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = (time.perf_counter() - self.start)*1000
+        # A stage can run more than once in the same frame (one time per hand)
+        self.record[self.name] = self.record.get(self.name, 0) + elapsed
+        return False
+
+class FrameTimer:
+    """
+    Measures the time spent in each stage of the frame loop, keeping the
+    last frames in rolling windows to show the FPS and the p50/p95/p99
+    latency of each stage as an overlay, and optionally streaming the
+    timing of every frame to a csv or json lines file.
+
+    Params:
+        stages = list with the names of the stages that will be measured.
+        It's also the column order of the csv file
+        window = how many frames are kept to compute the FPS and percentiles
+        output_path = path of the file that will receive the timing of every
+        frame. If it ends with .jsonl or .json the json lines format is used,
+        otherwise csv. If None nothing is written
+        hud_refresh = the percentiles shown by the overlay are recomputed
+        every hud_refresh frames
+        show_hud = if False the draw method doesn't draw the overlay
+
+    Usage:
+        record = timer.start_frame()
+        with timer.stage(record, 'read'):
+            ret, frame = cap.read()
+        timer.mark_captured(record)
+        with timer.stage(record, 'hands_process'):
+            results = hands.process(image)
+        timer.finish_frame(record)
+
+    The stage method can be called from any thread, as each frame has its
+    own record, but finish_frame and draw must be called from the same thread.
+    Besides the stages, two values are computed for each frame: the 'total', 
+    which is the time from start_frame to finish_frame, and the 'latency', 
+    which is the time from mark_captured to mark_actuated, or to finish_frame 
+    when mark_actuated isn't called. When marked right after the servo is 
+    written the latency is the glass-to-servo latency of the frame.
+    """
+
+    def __init__(self, stages, window=120, output_path=None, hud_refresh=15, show_hud=True):
+        self.stages = list(stages) + ['latency', 'total']
+        self.window = {stage: deque(maxlen=window) for stage in self.stages}
+        self.frame_times = deque(maxlen=window)
+        self.hud_refresh = hud_refresh
+        self.show_hud = show_hud
+        self.hud_lines = []
+        self.frame_count = 0
+
+        self.output_file = None
+        self.writer = None
+        if output_path is not None:
+            self.json_lines = output_path.endswith(('.jsonl', '.json'))
+            self.output_file = open(output_path, 'w', newline='')
+            if not self.json_lines:
+                self.writer = csv.writer(self.output_file)
+                self.writer.writerow(['frame', 'timestamp'] + self.stages)
+
+    def start_frame(self):
+        """
+        Output:
+            record: dictionary that will receive the time of each stage of
+            the frame
+        """
+        return {'start': time.perf_counter()}
+
+    def stage(self, record, name):
+        return StageTimer(record, name)
+
+    def mark_captured(self, record):
+        # Moment in which the frame was captured, used to compute the latency
+        record['captured'] = time.perf_counter()
+
+    def mark_actuated(self, record):
+        # Moment in which the servo was written. When marked, the latency ends
+        # here instead of in finish_frame
+        record['actuated'] = time.perf_counter()
+
+    def finish_frame(self, record):
+        now = time.perf_counter()
+        record['total'] = (now - record.pop('start'))*1000
+        if 'captured' in record:
+            record['latency'] = (record.pop('actuated', now) - record.pop('captured'))*1000
+        self.frame_times.append(now)
+        for stage in self.stages:
+            if stage in record:
+                self.window[stage].append(record[stage])
+
+        if self.output_file is not None:
+            if self.json_lines:
+                line = {'frame': self.frame_count, 'timestamp': time.time()}
+                line.update(record)
+                self.output_file.write(json.dumps(line)+'\n')
+            else:
+                self.writer.writerow(
+                    [self.frame_count, time.time()] + [record.get(stage, '') for stage in self.stages]
+                )
+
+        if self.show_hud and self.frame_count % self.hud_refresh == 0:
+            self.hud_lines = self.summary_lines()
+        self.frame_count += 1
+
+    def fps(self):
+        if len(self.frame_times) < 2:
+            return 0.0
+        return (len(self.frame_times)-1)/(self.frame_times[-1]-self.frame_times[0])
+
+    def percentiles(self, stage):
+        """
+        Output:
+            (p50, p95, p99) of the stage in milliseconds over the rolling
+            window, or None if the stage wasn't measured yet
+        """
+        if not self.window[stage]:
+            return None
+        return tuple(np.percentile(self.window[stage], [50, 95, 99]))
+
+    def summary_lines(self):
+        lines = [f'FPS: {self.fps():.1f}']
+        for stage in self.stages:
+            stage_percentiles = self.percentiles(stage)
+            if stage_percentiles is not None:
+                p50, p95, p99 = stage_percentiles
+                lines.append(f'{stage}: {p50:.1f} / {p95:.1f} / {p99:.1f} ms')
+        return lines
+
+    def draw(self, image):
+        """
+        Params:
+            image = the image in which the FPS and the p50/p95/p99 latency of
+            each stage will be written
+        Output:
+            image: the image with the overlay
+        """
+        import cv2
+
+        for line_index, line in enumerate(self.hud_lines):
+            image = cv2.putText(
+                img = image,
+                text = line,
+                org = (10, image.shape[0] - 15 - 18*(len(self.hud_lines)-1-line_index)),
+                fontFace = cv2.FONT_HERSHEY_SIMPLEX,
+                fontScale = 0.45,
+                color = (0, 255, 0),
+                thickness = 1,
+                lineType = cv2.LINE_AA
+            )
+        return image
+
+    def close(self):
+        if self.output_file is not None:
+            self.output_file.close()
+
+class NullTimer:
+    """
+    Timer with the same methods of the FrameTimer that does nothing, used
+    when the timing is disabled so the frame loop doesn't need to check it.
+    """
+    null_stage = nullcontext()
+
+    def start_frame(self):
+        return None
+
+    def stage(self, record, name):
+        return self.null_stage
+
+    def mark_captured(self, record):
+        pass
+
+    def mark_actuated(self, record):
+        pass
+
+    def finish_frame(self, record):
+        pass
+
+    def draw(self, image):
+        return image
+
+    def close(self):
+        pass
+
+def create_timer(args, stages):
+    """
+    Params:
+        args = the output of helpers.get_args
+        stages = list with the names of the stages that will be measured
+    Output:
+        timer: a FrameTimer if the overlay or the timing output were enabled
+        by the user, otherwise a NullTimer
+    """
+    if args.timing==1 or args.timing_output is not None:
+        return FrameTimer(
+            stages,
+            window = args.timing_window,
+            output_path = args.timing_output,
+            show_hud = args.timing==1
+        )
+    return NullTimer()
+
+class StartupProfiler:
+    """
+    Keeps the moment in which each step of the startup of a script finished,
+    to print how long each of them took (imports, model loading, opening the
+    webcam, creating the hand tracking and processing the first frame).
+
+    Params:
+        start = time.perf_counter() at the beginning of the script, before
+        the imports
+        enabled = if False the report isn't printed
+    """
+    def __init__(self, start, enabled=True):
+        self.steps = [('start', start)]
+        self.enabled = enabled
+        self.reported = False
+
+    def mark(self, step):
+        # Called right after the step finished. Nothing is kept when the 
+        # profiling is disabled or already reported, as the frame loop marks 
+        # the first frame until the report
+        if not self.enabled or self.reported:
+            return
+        self.steps.append((step, time.perf_counter()))
+
+    def report(self):
+        # Prints the duration of each step only once, when the profiling is 
+        # enabled. It's marked as reported either way, so the frame loop stops 
+        # marking the first frame
+        if self.reported:
+            return
+        self.reported = True
+        if not self.enabled:
+            return
+        print(f'{"startup step":<28}{"duration":>12}{"elapsed":>12}')
+        for (_, previous_time), (step, step_time) in zip(self.steps, self.steps[1:]):
+            print(f'{step:<28}{(step_time-previous_time)*1000:>10.1f}ms{(step_time-self.steps[0][1])*1000:>10.1f}ms')
+
+class AllocationProfiler:
+    """
+    Measures with tracemalloc the memory allocated by the frame loop in each
+    frame: the peak of the memory traced above the one at the beginning of
+    the frame, which counts the temporary arrays freed before the frame ends,
+    the memory kept at the end of the frame and the collections of the
+    garbage collector. The first frames, in which the buffers are allocated,
+    are ignored. Tracing every allocation slows the frame loop down, so it's
+    meant to compare options, e.g. with and without --reuse_buffers.
+
+    Params:
+        warmup = number of frames ignored at the beginning
+
+    Usage:
+        profiler = AllocationProfiler()
+        while cap.isOpened():
+            profiler.frame()
+            ...
+        print(profiler.summary())
+    """
+    def __init__(self, warmup=30):
+        self.warmup = warmup
+        self.frames = 0
+        self.frame_start = None
+        self.peaks = []
+        self.retained = []
+        self.collections = 0
+        gc.callbacks.append(self.count_collection)
+        tracemalloc.start()
+
+    def count_collection(self, phase, info):
+        if phase=='start' and self.frames > self.warmup:
+            self.collections += 1
+
+    def frame(self):
+        # Called once per frame, always at the same point of the loop. It 
+        # closes the previous frame and opens the next one
+        current, peak = tracemalloc.get_traced_memory()
+        if self.frame_start is not None and self.frames > self.warmup:
+            self.peaks.append(peak - self.frame_start)
+            self.retained.append(current - self.frame_start)
+        self.frames += 1
+        tracemalloc.reset_peak()
+        self.frame_start = current
+
+    def summary(self):
+        tracemalloc.stop()
+        if not self.peaks:
+            return f'Allocations: less than {self.warmup} frames traced'
+        peaks = np.array(self.peaks)/1024
+        p50, p99 = np.percentile(peaks, [50, 99])
+        return (
+            f'Allocations per frame over {len(self.peaks)} frames: '
+            f'{peaks.mean():.1f} KiB mean, p50 {p50:.1f} / p99 {p99:.1f} KiB peak, '
+            f'{np.mean(self.retained)/1024:.2f} KiB kept, '
+            f'{self.collections*100/len(self.peaks):.1f} gc collections per 100 frames'
+        )
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import joblib
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.neural_network import MLPClassifier
+from sample_store import load_training_data
+from classifier import NumpyMLPClassifier, export_classifier
+
+# Trains the gesture classifier from the command line, replacing the manual run 
+# of the model-training.ipynb. Each combination of hidden layers and solver is 
+# cross validated in parallel, using all the cores by default, and its latency 
+# to predict one sample is measured. The candidates on the accuracy/latency 
+# Pareto front are marked and the chosen one is saved without compression, 
+# together with the .npz used by the apply-model.py. E.g. of usage:
+# $ python train-model.py
+# $ python train-model.py --hidden_layers "20,15,13,10,8;32,16" --solvers adam,lbfgs
+# $ python train-model.py --max_latency 40 --report model/report.json
+
+def parse_hidden_layers(text):
+    """
+    Params:
+        text = the sizes of the hidden layers of each architecture, with the
+        layers separated by commas and the architectures by semicolons, 
+        e.g. "20,15,13,10,8;32,16"
+    Output:
+        list with a tuple of layer sizes for each architecture
+    """
+    return [tuple(int(size) for size in layers.split(',')) for layers in text.split(';') if layers.strip()]
+
+def build_classifier(hidden_layer_sizes, solver, max_iter, seed):
+    # Same parameters of the model-training.ipynb, except the architecture and solver
+    return MLPClassifier(
+        hidden_layer_sizes = hidden_layer_sizes,
+        activation = 'relu',
+        solver = solver,
+        learning_rate = 'constant',
+        tol = 0.000001,
+        max_iter = max_iter,
+        random_state = seed
+    )
+
+def fit(clf, X, y, train_index, test_index=None):
+    """
+    Params:
+        clf = the classifier, cloned before fitting
+        X, y = the features and labels
+        train_index = index of the samples used to fit
+        test_index = index of the samples used to score. If None the classifier 
+        fitted is returned instead of its accuracy
+    Output:
+        the accuracy on the test samples or the fitted classifier
+    """
+    import warnings
+    from sklearn.exceptions import ConvergenceWarning
+
+    clf = clone(clf)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        clf.fit(X[train_index], y[train_index])
+    if test_index is None:
+        return clf
+    return clf.score(X[test_index], y[test_index])
+
+def measure_latency(clf, X, repeats=2000):
+    """
+    Params:
+        clf = the fitted sklearn MLPClassifier
+        X = samples used as input, one at a time as in the apply-model.py
+        repeats = number of predictions measured
+    Output:
+        the median latency, in microseconds, to predict one sample with the 
+        numpy runtime used by the apply-model.py
+    """
+    runtime = NumpyMLPClassifier.from_sklearn(clf)
+    samples = np.empty(repeats)
+    for index in range(repeats):
+        sample = X[index%len(X)].reshape(1, -1)
+        start = time.perf_counter_ns()
+        runtime.predict(sample)
+        samples[index] = time.perf_counter_ns() - start
+    return float(np.median(samples))/1000
+
+def pareto_front(candidates):
+    """
+    Params:
+        candidates = list of dictionaries with the 'accuracy' and 'latency_us'
+    Output:
+        set with the index of the candidates that no other candidate beats in 
+        both accuracy and latency
+    """
+    front = set()
+    for index, candidate in enumerate(candidates):
+        dominated = any(
+            other['accuracy'] >= candidate['accuracy'] and other['latency_us'] <= candidate['latency_us']
+            and (other['accuracy'] > candidate['accuracy'] or other['latency_us'] < candidate['latency_us'])
+            for other in candidates
+        )
+        if not dominated:
+            front.add(index)
+    return front
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--data", type=str, default='data/training-data')
+parser.add_argument("--output", type=str, default='model/clf.pkl')
+parser.add_argument("--hidden_layers", type=str, default='20,15,13,10,8;64,32;32,16;32;16')
+parser.add_argument("--solvers", type=str, default='sgd,adam,lbfgs')
+parser.add_argument("--folds", type=int, default=5)
+parser.add_argument("--jobs", type=int, default=-1)
+parser.add_argument("--max_iter", type=int, default=10000)
+parser.add_argument("--max_latency", type=float, default=None)
+parser.add_argument("--test_size", type=float, default=0.2)
+parser.add_argument("--seed", type=int, default=2)
+parser.add_argument("--report", type=str, default=None)
+args = parser.parse_args()
+
+# The features and labels, from the sample store or a csv with the layout of 
+# the data/training-data.csv
+X, y = load_training_data(args.data)
+X = np.asarray(X, dtype=np.float64)
+y = np.asarray(y)
+print(f'{len(y)} samples with {X.shape[1]} features loaded from {args.data}')
+
+# The test samples are only used to evaluate the chosen model, as in the notebook
+X_train, X_test, y_train, y_test = train_test_split(X, y, random_state=args.seed, test_size=args.test_size)
+
+candidates = [
+    {'hidden_layer_sizes': hidden_layer_sizes, 'solver': solver}
+    for hidden_layer_sizes in parse_hidden_layers(args.hidden_layers)
+    for solver in args.solvers.split(',')
+]
+classifiers = [
+    build_classifier(candidate['hidden_layer_sizes'], candidate['solver'], args.max_iter, args.seed)
+    for candidate in candidates
+]
+
+# Every fold of every candidate and the final fit of each candidate on all the 
+# training samples are independent, so they all run in the same pool of workers
+folds = list(StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=args.seed).split(X_train, y_train))
+all_index = np.arange(len(y_train))
+start = time.perf_counter()
+outputs = Parallel(n_jobs=args.jobs)(
+    [delayed(fit)(clf, X_train, y_train, train_index, test_index) for clf in classifiers for train_index, test_index in folds]
+    + [delayed(fit)(clf, X_train, y_train, all_index) for clf in classifiers]
+)
+print(f'{len(candidates)} candidates cross validated in {time.perf_counter()-start:.1f}s')
+
+scores = np.array(outputs[:len(candidates)*len(folds)]).reshape(len(candidates), len(folds))
+fitted_classifiers = outputs[len(candidates)*len(folds):]
+
+# The latency is measured in this process, one candidate at a time, so the 
+# candidates don't compete for the cores while being measured
+for candidate, candidate_scores, clf in zip(candidates, scores, fitted_classifiers):
+    candidate['accuracy'] = float(candidate_scores.mean())
+    candidate['accuracy_std'] = float(candidate_scores.std())
+    candidate['latency_us'] = measure_latency(clf, X_train)
+    candidate['iterations'] = int(clf.n_iter_)
+front = pareto_front(candidates)
+
+# The most accurate model on the Pareto front within the latency limit, 
+# choosing the fastest in a tie
+allowed = [
+    index for index in front
+    if args.max_latency is None or candidates[index]['latency_us'] <= args.max_latency
+]
+if not allowed:
+    raise SystemExit(f'No candidate predicts within {args.max_latency}us')
+chosen = max(allowed, key=lambda index: (candidates[index]['accuracy'], -candidates[index]['latency_us']))
+
+print(f'{"hidden layers":<20}{"solver":<8}{"accuracy":>16}{"latency (us)":>14}{"iterations":>12}')
+for index, candidate in sorted(enumerate(candidates), key=lambda item: item[1]['latency_us']):
+    mark = '*' if index==chosen else ('P' if index in front else ' ')
+    print(
+        f'{mark} {",".join(map(str, candidate["hidden_layer_sizes"])):<18}{candidate["solver"]:<8}'
+        f'{candidate["accuracy"]:>9.3f} ±{candidate["accuracy_std"]:.3f}{candidate["latency_us"]:>14.1f}{candidate["iterations"]:>12}'
+    )
+print('P: Pareto front, *: chosen model')
+
+clf = fitted_classifiers[chosen]
+test_accuracy = clf.score(X_test, y_test)
+print(f'Chosen model test accuracy: {test_accuracy:.3f}')
+
+# Saving without compression, so loading the pickle doesn't decompress it, 
+# and exporting the .npz loaded by the apply-model.py
+output_folder = os.path.dirname(args.output)
+if output_folder and not os.path.exists(output_folder):
+    os.makedirs(output_folder)
+joblib.dump(clf, args.output, compress=0)
+numpy_output = os.path.splitext(args.output)[0] + '.npz'
+export_classifier(clf, numpy_output)
+print(f'Model saved to {args.output} and {numpy_output}')
+
+if args.report is not None:
+    with open(args.report, 'w') as file:
+        json.dump({
+            'data': args.data,
+            'candidates': [dict(candidate, hidden_layer_sizes=list(candidate['hidden_layer_sizes']), pareto=index in front) for index, candidate in enumerate(candidates)],
+            'chosen': chosen,
+            'test_accuracy': test_accuracy
+        }, file, indent=2)